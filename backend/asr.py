@@ -0,0 +1,361 @@
+import abc
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import librosa
+import numpy as np
+import speech_recognition as sr
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# Локальные движки получают сигнал частями и между частями проверяют
+# срок распознавания: вызов нельзя прервать, но можно не продолжать
+VOSK_CHUNK_SECONDS = 0.5
+SPHINX_CHUNK_SECONDS = 5.0
+
+
+class SpeechNotRecognized(Exception):
+    pass
+
+
+def check_deadline(deadline: float) -> None:
+    if time.monotonic() > deadline:
+        raise TimeoutError("Speech recognition timed out")
+
+
+def split_quiet(
+    audio_data: np.ndarray, sample_rate: int, max_seconds: float
+) -> List[np.ndarray]:
+    """
+    Части сигнала не длиннее max_seconds. Граница выбирается по самому
+    тихому кадру 20 мс в последней секунде части, чтобы не резать слова
+    """
+    frame = int(0.02 * sample_rate)
+    limit = int(max_seconds * sample_rate)
+    parts = []
+    while len(audio_data) > limit:
+        tail = audio_data[limit - sample_rate : limit]
+        energy = np.square(tail[: len(tail) // frame * frame]).reshape(-1, frame)
+        cut = limit - sample_rate + int(np.argmin(energy.sum(axis=1))) * frame
+        parts.append(audio_data[:cut])
+        audio_data = audio_data[cut:]
+    return [*parts, audio_data]
+
+
+def to_pcm16(audio_data: np.ndarray) -> bytes:
+    """
+    Преобразование float32 сигнала в 16-битный PCM
+    """
+    pcm = np.clip(audio_data, -1.0, 1.0) * 32767.0
+    return pcm.astype("<i2").tobytes()
+
+
+class ASRBackend(abc.ABC):
+    """
+    Базовый класс движка распознавания речи. Движок один раз загружает
+    модель в load(), а create_recognizer() создаёт экземпляры для пула.
+    recognize() должен завершиться к deadline (time.monotonic()),
+    иначе TimeoutError
+    """
+
+    name = "base"
+    sample_rate: Optional[int] = None
+
+    def load(self) -> None:
+        pass
+
+    def create_recognizer(self) -> Any:
+        return None
+
+    @abc.abstractmethod
+    def recognize(
+        self,
+        recognizer: Any,
+        audio_data: np.ndarray,
+        sample_rate: int,
+        language: str,
+        deadline: float,
+    ) -> str:
+        pass
+
+
+class GoogleBackend(ASRBackend):
+    """
+    Google Web Speech API, требует доступа в интернет
+    """
+
+    name = "google"
+
+    def create_recognizer(self) -> sr.Recognizer:
+        recognizer = sr.Recognizer()
+        recognizer.operation_timeout = config.ASR_TIMEOUT_SECONDS
+        return recognizer
+
+    def recognize(self, recognizer, audio_data, sample_rate, language, deadline):
+        audio = sr.AudioData(to_pcm16(audio_data), sample_rate, 2)
+        check_deadline(deadline)
+        recognizer.operation_timeout = deadline - time.monotonic()
+        try:
+            return recognizer.recognize_google(audio, language=language)
+        except sr.UnknownValueError:
+            raise SpeechNotRecognized()
+
+
+class SphinxBackend(ASRBackend):
+    """
+    CMU Sphinx через pocketsphinx, работает без сети
+    """
+
+    name = "sphinx"
+    sample_rate = 16000
+
+    def load(self) -> None:
+        import pocketsphinx  # noqa: F401
+
+    def create_recognizer(self) -> sr.Recognizer:
+        return sr.Recognizer()
+
+    def recognize(self, recognizer, audio_data, sample_rate, language, deadline):
+        texts = []
+        for part in split_quiet(audio_data, sample_rate, SPHINX_CHUNK_SECONDS):
+            check_deadline(deadline)
+            audio = sr.AudioData(to_pcm16(part), sample_rate, 2)
+            try:
+                texts.append(recognizer.recognize_sphinx(audio, language=language))
+            except sr.UnknownValueError:
+                continue
+        if not texts:
+            raise SpeechNotRecognized()
+        return " ".join(texts)
+
+
+class VoskBackend(ASRBackend):
+    """
+    Локальная модель Vosk (Kaldi). Модель загружается один раз,
+    распознаватели в пуле разделяют её веса
+    """
+
+    name = "vosk"
+    sample_rate = 16000
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self) -> None:
+        import vosk
+
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(self.model_path)
+
+    def create_recognizer(self):
+        import vosk
+
+        return vosk.KaldiRecognizer(self.model, self.sample_rate)
+
+    def recognize(self, recognizer, audio_data, sample_rate, language, deadline):
+        pcm = to_pcm16(audio_data)
+        step = int(VOSK_CHUNK_SECONDS * sample_rate) * 2
+        try:
+            for start in range(0, len(pcm), step):
+                check_deadline(deadline)
+                recognizer.AcceptWaveform(pcm[start : start + step])
+            text = json.loads(recognizer.FinalResult()).get("text", "")
+        finally:
+            recognizer.Reset()
+        if not text:
+            raise SpeechNotRecognized()
+        return text
+
+
+class WhisperBackend(ASRBackend):
+    """
+    Локальная модель whisper через faster-whisper (CTranslate2).
+    Модель потокобезопасна, поэтому пул выдаёт один и тот же экземпляр
+    """
+
+    name = "whisper"
+    sample_rate = 16000
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self) -> None:
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(
+            self.model_path,
+            device="cpu",
+            compute_type="int8",
+            num_workers=config.ASR_POOL_SIZE,
+        )
+
+    def create_recognizer(self):
+        return self.model
+
+    def recognize(self, recognizer, audio_data, sample_rate, language, deadline):
+        # Сегменты декодируются по мере перебора
+        segments, _ = recognizer.transcribe(
+            audio_data, language=language.split("-")[0], beam_size=1
+        )
+        texts = []
+        for segment in segments:
+            texts.append(segment.text.strip())
+            check_deadline(deadline)
+        text = " ".join(texts)
+        if not text:
+            raise SpeechNotRecognized()
+        return text
+
+
+class StubBackend(ASRBackend):
+    """
+    Заглушка для тестов и нагрузочных прогонов: всегда возвращает
+    заданный текст, при latency > 0 после задержки как у сетевого движка
+    """
+
+    name = "stub"
+
+    def __init__(self, text: str, latency: float = 0.0):
+        self.text = text
+        self.latency = latency
+
+    def recognize(self, recognizer, audio_data, sample_rate, language, deadline):
+        if self.latency > 0:
+            time.sleep(min(self.latency, max(deadline - time.monotonic(), 0)))
+            check_deadline(deadline)
+        return self.text
+
+
+def create_backend(name: str) -> ASRBackend:
+    if name == "google":
+        return GoogleBackend()
+    if name == "sphinx":
+        return SphinxBackend()
+    if name == "vosk":
+        return VoskBackend(config.ASR_MODEL_PATH)
+    if name == "whisper":
+        return WhisperBackend(config.ASR_MODEL_PATH)
+    if name == "stub":
+        return StubBackend(config.ASR_STUB_TEXT, config.ASR_STUB_LATENCY_SECONDS)
+    raise ValueError(f"Unknown ASR backend: {name}")
+
+
+class ASREngine:
+    """
+    Распознавание речи выбранным движком с пулом прогретых
+    распознавателей и статистикой задержки и realtime-фактора
+    """
+
+    def __init__(
+        self,
+        backend: ASRBackend,
+        pool_size: int = config.ASR_POOL_SIZE,
+        timeout: float = config.ASR_TIMEOUT_SECONDS,
+    ):
+        self.backend = backend
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        # Распознавание идёт в нескольких потоках пула распознавания
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.total_audio_seconds = 0.0
+        self.last_realtime_factor = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                return
+            started = time.perf_counter()
+            self.backend.load()
+            pool = queue.Queue()
+            for _ in range(self.pool_size):
+                pool.put(self.backend.create_recognizer())
+            self._pool = pool
+        logger.info(
+            f"ASR backend {self.backend.name} loaded with {self.pool_size} "
+            f"recognizers in {time.perf_counter() - started:.2f}s"
+        )
+
+    @contextmanager
+    def _recognizer(self, deadline: float):
+        if self._pool is None:
+            self.start()
+        try:
+            recognizer = self._pool.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            raise TimeoutError("No free speech recognizer")
+        try:
+            yield recognizer
+        finally:
+            self._pool.put(recognizer)
+
+    def transcribe(
+        self, request_id: str, audio_data: np.ndarray, sample_rate: int, language: str
+    ) -> str:
+        target_rate = self.backend.sample_rate or sample_rate
+        if target_rate != sample_rate:
+            audio_data = librosa.resample(
+                audio_data, orig_sr=sample_rate, target_sr=target_rate
+            )
+
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        try:
+            with self._recognizer(deadline) as recognizer:
+                return self.backend.recognize(
+                    recognizer, audio_data, target_rate, language, deadline
+                )
+        except SpeechNotRecognized:
+            raise
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            audio_seconds = len(audio_data) / target_rate
+            with self._stats_lock:
+                self.calls += 1
+                self.total_latency += latency
+                self.total_audio_seconds += audio_seconds
+                if audio_seconds > 0:
+                    self.last_realtime_factor = latency / audio_seconds
+            logger.debug(
+                f"{request_id}: ASR {self.backend.name} took {latency:.3f}s "
+                f"for {audio_seconds:.2f}s of audio"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "backend": self.backend.name,
+                "pool_size": self.pool_size,
+                "calls": self.calls,
+                "errors": self.errors,
+                "mean_latency_seconds": (
+                    self.total_latency / self.calls if self.calls else 0.0
+                ),
+                "realtime_factor": (
+                    self.total_latency / self.total_audio_seconds
+                    if self.total_audio_seconds
+                    else 0.0
+                ),
+                "last_realtime_factor": self.last_realtime_factor,
+            }
+
+
+asr_engine = ASREngine(create_backend(config.ASR_BACKEND))
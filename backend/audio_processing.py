@@ -1,12 +1,18 @@
-import os
+import io
+from typing import BinaryIO, Iterable, Optional, Tuple, Union
+
 import librosa
 import numpy as np
-import pandas as pd
+import soundfile as sf
 import speech_recognition as sr
+from pydub import AudioSegment
+import config
+from asr import SpeechNotRecognized, asr_engine
+from features import MFCCAccumulator, MFCCExtractor
 from logger import get_logger
+from metrics import stage, timed
 
 logger = get_logger(__name__)
-FILES_DIR = os.path.join(os.path.dirname(__file__), "files")
 
 
 class AudioProcessor:
@@ -17,18 +23,76 @@ class AudioProcessor:
     def __init__(self):
         self.SAMPLE_RATE = 22050
         self.DURATION = 10
+        self.feature_extractor = MFCCExtractor(sample_rate=self.SAMPLE_RATE)
         logger.info(
             f"AudioProcessor initialized with sample rate: {self.SAMPLE_RATE}, duration: {self.DURATION}",
         )
 
-    def check_audio_duration(self, request_id: str, audio_path: str):
+    def __reduce__(self):
+        # В пул процессов передаётся ссылка на экземпляр модуля, а не копия
+        # с буферами и закэшированными фильтрами
+        return (_get_audio_processor, ())
+
+    def probe_duration(
+        self, request_id: str, source: Union[bytes, str]
+    ) -> Optional[float]:
+        """
+        Длительность аудио по заголовку файла без декодирования. source -
+        содержимое или путь к файлу. Возвращает None, если формат
+        не читается libsndfile
+        """
+        try:
+            info = sf.info(_open_source(source))
+        except Exception:
+            logger.debug(f"{request_id}: Audio header is not readable by libsndfile")
+            return None
+        return info.frames / info.samplerate
+
+    @timed("decode")
+    def decode_audio(
+        self, request_id: str, source: Union[bytes, str]
+    ) -> Tuple[np.ndarray, float]:
+        """
+        Декодирование аудио из памяти или файла (source - содержимое или
+        путь) в моно float32 с частотой SAMPLE_RATE. Возвращает сигнал
+        и исходную длительность в секундах
+        """
+        logger.debug(f"{request_id}: Decoding audio")
+        try:
+            audio_data, orig_sr = sf.read(
+                _open_source(source), dtype="float32", always_2d=True
+            )
+            audio_data = audio_data.mean(axis=1)
+        except Exception:
+            # Форматы, которые не читает libsndfile (mp3, m4a, ...), декодируем
+            # через ffmpeg, не сохраняя промежуточных файлов на диск
+            try:
+                with stage("ffmpeg"):
+                    audio_seg = AudioSegment.from_file(_open_source(source))
+            except Exception as e:
+                logger.error(f"{request_id}: Error decoding audio: {str(e)}")
+                raise
+            orig_sr = audio_seg.frame_rate
+            samples = np.array(audio_seg.get_array_of_samples(), dtype=np.float32)
+            samples /= float(1 << (8 * audio_seg.sample_width - 1))
+            audio_data = samples.reshape(-1, audio_seg.channels).mean(axis=1)
+
+        duration = len(audio_data) / orig_sr
+        if orig_sr != self.SAMPLE_RATE:
+            audio_data = librosa.resample(
+                audio_data, orig_sr=orig_sr, target_sr=self.SAMPLE_RATE
+            )
+        audio_data = np.ascontiguousarray(audio_data, dtype=np.float32)
+        logger.debug(f"{request_id}: Decoded {duration:.2f}s of audio")
+        return audio_data, duration
+
+    def check_audio_duration(self, request_id: str, audio_data: np.ndarray):
         """
-        Проверка длительности аудиофайла
+        Проверка длительности декодированного аудио
         """
         logger.debug(f"{request_id}: Checking duration of audio")
         try:
-            audio_data, sr = librosa.load(audio_path, sr=None)
-            duration = librosa.get_duration(y=audio_data, sr=sr)
+            duration = len(audio_data) / self.SAMPLE_RATE
 
             is_valid = duration <= self.DURATION
 
@@ -44,64 +108,50 @@ class AudioProcessor:
             logger.error(f"{request_id}: Error checking audio duration: {str(e)}")
             raise
 
-    def extract_features(self, request_id: str, audio_path: str):
+    @timed("extract_features")
+    def extract_features(self, request_id: str, audio_data: np.ndarray) -> np.ndarray:
         """
-        Извлечение MFCC признаков
+        Извлечение MFCC признаков, матрица формы (1, 26)
         """
         logger.debug(f"{request_id}: Extracting features")
         try:
-            audio_data, sr = librosa.load(audio_path, sr=self.SAMPLE_RATE)
-            mfcc = librosa.feature.mfcc(
-                y=audio_data,
-                sr=sr,
-                n_mfcc=13,
-                n_fft=min(2048, len(audio_data)),
-                hop_length=min(512, len(audio_data) // 4),
-            )
-
-            width = min(9, mfcc.shape[1])
-            if width % 2 == 0:
-                width -= 1
-            width = max(width, 1)
-
-            mfcc_delta = librosa.feature.delta(mfcc, order=1, width=width)
-
-            def agg(x):
-                return np.mean(x, axis=1)
-
-            features = np.hstack(
-                [
-                    agg(mfcc),
-                    agg(mfcc_delta),
-                ]
-            )
-            features = features.reshape(1, -1)
-            feats = pd.DataFrame(features, columns=[f"mfcc_{i}" for i in range(1, 27)])
-            return feats
+            features = self.feature_extractor.extract(audio_data)
+            return features.reshape(1, -1)
         except Exception as e:
             logger.error(f"{request_id}: Error extracting features: {str(e)}")
             raise
 
+    @timed("extract_features_stream")
+    def extract_features_stream(
+        self, request_id: str, blocks: Iterable[np.ndarray]
+    ) -> np.ndarray:
+        """
+        Признаки (1, 26) по блокам сигнала с частотой SAMPLE_RATE
+        (поток, файл через memmap), без загрузки сигнала целиком
+        """
+        logger.debug(f"{request_id}: Extracting features from stream")
+        accumulator = MFCCAccumulator(self.feature_extractor)
+        for block in blocks:
+            accumulator.update(block)
+        return accumulator.finalize().reshape(1, -1)
+
+    @timed("transcribe")
     def transcribe_audio(
-        self, request_id: str, audio_path: str, language="ru-RU", use_google=True
+        self, request_id: str, audio_data: np.ndarray, language=config.ASR_LANGUAGE
     ):
         logger.info(f"{request_id}: Transcribing audio with language: {language}")
         try:
-            recognizer = sr.Recognizer()
-            with sr.AudioFile(audio_path) as source:
-                audio_data = recognizer.record(source)
-
             try:
-                if use_google:
-                    text = recognizer.recognize_google(audio_data, language=language)
-                else:
-                    text = recognizer.recognize_sphinx(audio_data, language="ru-RU")
+                text = asr_engine.transcribe(
+                    request_id, audio_data, self.SAMPLE_RATE, language
+                )
                 logger.debug(f"{request_id}: Transcription successful: {text[:30]}...")
-            except sr.UnknownValueError:
+            except SpeechNotRecognized:
                 text = "неизвестная речь"
                 logger.warning(f"{request_id}: Speech not recognized")
             except sr.RequestError as e:
                 logger.error(f"{request_id}: Speech recognition error: {e}")
+                raise
 
             return text.strip()
         except Exception as e:
@@ -109,4 +159,13 @@ class AudioProcessor:
             raise
 
 
+def _open_source(source: Union[bytes, str]) -> Union[BinaryIO, str]:
+    # Путь передаётся как есть: libsndfile и ffmpeg читают файл сами
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _get_audio_processor() -> AudioProcessor:
+    return audio_processor
+
+
 audio_processor = AudioProcessor()
@@ -0,0 +1,193 @@
+import asyncio
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+from fastapi import HTTPException
+
+import config
+from executors import worker_pool
+from logger import get_logger
+from metrics import observe
+from models import predict_voice_batch
+from registry import ModelSpec
+from text_processing import predict_sentiment_batch
+
+logger = get_logger(__name__)
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные запросы к модели в пачку (до max_batch_size
+    элементов или max_wait_ms миллисекунд), выполняет один вызов модели
+    на собранных входах и раздаёт результаты ожидающим корутинам
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable,
+        collate: Callable = None,
+        max_batch_size: int = config.BATCH_MAX_SIZE,
+        max_wait_ms: float = config.BATCH_MAX_WAIT_MS,
+        max_queue: int = config.BATCH_MAX_QUEUE,
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.collate = collate or _stack_features
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.last_batch_size = 0
+        self.total_wait_ms = 0.0
+        self.max_observed_wait_ms = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if self._collector is None or self._collector.done():
+            if self._collector is not None and not self._collector.cancelled():
+                logger.error(
+                    f"{self.name}: Batch collector died: "
+                    f"{self._collector.exception()!r}, restarting"
+                )
+            # Очередь сохраняется: запросы, ждущие в ней, заберёт новый сборщик
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        # Очередь привязана к циклу событий, новый запуск создаёт свою
+        if self._queue is not None:
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            _fail(pending, f"{self.name} batcher stopped")
+            self._queue = None
+
+    async def submit(self, request_id: str, item: Any) -> Any:
+        """
+        Поставить элемент (вектор признаков или текст) в очередь
+        и дождаться предсказания
+        """
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self._queue.put_nowait((request_id, item, future, loop.time()))
+        except asyncio.QueueFull:
+            logger.warning(f"{request_id}: {self.name} batch queue is full")
+            raise HTTPException(
+                status_code=503,
+                detail="Server is overloaded, try again later",
+                headers={"Retry-After": str(worker_pool.retry_after)},
+            )
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        max_wait = self.max_wait_ms / 1000
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + max_wait
+            try:
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException as e:
+                # Уже вынутые из очереди запросы больше никто не обработает
+                _fail(batch, f"{self.name} batch collector failed: {e!r}")
+                raise
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[tuple]) -> None:
+        loop = asyncio.get_running_loop()
+        request_ids = [item[0] for item in batch]
+        futures = [item[2] for item in batch]
+
+        started = loop.time()
+        waits = [(started - item[3]) * 1000 for item in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.last_batch_size = len(batch)
+        self.total_wait_ms += sum(waits)
+        self.max_observed_wait_ms = max(self.max_observed_wait_ms, *waits)
+        if config.METRICS_ENABLED:
+            for wait in waits:
+                observe(f"batch_wait_{self.name}", wait / 1000)
+        logger.debug(f"{self.name}: Running batch of {len(batch)} items")
+
+        try:
+            inputs = self.collate([item[1] for item in batch])
+            results = await worker_pool.run_cpu(self.batch_fn, request_ids, inputs)
+        except Exception as e:
+            logger.error(f"{self.name}: Error during batch prediction: {e}")
+            results = [{"error": str(e)} for _ in batch]
+
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "last_batch_size": self.last_batch_size,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "mean_wait_ms": self.total_wait_ms / self.items if self.items else 0.0,
+            "max_wait_ms": self.max_observed_wait_ms,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms_limit": self.max_wait_ms,
+        }
+
+
+def _fail(batch: List[tuple], error: str) -> None:
+    for item in batch:
+        if not item[2].done():
+            item[2].set_result({"error": error})
+
+
+def _stack_features(items: List[np.ndarray]) -> np.ndarray:
+    return np.vstack(items).astype(np.float32)
+
+
+# Пачка собирается отдельно для каждой версии модели: версии могут
+# обслуживаться одновременно (канарейка, теневой трафик)
+voice_batchers: Dict[str, MicroBatcher] = {}
+
+
+def voice_batcher(spec: ModelSpec) -> MicroBatcher:
+    batcher = voice_batchers.get(spec.key)
+    if batcher is None:
+        batcher = MicroBatcher(spec.key, partial(predict_voice_batch, spec))
+        voice_batchers[spec.key] = batcher
+    return batcher
+
+
+sentiment_batcher = MicroBatcher("sentiment", predict_sentiment_batch, collate=list)
+
+
+async def stop_batchers() -> None:
+    for batcher in (*voice_batchers.values(), sentiment_batcher):
+        await batcher.stop()
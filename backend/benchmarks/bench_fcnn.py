@@ -0,0 +1,62 @@
+"""
+Замер задержки сред выполнения EmotionFCNN для пачек от 1 до 1024.
+Совпадение с чекпоинтом fcnn_model.pth проверяет tests/test_fcnn.py.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_fcnn
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_features import SAMPLE_RATE, make_signal
+from fcnn_runtime import RUNTIMES, load_checkpoint, load_runtime
+from features import MFCCExtractor
+
+
+def make_features(rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    Признаки реальных по форме сигналов разной громкости
+    с небольшим разбросом, чтобы предсказания не совпадали
+    """
+    extractor = MFCCExtractor(sample_rate=SAMPLE_RATE)
+    signals = [
+        make_signal(rng, 2 * SAMPLE_RATE) * rng.uniform(0.05, 3.0) for _ in range(64)
+    ]
+    base = extractor.extract_batch(signals)
+    features = base[rng.integers(0, len(base), size=n)]
+    return features * rng.normal(1.0, 0.2, size=features.shape).astype(np.float32)
+
+
+def timeit(func, repeat: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/fcnn_model.pth")
+    parser.add_argument("--batches", default="1,4,16,64,256,1024")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    model = load_checkpoint(args.model)
+    batches = [int(b) for b in args.batches.split(",")]
+    features = make_features(rng, max(batches))
+
+    runners = {runtime: load_runtime(runtime, model) for runtime in RUNTIMES}
+    print("batch " + "".join(f"{runtime:>13}" for runtime in RUNTIMES) + "  (ms)")
+    for batch in batches:
+        x = features[:batch]
+        timings = [timeit(lambda: run(x), args.repeat) for run in runners.values()]
+        print(f"{batch:>5} " + "".join(f"{ms:13.4f}" for ms in timings))
+
+
+if __name__ == "__main__":
+    main()
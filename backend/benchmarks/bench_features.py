@@ -0,0 +1,84 @@
+"""
+Замер скорости MFCCExtractor и MFCCAccumulator против исходного пути через librosa.
+Совпадение с librosa и потокового MFCCAccumulator проверяет
+tests/test_features.py.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_features
+"""
+
+import argparse
+import time
+
+import librosa
+import numpy as np
+
+from features import MFCCAccumulator, MFCCExtractor
+
+SAMPLE_RATE = 22050
+
+
+def reference_features(audio_data: np.ndarray) -> np.ndarray:
+    """
+    Исходная реализация AudioProcessor.extract_features
+    """
+    mfcc = librosa.feature.mfcc(
+        y=audio_data,
+        sr=SAMPLE_RATE,
+        n_mfcc=13,
+        n_fft=min(2048, len(audio_data)),
+        hop_length=min(512, len(audio_data) // 4),
+    )
+    width = min(9, mfcc.shape[1])
+    if width % 2 == 0:
+        width -= 1
+    width = max(width, 1)
+    mfcc_delta = librosa.feature.delta(mfcc, order=1, width=width)
+    return np.hstack([np.mean(mfcc, axis=1), np.mean(mfcc_delta, axis=1)])
+
+
+def make_signal(rng: np.random.Generator, n_samples: int) -> np.ndarray:
+    t = np.arange(n_samples) / SAMPLE_RATE
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (t < t[-1] / 2)
+    return (tone + 0.01 * rng.standard_normal(n_samples)).astype(np.float32)
+
+
+def accumulate(extractor: MFCCExtractor, signal: np.ndarray, chunk: int) -> np.ndarray:
+    accumulator = MFCCAccumulator(extractor)
+    for start in range(0, len(signal), chunk):
+        accumulator.update(signal[start : start + chunk])
+    return accumulator.finalize()
+
+
+def timeit(func, repeat: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    extractor = MFCCExtractor(sample_rate=SAMPLE_RATE)
+
+    signal = make_signal(rng, int(args.seconds * SAMPLE_RATE))
+    signals = [signal.copy() for _ in range(args.batch)]
+    ref_ms = timeit(lambda: reference_features(signal), args.repeat)
+    fast_ms = timeit(lambda: extractor.extract(signal), args.repeat)
+    batch_ms = timeit(lambda: extractor.extract_batch(signals), args.repeat)
+    stream_ms = timeit(lambda: accumulate(extractor, signal, 4096), args.repeat)
+    print(f"librosa          {ref_ms:8.3f} ms/clip")
+    print(f"extract          {fast_ms:8.3f} ms/clip")
+    print(f"extract_batch    {batch_ms / args.batch:8.3f} ms/clip (batch {args.batch})")
+    print(f"accumulator      {stream_ms:8.3f} ms/clip (chunks of 4096)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Сверка плоского леса с RandomForestClassifier и замер скорости
+на пачках разного размера.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_forest
+"""
+
+import argparse
+import pickle
+import tempfile
+import time
+
+import pandas as pd
+
+from forest import FlatForest, check_agreement, sample_features
+
+
+def timeit(func, repeat: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/random_forest_model.pkl")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--batches", default="1,8,32,256")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        forest = pickle.load(f)
+    with tempfile.TemporaryDirectory() as path:
+        FlatForest.from_sklearn(forest).save(path)
+        flat = FlatForest.load(path)
+
+        X = sample_features(flat, forest.n_features_in_, args.samples)
+        report = check_agreement(forest, flat, X)
+        print(
+            f"parity {report['samples']} samples: labels_equal "
+            f"{report['labels_equal']}, max abs diff {report['max_abs_diff']:.2e}"
+        )
+        if not (report["labels_equal"] and report["probabilities_equal"]):
+            raise SystemExit("Flat forest disagrees with sklearn")
+
+        columns = getattr(forest, "feature_names_in_", None)
+        for batch in map(int, args.batches.split(",")):
+            features = X[:batch]
+            frame = pd.DataFrame(features, columns=columns)
+
+            def sklearn_path():
+                # Исходный путь сервиса: predict и predict_proba по отдельности
+                forest.predict(frame)
+                forest.predict_proba(frame)
+
+            sklearn_ms = timeit(sklearn_path, args.repeat)
+            flat_ms = timeit(lambda: flat.predict_proba(features), args.repeat)
+            print(
+                f"batch {batch:>5}  sklearn {sklearn_ms:8.3f} ms  "
+                f"flat {flat_ms:8.3f} ms  x{sklearn_ms / flat_ms:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
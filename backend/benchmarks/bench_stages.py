@@ -0,0 +1,144 @@
+"""
+Микробенчмарки этапов обработки запроса по отдельности на синтетических
+файлах (см. fixtures.py): проверка длительности по заголовку,
+декодирование, MFCC, распознавание речи (заглушка вместо сетевого
+движка), голосовые модели на пачках разного размера и тональность.
+Кэши сервиса не участвуют, этапы вызываются напрямую.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_stages --output stages.json
+    python -m benchmarks.report baseline.json stages.json
+"""
+
+import argparse
+import os
+
+# Распознавание речи заменяется заглушкой до импорта модулей сервиса
+os.environ.setdefault("ASR_BACKEND", "stub")
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+import numpy as np
+
+from benchmarks.fixtures import DEFAULT_DIR, generate, parse_list
+from benchmarks.report import summarize, timings, write_report
+
+
+def bench_audio(fixtures: list, repeat: int) -> list:
+    from audio_processing import audio_processor
+
+    results = []
+    for fixture in fixtures:
+        with open(fixture["path"], "rb") as f:
+            content = f.read()
+        request_id = fixture["case"]
+        audio_data, _ = audio_processor.decode_audio(request_id, content)
+        cases = {
+            "probe": lambda: audio_processor.probe_duration(request_id, content),
+            "decode": lambda: audio_processor.decode_audio(request_id, content),
+        }
+        # Признаки и распознавание не зависят от формата файла
+        if fixture["format"] == "wav":
+            cases["extract_features"] = lambda: audio_processor.extract_features(
+                request_id, audio_data
+            )
+            cases["transcribe_stub"] = lambda: audio_processor.transcribe_audio(
+                request_id, audio_data
+            )
+        for stage, func in cases.items():
+            results.append(
+                {
+                    "case": f"{stage}/{fixture['case']}",
+                    "stage": stage,
+                    "fixture": fixture["case"],
+                    **summarize(timings(func, repeat)),
+                }
+            )
+    return results
+
+
+def bench_models(batches: list, repeat: int) -> list:
+    from models import VOICE_MODELS
+
+    rng = np.random.default_rng(0)
+    results = []
+    for name in VOICE_MODELS:
+        model = VOICE_MODELS[name]
+        for batch in batches:
+            features = rng.standard_normal((batch, 26)).astype(np.float32)
+            request_ids = ["bench"] * batch
+            latencies = timings(
+                lambda: model.predict_batch(request_ids, features), repeat
+            )
+            results.append(
+                {
+                    "case": f"inference_{name}/batch_{batch}",
+                    "stage": f"inference_{name}",
+                    "batch": batch,
+                    **summarize(latencies),
+                    "per_item_ms": float(np.mean(latencies)) / batch,
+                }
+            )
+    return results
+
+
+def bench_sentiment(batches: list, repeat: int) -> list:
+    from text_processing import get_sentiment_batch
+
+    # Тексты уникальны в каждом вызове, иначе ответ придёт из memo
+    counter = iter(range(10**9))
+
+    def call(batch: int):
+        texts = [f"проверка тональности текста {next(counter)}" for _ in range(batch)]
+        get_sentiment_batch(texts)
+
+    results = []
+    for batch in batches:
+        latencies = timings(lambda: call(batch), repeat)
+        results.append(
+            {
+                "case": f"sentiment/batch_{batch}",
+                "stage": "sentiment",
+                "batch": batch,
+                **summarize(latencies),
+                "per_item_ms": float(np.mean(latencies)) / batch,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--fixtures", default=DEFAULT_DIR)
+    parser.add_argument("--formats", default="wav,mp3,ogg")
+    parser.add_argument("--batches", default="1,8,32")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--stages", default="audio,models,sentiment", help="Группы этапов"
+    )
+    parser.add_argument("--output", help="JSON файл или - для stdout")
+    args = parser.parse_args()
+
+    fixtures = generate(args.fixtures, parse_list(args.formats))
+    batches = parse_list(args.batches, int)
+    stages = parse_list(args.stages)
+
+    results = []
+    if "audio" in stages:
+        results += bench_audio(fixtures, args.repeat)
+    if "models" in stages:
+        results += bench_models(batches, args.repeat)
+    if "sentiment" in stages:
+        results += bench_sentiment(batches, args.repeat)
+
+    if args.output != "-":
+        for r in results:
+            print(
+                f"{r['case']:<40} p50 {r['p50_ms']:9.3f} ms  p95 {r['p95_ms']:9.3f} ms"
+            )
+    write_report(args.output, "stages", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
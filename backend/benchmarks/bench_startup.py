@@ -0,0 +1,111 @@
+"""
+Время старта и память процесса в режимах загрузки моделей
+(MODEL_LOADING). Каждый замер идёт в отдельном интерпретаторе:
+время импорта приложения (до него uvicorn не принимает соединения),
+время до готовности /api/ready и RSS/PSS процесса.
+
+Отдельно замеряется процесс пула вычислений: только голосовые модели
+(лес читается через mmap и делит страницы между процессами) и вместе
+с моделью тональности.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+
+def memory():
+    result = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ("Rss", "Pss"):
+                result[key.lower() + "_mb"] = int(value.split()[0]) / 1024
+    return result
+
+if SCENARIO == "app":
+    from main import app, lifespan
+    from registry import model_registry
+    imported = time.perf_counter()
+    after_import = memory()
+
+    async def serve():
+        async with lifespan(app):
+            while not model_registry.ready():
+                await asyncio.sleep(0.01)
+
+    asyncio.run(serve())
+else:
+    import numpy as np
+    from models import VOICE_MODELS
+    imported = time.perf_counter()
+    after_import = memory()
+    features = np.zeros((1, 26), dtype=np.float32)
+    for name in VOICE_MODELS:
+        VOICE_MODELS[name].predict_batch(["bench"], features)
+    if SCENARIO == "worker_text":
+        from text_processing import get_sentiment
+        get_sentiment("проверка")
+
+ready = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started,
+    "ready_s": ready - started,
+    "import_rss_mb": after_import["rss_mb"],
+    **memory(),
+}))
+"""
+
+
+def measure(scenario: str, loading: str) -> dict:
+    env = dict(os.environ, MODEL_LOADING=loading, CPU_POOL_KIND="thread")
+    code = f"SCENARIO = {scenario!r}\n" + CHILD
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Вывод в JSON")
+    args = parser.parse_args()
+
+    cases = [("app", mode) for mode in ("eager", "background", "lazy")]
+    cases += [("worker", "lazy"), ("worker_text", "lazy")]
+    results = []
+    for scenario, loading in cases:
+        runs = [measure(scenario, loading) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["ready_s"])
+        results.append({"scenario": scenario, "loading": loading, **best})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'scenario':<12} {'loading':<11} {'import s':>9} {'ready s':>8} "
+        f"{'RSS@import':>11} {'RSS MB':>7} {'PSS MB':>7}"
+    )
+    for r in results:
+        print(
+            f"{r['scenario']:<12} {r['loading']:<11} {r['import_s']:>9.2f} "
+            f"{r['ready_s']:>8.2f} {r['import_rss_mb']:>11.0f} "
+            f"{r['rss_mb']:>7.0f} {r['pss_mb']:>7.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Синтетические аудиофайлы для бенчмарков: речеподобный сигнал (тон
+с гармониками, вибрато и слоговой огибающей на фоне шума) длиной
+от 1 до 10 секунд в WAV, MP3 и OGG и запись тишины как крайний
+случай. Генерация детерминирована (seed), файлы пишутся через
+libsndfile без ffmpeg.
+
+Запуск из каталога backend:
+    python -m benchmarks.fixtures --output benchmarks/data
+"""
+
+import argparse
+import os
+from typing import List
+
+import numpy as np
+import soundfile as sf
+
+FORMATS = {
+    "wav": ("WAV", "PCM_16"),
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+    "ogg": ("OGG", "VORBIS"),
+}
+DURATIONS = (1.0, 3.0, 5.0, 10.0)
+SAMPLE_RATE = 16000
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def speech_like(seconds: float, sample_rate: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = rng.uniform(110, 220) * (1 + 0.03 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    # Слоги около 4 Гц и паузы между фразами
+    envelope = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None)
+    envelope *= (np.sin(2 * np.pi * 0.4 * t + rng.uniform(0, np.pi)) > -0.6).astype(
+        np.float64
+    )
+    signal = 0.3 * voice * envelope + 0.005 * rng.standard_normal(len(t))
+    return signal.astype(np.float32)
+
+
+def generate(
+    output: str = DEFAULT_DIR,
+    formats: List[str] = tuple(FORMATS),
+    durations: List[float] = DURATIONS,
+    sample_rate: int = SAMPLE_RATE,
+    seed: int = 0,
+) -> List[dict]:
+    """
+    Записать набор файлов в output и вернуть их описание
+    (case, path, format, seconds)
+    """
+    os.makedirs(output, exist_ok=True)
+    clips = [(f"speech_{d:g}s", d, i) for i, d in enumerate(durations)]
+    clips.append(("silence_2s", 2.0, None))
+
+    fixtures = []
+    for name, seconds, index in clips:
+        if index is None:
+            signal = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+        else:
+            signal = speech_like(seconds, sample_rate, seed + index)
+        for fmt in formats:
+            container, subtype = FORMATS[fmt]
+            path = os.path.join(output, f"{name}.{fmt}")
+            sf.write(path, signal, sample_rate, format=container, subtype=subtype)
+            fixtures.append(
+                {
+                    "case": f"{name}.{fmt}",
+                    "path": path,
+                    "format": fmt,
+                    "seconds": seconds,
+                }
+            )
+    return fixtures
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--output", default=DEFAULT_DIR)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--durations", default=",".join(f"{d:g}" for d in DURATIONS))
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fixtures = generate(
+        args.output,
+        parse_list(args.formats),
+        parse_list(args.durations, float),
+        args.sample_rate,
+        args.seed,
+    )
+    for fixture in fixtures:
+        size = os.path.getsize(fixture["path"])
+        print(f"{fixture['path']:<60} {size / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
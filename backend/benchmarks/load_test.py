@@ -0,0 +1,201 @@
+"""
+Нагрузочный прогон сервиса целиком: запросы с синтетическими файлами
+(см. fixtures.py) на заданные эндпоинты при разной конкурентности,
+пропускная способность и задержки p50/p95/p99.
+
+Без --url сервис запускается отдельным процессом uvicorn с заглушкой
+вместо сетевого распознавания речи (ASR_BACKEND=stub) и без кэша
+результатов, чтобы каждый запрос проходил все этапы.
+
+Запуск из каталога backend:
+    python -m benchmarks.load_test --concurrency 1,8,32 --output load.json
+    python -m benchmarks.load_test --url http://localhost:8000 --requests 500
+    python -m benchmarks.report baseline.json load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.fixtures import DEFAULT_DIR, generate, parse_list
+from benchmarks.report import summarize, write_report
+
+CONTENT_TYPES = {"wav": "audio/wav", "mp3": "audio/mpeg", "ogg": "audio/ogg"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        ASR_BACKEND="stub",
+        ASR_STUB_LATENCY_SECONDS=str(args.asr_latency),
+        CACHE_BACKEND=args.cache,
+        FEATURE_STORE_MODE="off",
+    )
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(args.server_workers),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, process: Optional[subprocess.Popen], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/api/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server at {url} is not ready after {timeout:.0f}s")
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    uploads: List[tuple],
+    concurrency: int,
+    requests: int,
+) -> dict:
+    latencies = []
+    statuses = Counter()
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            upload = uploads[i % len(uploads)]
+            started = time.perf_counter()
+            try:
+                response = await client.post(endpoint, files={"file": upload})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "case": f"{endpoint}@c{concurrency}",
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall,
+        "errors": requests - len(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        **summarize(latencies),
+    }
+
+
+async def run(url: str, uploads: List[tuple], args: argparse.Namespace) -> list:
+    limits = httpx.Limits(max_connections=max(parse_list(args.concurrency, int)))
+    async with httpx.AsyncClient(
+        base_url=url, timeout=args.timeout, limits=limits
+    ) as client:
+        results = []
+        for endpoint in parse_list(args.endpoints):
+            # Прогрев: загрузка моделей в процессах пула, пулы соединений
+            await run_level(client, endpoint, uploads, 1, args.warmup)
+            for concurrency in parse_list(args.concurrency, int):
+                result = await run_level(
+                    client, endpoint, uploads, concurrency, args.requests
+                )
+                results.append(result)
+                if args.output != "-":
+                    print(
+                        f"{result['case']:<50} {result['throughput_rps']:8.1f} rps  "
+                        f"p50 {result.get('p50_ms', 0):8.1f}  "
+                        f"p95 {result.get('p95_ms', 0):8.1f}  "
+                        f"p99 {result.get('p99_ms', 0):8.1f} ms  "
+                        f"errors {result['errors']}",
+                        flush=True,
+                    )
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", help="Адрес запущенного сервиса")
+    parser.add_argument(
+        "--endpoints", default="/api/predict_rf,/api/predict_fcnn?check_text=true"
+    )
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--fixtures", default=DEFAULT_DIR)
+    parser.add_argument("--formats", default="wav,mp3,ogg")
+    parser.add_argument("--cache", default="none", help="CACHE_BACKEND сервиса")
+    parser.add_argument(
+        "--asr-latency", type=float, default=0.0, help="Задержка заглушки ASR, с"
+    )
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--server-log")
+    parser.add_argument("--output", help="JSON файл или - для stdout")
+    args = parser.parse_args()
+
+    uploads = []
+    for fixture in generate(args.fixtures, parse_list(args.formats)):
+        with open(fixture["path"], "rb") as f:
+            content = f.read()
+        uploads.append((fixture["case"], content, CONTENT_TYPES[fixture["format"]]))
+
+    process = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        process = start_server(port, args)
+    try:
+        wait_ready(url, process, timeout=300)
+        results = asyncio.run(run(url, uploads, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    params = {**vars(args), "url": url}
+    write_report(args.output, "load", params, results)
+
+
+if __name__ == "__main__":
+    main()
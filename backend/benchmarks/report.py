@@ -0,0 +1,143 @@
+"""
+Общие функции отчётов бенчмарков: перцентили, запись результатов
+в JSON с описанием окружения и сравнение двух прогонов.
+
+Сравнение (код возврата 1 при замедлении больше порога):
+    python -m benchmarks.report baseline.json current.json --threshold 0.15
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Метрики, для которых рост значения означает ухудшение
+LOWER_IS_BETTER = ("mean_ms", "p50_ms", "p95_ms", "p99_ms")
+HIGHER_IS_BETTER = ("throughput_rps",)
+
+
+def summarize(latencies_ms: Iterable[float]) -> Dict[str, float]:
+    values = np.asarray(list(latencies_ms), dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+
+def timings(func, repeat: int, warmup: int = 1) -> List[float]:
+    """
+    Длительности repeat вызовов func в миллисекундах
+    """
+    for _ in range(warmup):
+        func()
+    result = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        result.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_report(path: Optional[str], benchmark: str, params: dict, results: list):
+    """
+    Отчёт в файл path (или stdout при path == "-")
+    """
+    report = {
+        "benchmark": benchmark,
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if path == "-":
+        print(text)
+    elif path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {path}", file=sys.stderr)
+    return report
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Сравнение прогонов по совпадающим случаям (поле case).
+    Возвращает описания регрессий больше threshold (доля)
+    """
+    previous = {r["case"]: r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["case"])
+        if old is None:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not old.get(key) or result.get(key) is None:
+                continue
+            change = result[key] / old[key] - 1
+            if key in HIGHER_IS_BETTER:
+                change = -change
+            line = (
+                f"{result['case']:<40} {key:<15} {old[key]:>10.3f} -> "
+                f"{result[key]:>10.3f} ({change:+.1%})"
+            )
+            print(line)
+            if change > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions over {args.threshold:.0%}:")
+        for line in regressions:
+            print(line)
+        raise SystemExit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
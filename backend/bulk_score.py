@@ -0,0 +1,371 @@
+"""
+Пакетная оценка архива записей без HTTP: каталог или манифест
+(CSV/JSONL с колонкой path и необязательной id) -> Parquet/CSV/JSONL.
+
+Признаки считаются в пуле процессов потоково, блоками, модели
+вызываются пачками в основном процессе. Повторный запуск с тем же
+--output пропускает уже записанные id.
+
+    python bulk_score.py /data/calls --output scores.parquet --model both
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".m4a", ".aac", ".opus", ".webm")
+FORMATS = ("parquet", "csv", "jsonl")
+# Примерный RSS процесса извлечения признаков: интерпретатор, numpy,
+# librosa и буферы одного блока
+WORKER_MEMORY_MB = 300
+
+
+def iter_inputs(source: str) -> Iterator[Tuple[str, str]]:
+    """
+    Пары (id, путь) из каталога (рекурсивно) или манифеста
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, source), path
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    if source.endswith(".jsonl"):
+        with open(source, encoding="utf-8") as f:
+            rows = (json.loads(line) for line in f if line.strip())
+            for row in rows:
+                yield _manifest_item(row, base)
+    else:
+        for chunk in pd.read_csv(source, chunksize=10000, dtype=str):
+            for row in chunk.to_dict("records"):
+                yield _manifest_item(row, base)
+
+
+def _manifest_item(row: dict, base: str) -> Tuple[str, str]:
+    path = row["path"]
+    if not os.path.isabs(path):
+        path = os.path.join(base, path)
+    return str(row.get("id") or row["path"]), path
+
+
+def score_file(path: str, with_text: bool, max_duration: float) -> Dict:
+    """
+    Точка входа для пула процессов: признаки (и текст) одного файла
+    """
+    from audio_processing import audio_processor
+    from segmentation import iter_blocks
+
+    request_id = os.path.basename(path)
+    item = {"features": None, "duration": None, "text": None, "error": None}
+    try:
+        if with_text:
+            with open(path, "rb") as f:
+                audio_data, duration = audio_processor.decode_audio(
+                    request_id, f.read()
+                )
+            _check_duration(duration, max_duration)
+            item["features"] = audio_processor.extract_features(request_id, audio_data)
+            item["text"] = audio_processor.transcribe_audio(request_id, audio_data)
+        else:
+            # Без текста сигнал не нужен целиком: признаки копятся по блокам
+            samples = 0
+
+            def blocks(f):
+                nonlocal samples
+                for block in iter_blocks(f, audio_processor.SAMPLE_RATE):
+                    samples += len(block)
+                    _check_duration(samples / audio_processor.SAMPLE_RATE, max_duration)
+                    yield block
+
+            with open(path, "rb") as f:
+                item["features"] = audio_processor.extract_features_stream(
+                    request_id, blocks(f)
+                )
+            duration = samples / audio_processor.SAMPLE_RATE
+        item["duration"] = duration
+    except Exception as e:
+        item["error"] = str(e) or type(e).__name__
+    return item
+
+
+def _check_duration(duration: float, max_duration: float) -> None:
+    if max_duration and duration > max_duration:
+        raise ValueError(f"Audio exceeds {max_duration:g} seconds")
+
+
+def result_columns(model_names: List[str], with_text: bool) -> Dict[str, str]:
+    """
+    Столбцы результата в постоянном порядке и их типы: общие поля,
+    prob_<класс> по всем классам моделей, затем поля текста. Строки
+    с ошибкой и пачки из одних ошибок получают ту же схему
+    """
+    from models import VOICE_MODELS
+
+    labels = []
+    for model_name in model_names:
+        for label in VOICE_MODELS[model_name].label_encoder.classes_:
+            if label not in labels:
+                labels.append(label)
+    columns = {
+        "id": "string",
+        "path": "string",
+        "model": "string",
+        "duration": "float64",
+        "emotion": "string",
+        "error": "string",
+    }
+    columns.update({f"prob_{label}": "float64" for label in labels})
+    if with_text:
+        columns.update(
+            {
+                "text": "string",
+                "text_emotion": "string",
+                "text_label_probability": "float64",
+            }
+        )
+    return columns
+
+
+class ResultWriter:
+    """
+    Дозапись результатов порциями. Parquet пишется каталогом part-файлов,
+    CSV и JSONL дописываются в конец. Все порции приводятся к columns,
+    поэтому CSV не съезжает, а part-файлы Parquet имеют одну схему.
+    Записанные id служат контрольной точкой для продолжения прерванного
+    прогона
+    """
+
+    def __init__(self, path: str, fmt: str, columns: Dict[str, str]):
+        self.path = path
+        self.format = fmt
+        self.columns = columns
+        self.rows = 0
+
+    def done_ids(self, rows_per_id: int = 1) -> Set[str]:
+        """
+        id, для которых записаны все строки (по одной на модель)
+        """
+        if not os.path.exists(self.path):
+            return set()
+        if self.format == "parquet":
+            parts = sorted(p for p in os.listdir(self.path) if p.endswith(".parquet"))
+            ids = pd.concat(
+                [
+                    pd.read_parquet(os.path.join(self.path, part), columns=["id"])["id"]
+                    for part in parts
+                ]
+                or [pd.Series([], dtype=str)]
+            )
+        elif self.format == "csv":
+            self._terminate_last_line()
+            # Строка, оборванная при падении, пропускается и будет посчитана заново
+            ids = pd.read_csv(
+                self.path, usecols=["id"], dtype=str, on_bad_lines="skip"
+            )["id"]
+        else:
+            self._terminate_last_line()
+            values = []
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        values.append(json.loads(line)["id"])
+                    except (ValueError, KeyError):
+                        continue
+            ids = pd.Series(values, dtype=str)
+        counts = ids.value_counts()
+        return set(counts.index[counts >= rows_per_id])
+
+    def _terminate_last_line(self) -> None:
+        """
+        После падения файл может заканчиваться оборванной строкой:
+        новые строки не должны к ней приклеиться
+        """
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def write(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        frame = pd.DataFrame(rows).reindex(columns=list(self.columns))
+        frame = frame.astype(self.columns)
+        if self.format == "parquet":
+            os.makedirs(self.path, exist_ok=True)
+            index = len([p for p in os.listdir(self.path) if p.endswith(".parquet")])
+            part = os.path.join(self.path, f"part-{index:05d}.parquet")
+            frame.to_parquet(part + ".tmp", index=False)
+            os.replace(part + ".tmp", part)
+        elif self.format == "csv":
+            header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            frame.to_csv(self.path, mode="a", header=header, index=False)
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(frame.to_json(orient="records", lines=True, force_ascii=False))
+        self.rows += len(rows)
+
+
+def predict_rows(
+    batch: List[Tuple[str, str, Dict]], model_names: List[str], with_text: bool
+) -> List[Dict]:
+    """
+    Строки результата для пачки файлов: одна строка на файл и модель
+    """
+    from models import VOICE_MODELS
+
+    ok = [(i, item) for i, (_, _, item) in enumerate(batch) if item["error"] is None]
+    features = np.vstack([item["features"] for _, item in ok]) if ok else None
+    request_ids = [batch[i][0] for i, _ in ok]
+
+    sentiments = {}
+    if with_text and ok:
+        from text_processing import get_sentiment_batch
+
+        texts = [item["text"] for _, item in ok]
+        for (i, _), (label, probs) in zip(ok, get_sentiment_batch(texts)):
+            sentiments[i] = (label, float(max(probs)))
+
+    predictions = {}
+    for model_name in model_names:
+        if ok:
+            results = VOICE_MODELS[model_name].predict_batch(request_ids, features)
+            for (i, _), result in zip(ok, results):
+                predictions[i, model_name] = result
+
+    # Строки одного файла идут подряд, чтобы оборванная запись
+    # затрагивала только последний файл
+    rows = []
+    for i, (item_id, path, item) in enumerate(batch):
+        for model_name in model_names:
+            prediction = predictions.get((i, model_name), {"error": item["error"]})
+            row = {
+                "id": item_id,
+                "path": path,
+                "model": model_name,
+                "duration": item["duration"],
+                "emotion": prediction.get("emotion"),
+                "error": prediction.get("error"),
+            }
+            for label, value in (prediction.get("detail") or {}).items():
+                row[f"prob_{label}"] = value
+            if with_text:
+                text_emotion, text_probability = sentiments.get(i, (None, None))
+                row["text"] = item["text"]
+                row["text_emotion"] = text_emotion
+                row["text_label_probability"] = text_probability
+            rows.append(row)
+    return rows
+
+
+def run(args: argparse.Namespace) -> None:
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".") or "jsonl"
+    if fmt not in FORMATS:
+        raise SystemExit(f"Unknown output format: {fmt}")
+    model_names = ["rf", "fcnn"] if args.model == "both" else [args.model]
+    writer = ResultWriter(args.output, fmt, result_columns(model_names, args.text))
+    done = writer.done_ids(rows_per_id=len(model_names))
+    if done:
+        logger.info(f"Resuming: {len(done)} ids already in {args.output}")
+
+    workers = args.workers
+    if args.max_memory_mb:
+        workers = min(workers, max(args.max_memory_mb // WORKER_MEMORY_MB, 1))
+    inputs = ((i, p) for i, p in iter_inputs(args.input) if i not in done)
+    logger.info(f"Scoring with {workers} workers, models {model_names}")
+
+    started = time.perf_counter()
+    last_report = started
+    scored = failed = 0
+    batch: List[Tuple[str, str, Dict]] = []
+    pending = {}
+    # Число файлов в работе ограничено, поэтому манифест читается лениво
+    max_pending = workers * 4
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=args.max_tasks_per_child or None,
+    ) as pool:
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item_id, path = next(inputs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = pool.submit(score_file, path, args.text, args.max_duration)
+                pending[future] = (item_id, path)
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item_id, path = pending.pop(future)
+                item = future.result()
+                failed += item["error"] is not None
+                batch.append((item_id, path, item))
+
+            if len(batch) >= args.batch_size or (exhausted and not pending):
+                writer.write(predict_rows(batch, model_names, args.text))
+                scored += len(batch)
+                batch = []
+
+            now = time.perf_counter()
+            if now - last_report >= args.progress_every or (exhausted and not pending):
+                rate = scored / (now - started) if now > started else 0.0
+                logger.info(
+                    f"Scored {scored} files ({failed} failed), {rate:.1f} files/s, "
+                    f"{len(pending)} in flight"
+                )
+                last_report = now
+
+    logger.info(
+        f"Done: {scored} files, {writer.rows} rows in {args.output} "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("input", help="Каталог с аудио или манифест .csv/.jsonl")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--model", choices=("rf", "fcnn", "both"), default="rf")
+    parser.add_argument("--text", action="store_true", help="Распознавание речи")
+    parser.add_argument("--workers", type=int, default=config.CPU_WORKERS)
+    parser.add_argument("--max-memory-mb", type=int, default=0)
+    parser.add_argument("--max-tasks-per-child", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--max-duration",
+        type=float,
+        default=config.LONG_MAX_DURATION_SECONDS,
+        help="Предел длительности файла, с (0 - без ограничения)",
+    )
+    parser.add_argument("--progress-every", type=float, default=10.0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
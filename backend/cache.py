@@ -0,0 +1,195 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def audio_hash(audio_data: np.ndarray) -> str:
+    """
+    Ключ аудио: хэш декодированного сигнала, а не исходного файла,
+    поэтому один и тот же клип в разных контейнерах попадает в кэш
+    """
+    return hashlib.sha256(np.ascontiguousarray(audio_data).tobytes()).hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """
+    LRU кэш в памяти процесса с ограничением по числу записей и TTL
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Кэш в файле SQLite, переживает перезапуск сервиса.
+    Вытеснение по времени последнего обращения и TTL
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = f"cache_{table}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_accessed "
+            f"ON {self.table} (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                (key, blob, now + self.ttl, now),
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+                    f"{self.table} ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            query = f"SELECT COUNT(*) FROM {self.table}"
+            return self._conn.execute(query).fetchone()[0]
+
+
+class CacheLayer:
+    """
+    Отдельный уровень кэша (признаки, транскрипция, тональность,
+    итоговый результат) со счётчиками попаданий и промахов
+    """
+
+    def __init__(self, name: str, backend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Error reading {self.name} cache: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.error(f"Error writing {self.name} cache: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": config.CACHE_BACKEND,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def make_cache(name: str) -> CacheLayer:
+    if config.CACHE_BACKEND == "none":
+        backend = None
+    elif config.CACHE_BACKEND == "sqlite":
+        backend = SQLiteCache(
+            config.CACHE_PATH, name, config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS
+        )
+    else:
+        backend = MemoryCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS)
+    return CacheLayer(name, backend)
+
+
+feature_cache = make_cache("features")
+transcript_cache = make_cache("transcript")
+sentiment_cache = make_cache("sentiment")
+result_cache = make_cache("result")
+
+caches = {
+    cache.name: cache
+    for cache in (feature_cache, transcript_cache, sentiment_cache, result_cache)
+}
@@ -0,0 +1,69 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight): пока
+запрос с тем же ключом выполняется, повторы ждут его результат вместо
+собственной обработки. Работает в пределах процесса сервиса
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """
+    Выполняемые запросы по ключу. Работа идёт отдельной задачей, поэтому
+    обрыв соединения первого клиента не прерывает её для остальных.
+    Ошибка тоже общая: повторы получают то же исключение
+    """
+
+    def __init__(self, name: str, enabled: bool = config.COALESCE_REQUESTS):
+        self.name = name
+        self.enabled = enabled
+        self.leaders = 0
+        self.coalesced = 0
+        self._flights: Dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await func()
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(func())
+        self._flights[key] = flight
+        flight.add_done_callback(lambda _: self._finish(key, flight))
+        self.leaders += 1
+        return await asyncio.shield(flight)
+
+    def joinable(self, key: str) -> bool:
+        """
+        Есть ли выполняемый запрос, к которому присоединится run с этим ключом
+        """
+        return self.enabled and key in self._flights
+
+    def _finish(self, key: str, flight: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Ошибку забирают ожидающие; если все они отключились, она
+        # только записывается в лог
+        if not flight.cancelled() and flight.exception() is not None:
+            logger.debug(f"Coalesced {self.name} request failed: {flight.exception()}")
+
+    def stats(self) -> dict:
+        total = self.leaders + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "requests": total,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
+
+
+upload_flights = SingleFlight("upload")
@@ -0,0 +1,135 @@
+import os
+
+# Пулы исполнителей для блокирующих операций
+IO_WORKERS = int(os.environ.get("IO_WORKERS", 8))
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", os.cpu_count() or 1))
+CPU_POOL_KIND = os.environ.get("CPU_POOL_KIND", "process")
+
+# Ограничение числа одновременно обрабатываемых запросов
+MAX_PENDING_REQUESTS = int(os.environ.get("MAX_PENDING_REQUESTS", 64))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", 1))
+
+# Микробатчинг запросов к голосовым моделям
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+BATCH_MAX_QUEUE = int(os.environ.get("BATCH_MAX_QUEUE", 256))
+
+# Пакетная обработка архивов: число файлов и их суммарный размер
+# после распаковки
+BATCH_MAX_CLIPS = int(os.environ.get("BATCH_MAX_CLIPS", 10000))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", 2 * 1024**3))
+
+# Кэш результатов: memory, sqlite или none
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10000))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 24 * 60 * 60))
+CACHE_PATH = os.environ.get(
+    "CACHE_PATH", os.path.join(os.path.dirname(__file__), "cache", "cache.sqlite")
+)
+
+# Распознавание речи: google, sphinx, vosk, whisper или stub
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "google")
+ASR_LANGUAGE = os.environ.get("ASR_LANGUAGE", "ru-RU")
+ASR_MODEL_PATH = os.environ.get(
+    "ASR_MODEL_PATH", os.path.join(os.path.dirname(__file__), "models", "asr")
+)
+ASR_POOL_SIZE = int(os.environ.get("ASR_POOL_SIZE", IO_WORKERS))
+ASR_TIMEOUT_SECONDS = float(os.environ.get("ASR_TIMEOUT_SECONDS", 15))
+ASR_STUB_TEXT = os.environ.get("ASR_STUB_TEXT", "неизвестная речь")
+# Задержка заглушки: имитация сетевого движка в нагрузочных прогонах
+ASR_STUB_LATENCY_SECONDS = float(os.environ.get("ASR_STUB_LATENCY_SECONDS", 0))
+
+# Анализ тональности текста
+SENTIMENT_BATCH_SIZE = int(os.environ.get("SENTIMENT_BATCH_SIZE", 32))
+SENTIMENT_MEMO_SIZE = int(os.environ.get("SENTIMENT_MEMO_SIZE", 4096))
+SENTIMENT_NUM_THREADS = int(os.environ.get("SENTIMENT_NUM_THREADS", 0))
+SENTIMENT_RUNTIME = os.environ.get("SENTIMENT_RUNTIME", "fp32")
+
+# Ансамбль в /api/analyze: веса голосовых моделей и тональности текста
+ENSEMBLE_WEIGHTS = os.environ.get("ENSEMBLE_WEIGHTS", "rf=1,fcnn=1,text=0.5")
+
+# Случайный лес: flat (плоские массивы через mmap) или sklearn (pickle)
+RF_ENGINE = os.environ.get("RF_ENGINE", "flat")
+RF_FLAT_PATH = os.environ.get(
+    "RF_FLAT_PATH",
+    os.path.join(os.path.dirname(__file__), "models", "random_forest_flat"),
+)
+
+# Голосовая FCNN: eager, torchscript, numpy, int8 или bf16 (см. fcnn_runtime.py)
+FCNN_RUNTIME = os.environ.get("FCNN_RUNTIME", "numpy")
+FCNN_NUM_THREADS = int(os.environ.get("FCNN_NUM_THREADS", 0))
+
+# Потоковое распознавание по WebSocket (/api/stream)
+STREAM_SAMPLE_RATE = int(os.environ.get("STREAM_SAMPLE_RATE", 16000))
+STREAM_WINDOW_SECONDS = float(os.environ.get("STREAM_WINDOW_SECONDS", 3.0))
+STREAM_HOP_SECONDS = float(os.environ.get("STREAM_HOP_SECONDS", 1.0))
+STREAM_MAX_WINDOW_SECONDS = float(os.environ.get("STREAM_MAX_WINDOW_SECONDS", 10.0))
+STREAM_MAX_PENDING_CHUNKS = int(os.environ.get("STREAM_MAX_PENDING_CHUNKS", 16))
+STREAM_MAX_SESSIONS = int(os.environ.get("STREAM_MAX_SESSIONS", 32))
+
+# Длинные записи (/api/predict_long): блочное декодирование и VAD по энергии.
+# LONG_MAX_BYTES - размер файла задачи long в очереди
+LONG_MAX_DURATION_SECONDS = float(
+    os.environ.get("LONG_MAX_DURATION_SECONDS", 4 * 60 * 60)
+)
+LONG_MAX_BYTES = int(os.environ.get("LONG_MAX_BYTES", 1024**3))
+LONG_BLOCK_SECONDS = float(os.environ.get("LONG_BLOCK_SECONDS", 5.0))
+LONG_VAD_FRAME_MS = float(os.environ.get("LONG_VAD_FRAME_MS", 30))
+LONG_VAD_THRESHOLD_DB = float(os.environ.get("LONG_VAD_THRESHOLD_DB", -40))
+LONG_MIN_SILENCE_SECONDS = float(os.environ.get("LONG_MIN_SILENCE_SECONDS", 0.3))
+LONG_MIN_SEGMENT_SECONDS = float(os.environ.get("LONG_MIN_SEGMENT_SECONDS", 0.5))
+LONG_MAX_SEGMENT_SECONDS = float(os.environ.get("LONG_MAX_SEGMENT_SECONDS", 10.0))
+
+# Хранилище признаков по хэшу аудио: off, read (чтение при промахе кэша)
+# или write (чтение и запись при предсказании), см. feature_store.py
+FEATURE_STORE_MODE = os.environ.get("FEATURE_STORE_MODE", "off")
+FEATURE_STORE_PATH = os.environ.get(
+    "FEATURE_STORE_PATH", os.path.join(os.path.dirname(__file__), "feature_store")
+)
+
+# Загрузка моделей: background (в фоне после старта, /api/ready до
+# окончания загрузки отвечает 503), eager (до приёма запросов) или lazy
+# (при первом обращении)
+MODEL_LOADING = os.environ.get("MODEL_LOADING", "background")
+
+# Версии моделей: каталоги MODEL_VERSIONS_DIR/<rf|fcnn>/<версия> с теми же
+# файлами, что в models/. Маршруты (основная, канареечная и теневая версии)
+# хранятся в MODEL_ROUTES_PATH и общие для всех процессов сервиса
+MODEL_VERSIONS_DIR = os.environ.get(
+    "MODEL_VERSIONS_DIR", os.path.join(os.path.dirname(__file__), "models", "versions")
+)
+MODEL_ROUTES_PATH = os.environ.get(
+    "MODEL_ROUTES_PATH", os.path.join(MODEL_VERSIONS_DIR, "routes.json")
+)
+MODEL_MAX_VERSIONS = int(os.environ.get("MODEL_MAX_VERSIONS", 4))
+# Ожидание загрузки новой версии во всех процессах пула вычислений
+MODEL_WORKER_LOAD_TIMEOUT_SECONDS = float(
+    os.environ.get("MODEL_WORKER_LOAD_TIMEOUT_SECONDS", 300)
+)
+
+# Метрики Prometheus (/metrics): замеры этапов обработки запроса
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+# Одинаковые одновременные запросы (тот же файл, модели и флаги)
+# обрабатываются один раз, повторы получают общий результат
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "1") == "1"
+
+# Асинхронные задачи (/api/jobs): очередь в SQLite и процессы-обработчики.
+# JOB_WORKERS процессов запускаются вместе с сервисом (0 - только
+# отдельно, python jobs.py worker). JOB_CONCURRENCY ограничивает число
+# одновременно выполняемых задач каждого типа по всем обработчикам
+JOBS_PATH = os.environ.get("JOBS_PATH", os.path.join(os.path.dirname(__file__), "jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+JOB_CONCURRENCY = os.environ.get("JOB_CONCURRENCY", "predict=4,batch=1,long=1")
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# Верхняя граница max_attempts, которое клиент задаёт в запросе
+JOB_MAX_ATTEMPTS_LIMIT = int(os.environ.get("JOB_MAX_ATTEMPTS_LIMIT", 10))
+JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", 5))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 0.5))
+JOB_WEBHOOK_TIMEOUT_SECONDS = float(os.environ.get("JOB_WEBHOOK_TIMEOUT_SECONDS", 10))
+
+# Приём загрузок: файл читается частями во временный каталог
+# (по умолчанию системный), больше UPLOAD_MAX_BYTES - ответ 413
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or None
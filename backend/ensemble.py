@@ -0,0 +1,107 @@
+"""
+Объединение ответов голосовых моделей и тональности текста
+взвешенным усреднением вероятностей эмоций
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+TEXT_SOURCE = "text"
+
+# Тональность текста переводится в эмоции голоса: нейтральная и
+# позитивная совпадают, негатив делится между злостью и грустью
+NEGATIVE_EMOTIONS = ("angry", "sad")
+TEXT_TO_VOICE = {"neutral": "neutral", "positive": "positive"}
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """
+    Веса источников из строки вида "rf=1,fcnn=1,text=0.5"
+    """
+    weights = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, sep, weight = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=weight, got {item!r}")
+        name, weight = name.strip(), float(weight)
+        if not math.isfinite(weight):
+            raise ValueError(f"Weight of {name} is not a finite number")
+        if weight < 0:
+            raise ValueError(f"Weight of {name} is negative")
+        weights[name] = weight
+    return weights
+
+
+def check_weights(sources: List[str], weights: Dict[str, float]) -> None:
+    """
+    Ошибка, если у всех источников запроса нулевой вес и ансамбль
+    не из чего считать
+    """
+    if sum(weights.get(name, 1.0) for name in sources) <= 0:
+        raise ValueError(f"Ensemble weights of {', '.join(sources)} sum to zero")
+
+
+def text_to_voice(
+    text: Dict[str, float], voice_mean: Optional[Dict[str, float]] = None
+) -> Dict[str, float]:
+    """
+    Распределение по эмоциям голоса из вероятностей тональности.
+    Негатив делится между злостью и грустью в пропорции голосовых
+    моделей, без них поровну
+    """
+    # Классы тональности оцениваются независимо (сигмоида), поэтому
+    # вероятности нормируются
+    total = sum(text.values()) or 1.0
+    result = {emotion: 0.0 for emotion in (*NEGATIVE_EMOTIONS, *TEXT_TO_VOICE.values())}
+    for label, probability in text.items():
+        if label in TEXT_TO_VOICE:
+            result[TEXT_TO_VOICE[label]] += probability / total
+
+    negative = text.get("negative", 0.0) / total
+    shares = [(voice_mean or {}).get(emotion, 0.0) for emotion in NEGATIVE_EMOTIONS]
+    if sum(shares) <= 0:
+        shares = [1.0] * len(NEGATIVE_EMOTIONS)
+    for emotion, share in zip(NEGATIVE_EMOTIONS, shares):
+        result[emotion] += negative * share / sum(shares)
+    return result
+
+
+def fuse(
+    voice: Dict[str, Dict[str, float]],
+    text: Optional[Dict[str, float]],
+    weights: Dict[str, float],
+) -> Tuple[str, Dict[str, float], Dict[str, float]]:
+    """
+    Средневзвешенные вероятности эмоций по ответам моделей (имя ->
+    вероятности) и тональности текста. Источник без веса получает вес 1.
+    Возвращает эмоцию, вероятности и нормированные веса источников
+    """
+    sources = dict(voice)
+    if text is not None:
+        voice_mean = _mean(list(voice.values())) if voice else None
+        sources[TEXT_SOURCE] = text_to_voice(text, voice_mean)
+
+    used = {name: weights.get(name, 1.0) for name in sources}
+    total = sum(used.values())
+    if total <= 0:
+        raise ValueError("Ensemble weights sum to zero")
+    used = {name: weight / total for name, weight in used.items()}
+
+    probabilities: Dict[str, float] = {}
+    for name, distribution in sources.items():
+        for emotion, probability in distribution.items():
+            probabilities[emotion] = (
+                probabilities.get(emotion, 0.0) + used[name] * probability
+            )
+    emotion = max(probabilities, key=probabilities.get)
+    return emotion, probabilities, used
+
+
+def _mean(distributions: list) -> Dict[str, float]:
+    keys = {key for distribution in distributions for key in distribution}
+    return {
+        key: sum(d.get(key, 0.0) for d in distributions) / len(distributions)
+        for key in keys
+    }
@@ -0,0 +1,292 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+import config
+import metrics
+from logger import get_logger
+from registry import READY, ModelSpec, model_registry
+
+logger = get_logger(__name__)
+
+
+# Барьер процесса пула для задач, которые должны выполниться в каждом
+# процессе, см. WorkerPool.broadcast
+_barrier = None
+
+
+def _init_cpu_worker(specs: List[ModelSpec], reports, barrier) -> None:
+    """
+    Инициализатор процесса пула: замеры пересылаются в основной процесс,
+    версии моделей загружаются до первой задачи. Состояние загрузки
+    отправляется в reports
+    """
+    global _barrier
+    _barrier = barrier
+    metrics.init_worker()
+    status = {}
+    for spec in specs:
+        status[spec.key] = _load_spec(spec)[1]
+    reports.put((os.getpid(), status))
+
+
+def _load_spec(spec: ModelSpec) -> Tuple[int, dict]:
+    try:
+        model_registry.load(spec)
+    except RuntimeError:
+        pass
+    return os.getpid(), model_registry.spec_status(spec)
+
+
+def _run_synchronized(func: Callable, *args: Any) -> Any:
+    # Процесс не берёт следующую задачу, пока остальные не дошли до
+    # барьера, поэтому каждая из задач рассылки выполняется в своём процессе
+    try:
+        return func(*args)
+    finally:
+        _barrier.wait(config.MODEL_WORKER_LOAD_TIMEOUT_SECONDS)
+
+
+class WorkerPool:
+    """
+    Пулы исполнителей для блокирующих операций: потоки для ввода-вывода,
+    отдельные потоки для распознавания речи (зависший движок не занимает
+    потоки загрузки файлов), процессы для вычислений (признаки и модели)
+    """
+
+    def __init__(
+        self,
+        io_workers: int = config.IO_WORKERS,
+        asr_workers: int = config.ASR_POOL_SIZE,
+        cpu_workers: int = config.CPU_WORKERS,
+        cpu_pool_kind: str = config.CPU_POOL_KIND,
+        max_pending: int = config.MAX_PENDING_REQUESTS,
+        retry_after: int = config.RETRY_AFTER_SECONDS,
+    ):
+        self.io_workers = io_workers
+        self.asr_workers = asr_workers
+        self.cpu_workers = cpu_workers
+        self.cpu_pool_kind = cpu_pool_kind
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.rejected = 0
+        self._io_pool: Optional[Executor] = None
+        self._asr_pool: Optional[Executor] = None
+        self._cpu_pool: Optional[Executor] = None
+        self._reports = None
+        self._barrier = None
+        self._broadcast_lock = threading.Lock()
+        self._worker_models: Dict[int, Dict[str, dict]] = {}
+
+    def start(self, preload: Sequence[ModelSpec] = ()) -> None:
+        """
+        Запуск пулов. Процессы пула вычислений загружают версии preload
+        до приёма задач, см. ready()
+        """
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(
+                max_workers=self.io_workers, thread_name_prefix="io"
+            )
+        if self._asr_pool is None:
+            self._asr_pool = ThreadPoolExecutor(
+                max_workers=self.asr_workers, thread_name_prefix="asr"
+            )
+        if self._cpu_pool is None:
+            if self.cpu_pool_kind == "process":
+                # spawn вместо fork: torch и tokenizers не переживают fork
+                # после инициализации своих пулов потоков
+                context = multiprocessing.get_context("spawn")
+                self._reports = context.Queue()
+                self._barrier = context.Barrier(self.cpu_workers)
+                self._cpu_pool = ProcessPoolExecutor(
+                    max_workers=self.cpu_workers,
+                    mp_context=context,
+                    initializer=_init_cpu_worker,
+                    initargs=(list(preload), self._reports, self._barrier),
+                )
+                # Процессы создаются по мере поступления задач: пустые
+                # задачи запускают все сразу, чтобы модели загружались
+                # до первого запроса
+                for _ in range(self.cpu_workers):
+                    self._cpu_pool.submit(os.getpid)
+            else:
+                self._cpu_pool = ThreadPoolExecutor(
+                    max_workers=self.cpu_workers, thread_name_prefix="cpu"
+                )
+        logger.info(
+            f"Worker pools started: io={self.io_workers}, asr={self.asr_workers}, "
+            f"cpu={self.cpu_workers} ({self.cpu_pool_kind}), "
+            f"max pending requests={self.max_pending}"
+        )
+
+    def shutdown(self) -> None:
+        for pool in (self._io_pool, self._cpu_pool):
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        # Зависший вызов распознавания не задерживает остановку
+        if self._asr_pool is not None:
+            self._asr_pool.shutdown(wait=False, cancel_futures=True)
+        self._io_pool = None
+        self._asr_pool = None
+        self._cpu_pool = None
+        self._reports = None
+        self._barrier = None
+        self._worker_models = {}
+        logger.info("Worker pools stopped")
+
+    def acquire(self, request_id: str) -> None:
+        """
+        Занять место в очереди. При переполненной очереди запрос
+        сразу отклоняется с 503 и заголовком Retry-After
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(
+                f"{request_id}: Rejected, {self.pending} requests already pending"
+            )
+            raise HTTPException(
+                status_code=503,
+                detail="Server is overloaded, try again later",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self.pending += 1
+
+    def release(self) -> None:
+        self.pending -= 1
+
+    @asynccontextmanager
+    async def admit(self, request_id: str):
+        """
+        Допуск запроса в обработку на время блока
+        """
+        self.acquire(request_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_io(self, func: Callable, *args: Any) -> Any:
+        if self._io_pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_pool, partial(func, *args))
+
+    async def run_asr(self, func: Callable, *args: Any) -> Any:
+        if self._asr_pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._asr_pool, partial(func, *args))
+
+    async def run_cpu(self, func: Callable, *args: Any) -> Any:
+        if self._cpu_pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        if not (config.METRICS_ENABLED and self.cpu_pool_kind == "process"):
+            return await loop.run_in_executor(self._cpu_pool, partial(func, *args))
+        # Замеры этапов внутри процесса пула приходят вместе с результатом
+        result, observations = await loop.run_in_executor(
+            self._cpu_pool, partial(metrics.call_forwarding, func, *args)
+        )
+        metrics.merge(observations)
+        return result
+
+    def broadcast(self, func: Callable, *args: Any) -> List[Any]:
+        """
+        Выполнить func в каждом процессе пула вычислений и вернуть
+        результаты (блокирующий вызов). Для пула потоков func выполняется
+        один раз в основном процессе
+        """
+        if self._cpu_pool is None:
+            self.start()
+        if self.cpu_pool_kind != "process":
+            return [func(*args)]
+        with self._broadcast_lock:
+            futures = [
+                self._cpu_pool.submit(_run_synchronized, func, *args)
+                for _ in range(self.cpu_workers)
+            ]
+            wait(futures)
+            try:
+                return [future.result() for future in futures]
+            except threading.BrokenBarrierError:
+                self._barrier.reset()
+                raise TimeoutError("Pool workers did not finish in time")
+
+    def load_model(self, spec: ModelSpec) -> None:
+        """
+        Загрузить версию модели во всех процессах пула до того, как на неё
+        пойдут запросы. RuntimeError, если хотя бы в одном процессе
+        загрузка не удалась
+        """
+        results = self.broadcast(_load_spec, spec)
+        for pid, status in results:
+            if status["state"] != READY:
+                raise RuntimeError(
+                    f"Model {spec.key} failed to load in worker {pid}: "
+                    f"{status['error']}"
+                )
+        self.worker_models()
+        for pid, status in results:
+            self._worker_models.setdefault(pid, {})[spec.key] = status
+
+    def worker_models(self) -> Dict[int, Dict[str, dict]]:
+        """
+        Состояние версий моделей в процессах пула, закончивших загрузку
+        """
+        while self._reports is not None:
+            try:
+                pid, status = self._reports.get_nowait()
+            except queue.Empty:
+                break
+            self._worker_models[pid] = status
+        return dict(self._worker_models)
+
+    def loaded(self) -> bool:
+        """
+        Все процессы пула закончили загрузку моделей (успешно или нет).
+        Пул потоков использует модели основного процесса
+        """
+        if self.cpu_pool_kind != "process":
+            return True
+        return len(self.worker_models()) >= self.cpu_workers
+
+    def ready(self) -> bool:
+        """
+        Все процессы пула загрузили свои версии моделей
+        """
+        return self.loaded() and all(
+            status["state"] == READY
+            for models in self.worker_models().values()
+            for status in models.values()
+        )
+
+    def worker_pids(self) -> List[int]:
+        """
+        Идентификаторы процессов пула вычислений (пусто для пула потоков)
+        """
+        processes = getattr(self._cpu_pool, "_processes", None) or {}
+        return list(processes)
+
+    def stats(self) -> dict:
+        return {
+            "pending_requests": self.pending,
+            "max_pending_requests": self.max_pending,
+            "rejected_requests": self.rejected,
+        }
+
+
+worker_pool = WorkerPool()
@@ -0,0 +1,60 @@
+"""
+Исполнение свёрнутого графа EmotionFCNN без torch: веса (W, b) слоёв
+из fcnn_fused.npz (см. fcnn_runtime.py --export) и цепочка матричных
+умножений NumPy
+"""
+
+import os
+import tempfile
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+Layer = Tuple[np.ndarray, np.ndarray]
+
+
+def numpy_runner(layers: List[Layer]) -> Callable:
+    # Веса храним транспонированными, чтобы x @ W шёл по строкам
+    weights = [(np.ascontiguousarray(w.T), b) for w, b in layers]
+
+    def run(features: np.ndarray) -> np.ndarray:
+        x = np.asarray(features, dtype=np.float32)
+        for weight, bias in weights[:-1]:
+            x = x @ weight
+            x += bias
+            np.maximum(x, 0.0, out=x)
+        weight, bias = weights[-1]
+        return x @ weight + bias
+
+    return run
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def save_layers(path: str, layers: List[Layer]) -> None:
+    """
+    Запись во временный файл и подмена через os.replace, чтобы другие
+    процессы не прочитали наполовину записанный архив
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                **{f"w{i}": w for i, (w, _) in enumerate(layers)},
+                **{f"b{i}": b for i, (_, b) in enumerate(layers)},
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_layers(path: str) -> List[Layer]:
+    with np.load(path) as data:
+        return [(data[f"w{i}"], data[f"b{i}"]) for i in range(len(data.files) // 2)]
@@ -0,0 +1,166 @@
+"""
+Инференс-граф EmotionFCNN: BatchNorm свёрнуты в следующий Linear,
+Dropout удалены. Исполнение через замороженный TorchScript, цепочку
+матричных умножений NumPy, динамическую квантизацию int8 или bfloat16.
+
+Экспорт свёрнутых весов и TorchScript графа:
+    python fcnn_runtime.py --export
+"""
+
+import argparse
+import os
+from typing import Callable, List
+
+import numpy as np
+import torch
+from torch import nn
+
+from fcnn_numpy import Layer, numpy_runner, save_layers
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+RUNTIMES = ("eager", "torchscript", "numpy", "int8", "bf16")
+
+
+class EmotionFCNN(nn.Module):
+    def __init__(self):
+        super(EmotionFCNN, self).__init__()
+        self.net = nn.Sequential(
+            nn.Linear(26, 416),
+            nn.ReLU(),
+            nn.BatchNorm1d(416),
+            nn.Dropout(0.2),
+            nn.Linear(416, 208),
+            nn.ReLU(),
+            nn.BatchNorm1d(208),
+            nn.Dropout(0.1),
+            nn.Linear(208, 104),
+            nn.ReLU(),
+            nn.BatchNorm1d(104),
+            nn.Dropout(0.1),
+            nn.Linear(104, 52),
+            nn.ReLU(),
+            nn.BatchNorm1d(52),
+            nn.Dropout(0.1),
+            nn.Linear(52, 4),
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+
+def fold_batchnorm(model: nn.Module) -> List[Layer]:
+    """
+    Веса (W, b) линейных слоёв после свёртки BatchNorm. В EmotionFCNN
+    нормализация стоит после ReLU, поэтому она переносится во вход
+    следующего Linear: W' = W * s, b' = b + W @ (beta - mean * s),
+    где s = gamma / sqrt(var + eps)
+    """
+    layers = []
+    scale = shift = None
+    for module in model.net:
+        if isinstance(module, nn.Linear):
+            weight = module.weight.detach().double()
+            bias = module.bias.detach().double()
+            if scale is not None:
+                bias = bias + weight @ shift
+                weight = weight * scale
+                scale = shift = None
+            layers.append((weight, bias))
+        elif isinstance(module, nn.BatchNorm1d):
+            std = torch.sqrt(module.running_var.double() + module.eps)
+            scale = module.weight.detach().double() / std
+            shift = module.bias.detach().double() - module.running_mean.double() * scale
+    if scale is not None:
+        raise ValueError("BatchNorm after the last Linear cannot be folded")
+    return [
+        (weight.numpy().astype(np.float32), bias.numpy().astype(np.float32))
+        for weight, bias in layers
+    ]
+
+
+def fused_module(layers: List[Layer]) -> nn.Sequential:
+    """
+    Linear -> ReLU -> ... -> Linear из свёрнутых весов
+    """
+    modules = []
+    for weight, bias in layers:
+        linear = nn.Linear(weight.shape[1], weight.shape[0])
+        linear.weight.data = torch.from_numpy(weight.copy())
+        linear.bias.data = torch.from_numpy(bias.copy())
+        modules += [linear, nn.ReLU()]
+    return nn.Sequential(*modules[:-1]).eval()
+
+
+def freeze(module: nn.Module) -> torch.jit.ScriptModule:
+    scripted = torch.jit.freeze(torch.jit.script(module.eval()))
+    return torch.jit.optimize_for_inference(scripted)
+
+
+def _torch_runner(
+    module: Callable,
+    dtype: torch.dtype = torch.float32,
+    device: torch.device = torch.device("cpu"),
+) -> Callable:
+    def run(features: np.ndarray) -> np.ndarray:
+        x = torch.from_numpy(np.asarray(features, dtype=np.float32))
+        with torch.inference_mode():
+            return module(x.to(device, dtype)).float().cpu().numpy()
+
+    return run
+
+
+def load_runtime(runtime: str, model: nn.Module) -> Callable:
+    """
+    Функция, возвращающая логиты (numpy) по матрице признаков (n, 26)
+    """
+    if runtime == "eager":
+        device = next(model.parameters()).device
+        return _torch_runner(model.eval(), device=device)
+
+    layers = fold_batchnorm(model)
+    if runtime == "numpy":
+        return numpy_runner(layers)
+    if runtime == "torchscript":
+        return _torch_runner(freeze(fused_module(layers)))
+    if runtime == "int8":
+        quantized = torch.ao.quantization.quantize_dynamic(
+            fused_module(layers), {nn.Linear}, dtype=torch.qint8
+        )
+        return _torch_runner(quantized)
+    if runtime == "bf16":
+        return _torch_runner(fused_module(layers).to(torch.bfloat16), torch.bfloat16)
+
+    raise ValueError(f"Unknown FCNN runtime: {runtime}")
+
+
+def export(model: nn.Module, output_dir: str) -> None:
+    layers = fold_batchnorm(model)
+    os.makedirs(output_dir, exist_ok=True)
+    save_layers(os.path.join(output_dir, "fcnn_fused.npz"), layers)
+    freeze(fused_module(layers)).save(
+        os.path.join(output_dir, "fcnn_fused.torchscript.pt")
+    )
+
+
+def load_checkpoint(path: str) -> nn.Module:
+    model = EmotionFCNN()
+    model.load_state_dict(torch.load(path, map_location="cpu"))
+    return model.eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/fcnn_model.pth")
+    parser.add_argument("--output-dir", default="models")
+    parser.add_argument("--export", action="store_true")
+    args = parser.parse_args()
+
+    if args.export:
+        export(load_checkpoint(args.model), args.output_dir)
+        logger.info(f"Exported fused FCNN to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
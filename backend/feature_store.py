@@ -0,0 +1,283 @@
+"""
+Хранилище признаков: векторы float32 (26) по хэшу аудио в плоском
+файле, который читается через memmap, и индекс ключ -> строка в SQLite.
+Общее для сервиса (запись при предсказании) и пакетных инструментов.
+
+Переоценка моделями по сохранённым признакам, без исходного аудио:
+    python feature_store.py rescore --model both --output scores.jsonl
+    python feature_store.py rescore --ids ids.txt --output scores.csv
+    python feature_store.py stats
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+N_FEATURES = 26
+# Ограничение SQLite на число параметров запроса
+QUERY_CHUNK = 900
+
+
+class FeatureStore:
+    """
+    Строки признаков дописываются в features.f32 по номеру строки из
+    индекса. Номер выдаётся внутри транзакции SQLite, поэтому писать
+    могут несколько процессов; строка видна читателям только после
+    фиксации транзакции, то есть после записи её данных
+    """
+
+    def __init__(self, path: str, n_features: int = N_FEATURES):
+        self.path = path
+        self.n_features = n_features
+        self.row_bytes = n_features * 4
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, "features.f32")
+        self._lock = threading.RLock()
+        self._fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._conn = sqlite3.connect(
+            os.path.join(path, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            "row INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE)"
+        )
+        self._mmap: Optional[np.memmap] = None
+
+    def put(self, key: str, features: np.ndarray) -> None:
+        self.put_many([key], np.asarray(features).reshape(1, -1))
+
+    def put_many(self, keys: List[str], features: np.ndarray) -> int:
+        """
+        Записать строки для новых ключей, существующие не меняются.
+        Возвращает число записанных строк
+        """
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.shape != (len(keys), self.n_features):
+            raise ValueError(
+                f"Expected features of shape ({len(keys)}, {self.n_features}), "
+                f"got {features.shape}"
+            )
+        written = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, row in zip(keys, features):
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO features (key) VALUES (?)", (key,)
+                    )
+                    if cursor.rowcount:
+                        # Номера строк начинаются с 1, смещение в файле с 0
+                        offset = (cursor.lastrowid - 1) * self.row_bytes
+                        os.pwrite(self._fd, row.tobytes(), offset)
+                        written += 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return written
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Признаки формы (1, n_features) или None
+        """
+        features, found = self.get_many([key])
+        return features[:1] if found[0] else None
+
+    def get_many(self, keys: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Матрица (len(keys), n_features) и маска найденных ключей.
+        Строки ненайденных ключей заполнены нулями
+        """
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        positions = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+        unique = list(positions)
+        with self._lock:
+            for begin in range(0, len(unique), QUERY_CHUNK):
+                chunk = unique[begin : begin + QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                query = f"SELECT key, row FROM features WHERE key IN ({placeholders})"
+                for key, row in self._conn.execute(query, chunk):
+                    rows[positions[key]] = row - 1
+
+        found = rows >= 0
+        features = np.zeros((len(keys), self.n_features), dtype=np.float32)
+        if found.any():
+            # Сортировка номеров строк даёт последовательное чтение файла
+            order = np.argsort(rows[found], kind="stable")
+            indices = np.flatnonzero(found)[order]
+            features[indices] = self._rows(int(rows.max()) + 1)[rows[indices]]
+        return features, found
+
+    def iter_batches(
+        self, batch_size: int = 65536
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """
+        Все (ключи, признаки) порциями в порядке записи
+        """
+        last = 0
+        while True:
+            with self._lock:
+                batch = self._conn.execute(
+                    "SELECT row, key FROM features WHERE row > ? ORDER BY row LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not batch:
+                return
+            last = batch[-1][0]
+            rows = np.array([row - 1 for row, _ in batch])
+            yield [key for _, key in batch], np.array(self._rows(last)[rows])
+
+    def _rows(self, count: int) -> np.memmap:
+        """
+        Отображение файла, содержащее не менее count строк. Файл только
+        растёт, поэтому отображение пересоздаётся лишь при нехватке строк
+        """
+        if self._mmap is None or len(self._mmap) < count:
+            available = os.fstat(self._fd).st_size // self.row_bytes
+            if available < count:
+                raise IOError(f"Feature store data is shorter than {count} rows")
+            self._mmap = np.memmap(
+                self.data_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(available, self.n_features),
+            )
+        return self._mmap
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            query = "SELECT 1 FROM features WHERE key = ?"
+            return self._conn.execute(query, (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        # Строки не удаляются, поэтому их число равно последнему номеру
+        with self._lock:
+            query = "SELECT COALESCE(MAX(row), 0) FROM features"
+            return self._conn.execute(query).fetchone()[0]
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "mode": config.FEATURE_STORE_MODE,
+            "entries": len(self),
+            "data_bytes": os.fstat(self._fd).st_size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._mmap = None
+            self._conn.close()
+            os.close(self._fd)
+
+
+def open_store() -> Optional[FeatureStore]:
+    if config.FEATURE_STORE_MODE == "off":
+        return None
+    try:
+        return FeatureStore(config.FEATURE_STORE_PATH)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Feature store is unavailable: {e}")
+        return None
+
+
+feature_store = open_store()
+
+
+def _read_ids(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _chunks(keys: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for key in keys:
+        chunk.append(key)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rescore(args: argparse.Namespace) -> None:
+    from bulk_score import FORMATS, ResultWriter, predict_rows, result_columns
+
+    store = FeatureStore(args.store)
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".") or "jsonl"
+    if fmt not in FORMATS:
+        raise SystemExit(f"Unknown output format: {fmt}")
+    model_names = ["rf", "fcnn"] if args.model == "both" else [args.model]
+    writer = ResultWriter(args.output, fmt, result_columns(model_names, False))
+
+    if args.ids:
+        batches = (
+            (keys, *store.get_many(keys))
+            for keys in _chunks(_read_ids(args.ids), args.batch_size)
+        )
+    else:
+        batches = (
+            (keys, features, np.ones(len(keys), dtype=bool))
+            for keys, features in store.iter_batches(args.batch_size)
+        )
+
+    missing = 0
+    for keys, features, found in batches:
+        missing += int((~found).sum())
+        batch = [
+            (
+                key,
+                None,
+                {
+                    "features": row.reshape(1, -1) if ok else None,
+                    "duration": None,
+                    "text": None,
+                    "error": None if ok else "Features not in store",
+                },
+            )
+            for key, row, ok in zip(keys, features, found)
+        ]
+        writer.write(predict_rows(batch, model_names, with_text=False))
+        logger.info(f"Rescored {writer.rows} rows ({missing} ids not in store)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=("rescore", "stats"))
+    parser.add_argument("--store", default=config.FEATURE_STORE_PATH)
+    parser.add_argument("--ids", help="Файл с хэшами аудио, по одному в строке")
+    parser.add_argument("--output")
+    parser.add_argument("--format")
+    parser.add_argument("--model", choices=("rf", "fcnn", "both"), default="rf")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        store = FeatureStore(args.store)
+        logger.info(f"{len(store)} vectors in {args.store}")
+    else:
+        if not args.output:
+            parser.error("--output is required for rescore")
+        rescore(args)
+
+
+if __name__ == "__main__":
+    main()
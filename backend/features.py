@@ -0,0 +1,323 @@
+import threading
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import librosa
+import numpy as np
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window, savgol_filter
+
+N_FEATURES = 26
+
+
+@lru_cache(maxsize=32)
+def delta_mean_weights(n_frames: int, width: int) -> np.ndarray:
+    """
+    Веса кадров, дающие среднее дельт savgol одной свёрткой:
+    дельта линейна по кадрам, поэтому mean(delta) = w @ frames.
+    Внутренние веса взаимно сокращаются, ненулевыми остаются
+    только первые и последние width кадров
+    """
+    operator = savgol_filter(
+        np.eye(n_frames), width, polyorder=1, deriv=1, axis=0, mode="interp"
+    )
+    return operator.mean(axis=0).astype(np.float32)
+
+
+class MFCCExtractor:
+    """
+    Извлечение 26 признаков (средние MFCC и средние дельты MFCC),
+    численно совпадающее с librosa.feature.mfcc + librosa.feature.delta.
+    Оконная функция, мел-фильтры и матрица DCT считаются один раз,
+    буферы кадров переиспользуются между вызовами в пределах потока
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 22050,
+        n_mfcc: int = 13,
+        n_mels: int = 128,
+        n_fft: int = 2048,
+        hop_length: int = 512,
+        delta_width: int = 9,
+        top_db: float = 80.0,
+        amin: float = 1e-10,
+    ):
+        self.sample_rate = sample_rate
+        self.n_mfcc = n_mfcc
+        self.n_mels = n_mels
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.delta_width = delta_width
+        self.top_db = top_db
+        self.amin = amin
+        # DCT-II с нормировкой ortho, как в librosa.feature.mfcc
+        dct = scipy.fft.dct(np.eye(n_mels), type=2, norm="ortho", axis=0)
+        self._dct_t = np.ascontiguousarray(dct[:n_mfcc].T, dtype=np.float32)
+        self._local = threading.local()
+
+    @lru_cache(maxsize=8)
+    def _plan(self, n_fft: int) -> Tuple[np.ndarray, np.ndarray]:
+        window = get_window("hann", n_fft, fftbins=True).astype(np.float32)
+        mel_basis = librosa.filters.mel(
+            sr=self.sample_rate, n_fft=n_fft, n_mels=self.n_mels
+        )
+        return window, np.ascontiguousarray(mel_basis.T, dtype=np.float32)
+
+    def _buffer(self, name: str, size: int) -> np.ndarray:
+        buffer = getattr(self._local, name, None)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=np.float32)
+            setattr(self._local, name, buffer)
+        return buffer[:size]
+
+    def frame_params(self, n_samples: int) -> Tuple[int, int]:
+        """
+        Размер окна и шаг, которые использует one-shot извлечение
+        для сигнала заданной длины
+        """
+        return min(self.n_fft, n_samples), min(self.hop_length, n_samples // 4)
+
+    def log_mel_frames(
+        self, frames: np.ndarray, n_fft: int, out: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Лог-мел спектр (в дБ, без обрезки top_db) для уже нарезанных кадров
+        формы (..., n_fft). Результат формы (..., n_mels)
+        """
+        window, mel_basis_t = self._plan(n_fft)
+        if out is None:
+            out = np.empty(frames.shape, dtype=np.float32)
+        np.multiply(frames, window, out=out)
+        spectrum = scipy.fft.rfft(out, axis=-1, overwrite_x=True)
+        power = np.square(spectrum.real)
+        power += np.square(spectrum.imag)
+        mel = power @ mel_basis_t
+        np.maximum(mel, self.amin, out=mel)
+        np.log10(mel, out=mel)
+        mel *= 10.0
+        return mel
+
+    def _log_mel(self, signals: np.ndarray, n_fft: int, hop: int) -> np.ndarray:
+        n_signals, n_samples = signals.shape
+        pad = n_fft // 2
+        padded = self._buffer("padded", n_signals * (n_samples + 2 * pad))
+        padded = padded.reshape(n_signals, n_samples + 2 * pad)
+        padded[:, :pad] = 0.0
+        padded[:, pad + n_samples :] = 0.0
+        padded[:, pad : pad + n_samples] = signals
+
+        frames = sliding_window_view(padded, n_fft, axis=1)[:, ::hop]
+        out = self._buffer("frames", frames.shape[0] * frames.shape[1] * n_fft)
+        return self.log_mel_frames(frames, n_fft, out.reshape(frames.shape))
+
+    def clip_top_db(self, log_mel: np.ndarray) -> np.ndarray:
+        """
+        Обрезка динамического диапазона как в librosa.power_to_db
+        (максимум берётся по каждому сигналу отдельно)
+        """
+        floor = log_mel.max(axis=(-2, -1), keepdims=True) - self.top_db
+        return np.maximum(log_mel, floor, out=log_mel)
+
+    def delta_width_for(self, n_frames: int) -> int:
+        width = min(self.delta_width, n_frames)
+        if width % 2 == 0:
+            width -= 1
+        width = max(width, 1)
+        if width < 3:
+            raise ValueError(f"Audio is too short: {n_frames} frames for delta")
+        return width
+
+    def summarize(self, mfcc: np.ndarray) -> np.ndarray:
+        """
+        Средние MFCC и дельт по кадрам для массива формы (..., frames, n_mfcc)
+        """
+        width = self.delta_width_for(mfcc.shape[-2])
+        delta = savgol_filter(mfcc, width, polyorder=1, deriv=1, axis=-2, mode="interp")
+        return np.concatenate(
+            [mfcc.mean(axis=-2), delta.mean(axis=-2)], axis=-1
+        ).astype(np.float32)
+
+    def dct(self, log_mel: np.ndarray) -> np.ndarray:
+        """
+        MFCC из лог-мел спектра (..., n_mels) после обрезки top_db
+        """
+        return log_mel @ self._dct_t
+
+    def mfcc(self, signals: np.ndarray) -> np.ndarray:
+        """
+        MFCC для пачки сигналов одинаковой длины формы (n, samples).
+        Результат формы (n, frames, n_mfcc)
+        """
+        n_fft, hop = self.frame_params(signals.shape[-1])
+        log_mel = self.clip_top_db(self._log_mel(signals, n_fft, hop))
+        return self.dct(log_mel)
+
+    def extract(self, audio_data: np.ndarray) -> np.ndarray:
+        """
+        Вектор из 26 признаков для одного сигнала
+        """
+        signals = np.asarray(audio_data, dtype=np.float32).reshape(1, -1)
+        return self.summarize(self.mfcc(signals))[0]
+
+    def extract_batch(self, signals: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Матрица признаков (n, 26) для нескольких сигналов. Сигналы
+        одинаковой длины обрабатываются одним векторизованным вызовом
+        """
+        result = np.empty((len(signals), N_FEATURES), dtype=np.float32)
+        by_length = {}
+        for idx, signal in enumerate(signals):
+            by_length.setdefault(len(signal), []).append(idx)
+        for indices in by_length.values():
+            group = np.stack([np.asarray(signals[i], np.float32) for i in indices])
+            result[indices] = self.summarize(self.mfcc(group))
+        return result
+
+
+class MFCCAccumulator:
+    """
+    Потоковое извлечение тех же 26 признаков, что и MFCCExtractor.extract,
+    без хранения всего сигнала: update(chunk) принимает очередной кусок,
+    finalize() возвращает вектор признаков.
+
+    Между кусками переносится только перекрытие кадров. Средние дельт
+    зависят лишь от первых и последних width кадров, которые хранятся
+    целиком. Для обрезки top_db, порог которой известен только в конце,
+    по каждому мел-фильтру ведётся гистограмма значений (число и сумма
+    в корзине): точна сумма во всех корзинах, кроме той, где проходит
+    порог. Короткие сигналы считаются one-shot по буферу
+    """
+
+    def __init__(
+        self,
+        extractor: MFCCExtractor,
+        hist_step: float = 0.5,
+        hist_max: float = 200.0,
+        flush_frames: int = 256,
+    ):
+        self.extractor = extractor
+        self.n_fft = extractor.n_fft
+        self.hop = extractor.hop_length
+        self.pad = self.n_fft // 2
+        self.width = extractor.delta_width_for(extractor.delta_width)
+        edge_weights = delta_mean_weights(2 * self.width, self.width) * 2 * self.width
+        self._left_weights = edge_weights[: self.width]
+        self._right_weights = edge_weights[self.width :]
+        # До этой длины сигнал копится целиком и считается one-shot
+        self.min_samples = 4 * self.width * self.hop + self.n_fft
+
+        self.hist_min = 10.0 * np.log10(extractor.amin)
+        self.hist_step = hist_step
+        n_bins = int(np.ceil((hist_max - self.hist_min) / hist_step))
+        self._counts = np.zeros((extractor.n_mels, n_bins), dtype=np.float64)
+        self._sums = np.zeros((extractor.n_mels, n_bins), dtype=np.float64)
+        self._max = -np.inf
+        self.flush_frames = flush_frames
+        self._pending = []
+        self._pending_frames = 0
+
+        self.total = 0
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._head_samples = None
+        self._next_frame = self.pad // self.hop
+        self._head = np.zeros((self.width, extractor.n_mels), dtype=np.float32)
+        self._tail = np.zeros((self.width, extractor.n_mels), dtype=np.float32)
+        self._n_frames = 0
+
+    def update(self, chunk: np.ndarray) -> None:
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        self._buffer = np.concatenate([self._buffer, chunk])
+        self.total += len(chunk)
+        if self.total < self.min_samples:
+            return
+        if self._head_samples is None:
+            self._head_samples = self._buffer[: self.n_fft].copy()
+
+        # Кадры, целиком лежащие в уже полученном сигнале
+        last_frame = (self.total - self.pad) // self.hop
+        count = last_frame - self._next_frame + 1
+        if count <= 0:
+            return
+        frames = sliding_window_view(self._buffer, self.n_fft)[:: self.hop][:count]
+        self._add(self.extractor.log_mel_frames(frames, self.n_fft), self._next_frame)
+        self._next_frame += count
+        self._buffer = self._buffer[count * self.hop :]
+
+    def finalize(self) -> np.ndarray:
+        if self._head_samples is None:
+            return self.extractor.extract(self._buffer)
+
+        # Краевые кадры с нулевым дополнением, как при center=True
+        zeros = np.zeros(self.pad, dtype=np.float32)
+        left = np.concatenate([zeros, self._head_samples])
+        n_left = self.pad // self.hop
+        frames = sliding_window_view(left, self.n_fft)[:: self.hop][:n_left]
+        self._add(self.extractor.log_mel_frames(frames, self.n_fft), 0)
+
+        right = np.concatenate([self._buffer, zeros])
+        n_right = self.total // self.hop - self._next_frame + 1
+        frames = sliding_window_view(right, self.n_fft)[:: self.hop][:n_right]
+        self._add(self.extractor.log_mel_frames(frames, self.n_fft), self._next_frame)
+
+        self._flush()
+        floor = self._max - self.extractor.top_db
+        edges = self.hist_min + self.hist_step * np.arange(self._counts.shape[1] + 1)
+        above = edges[:-1] >= floor
+        below = edges[1:] <= floor
+        inside = ~(above | below)
+        clipped_sum = (
+            (self._sums * above).sum(axis=1)
+            + (self._counts * below).sum(axis=1) * floor
+            + np.maximum(self._sums, self._counts * floor)[:, inside].sum(axis=1)
+        )
+        mel_mean = clipped_sum / self._n_frames
+
+        delta_sum = self._left_weights @ np.maximum(
+            self._head, floor
+        ) + self._right_weights @ np.maximum(self._tail, floor)
+        means = np.stack([mel_mean, delta_sum / self._n_frames])
+        return self.extractor.dct(means.astype(np.float32)).reshape(-1)
+
+    def _flush(self) -> None:
+        """
+        Перенос накопленных кадров в гистограммы одним вызовом bincount
+        """
+        if not self._pending:
+            return
+        log_mel = np.concatenate(self._pending)
+        self._pending = []
+        self._pending_frames = 0
+        n_bins = self._counts.shape[1]
+        bins = ((log_mel - self.hist_min) / self.hist_step).astype(np.int64)
+        np.clip(bins, 0, n_bins - 1, out=bins)
+        flat = (bins + np.arange(log_mel.shape[1]) * n_bins).reshape(-1)
+        size = self._counts.size
+        self._counts += np.bincount(flat, minlength=size).reshape(self._counts.shape)
+        self._sums += np.bincount(
+            flat, weights=log_mel.reshape(-1), minlength=size
+        ).reshape(self._sums.shape)
+
+    def _add(self, log_mel: np.ndarray, first_frame: int) -> None:
+        """
+        Учёт кадров first_frame, first_frame + 1, ... в статистиках
+        """
+        n_frames = len(log_mel)
+        if n_frames == 0:
+            return
+        self._n_frames += n_frames
+        self._max = max(self._max, float(log_mel.max()))
+
+        self._pending.append(log_mel)
+        self._pending_frames += n_frames
+        if self._pending_frames >= self.flush_frames:
+            self._flush()
+
+        if first_frame < self.width:
+            head = log_mel[: self.width - first_frame]
+            self._head[first_frame : first_frame + len(head)] = head
+        # Левые краевые кадры приходят последними, но в хвост не попадают:
+        # one-shot путь гарантирует больше 2 * width кадров
+        if first_frame > 0:
+            self._tail = np.concatenate([self._tail, log_mel])[-self.width :]
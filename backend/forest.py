@@ -0,0 +1,201 @@
+"""
+Компиляция обученного RandomForestClassifier в плоские массивы NumPy
+и векторизованный расчёт вероятностей за один проход по лесу.
+
+Конвертация pickle в формат для mmap:
+    python forest.py
+"""
+
+import argparse
+import json
+import os
+import pickle
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+import numpy as np
+import pandas as pd
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "classes")
+
+
+class FlatForest:
+    """
+    Лес решающих деревьев в виде общих массивов узлов: индекс признака,
+    порог, левый и правый потомок, распределение классов в листе.
+    Листья ссылаются сами на себя, поэтому спуск по всем деревьям
+    выполняется одинаковым числом шагов без ветвлений
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        classes: np.ndarray,
+        max_depth: int,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, forest) -> "FlatForest":
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes, dtype=np.int32) + offset
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            # В sklearn 1.4+ value уже хранит доли классов, и predict_proba
+            # усредняет их без повторной нормировки
+            values.append(tree.value[:, 0, :].astype(np.float64))
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n_nodes
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=np.asarray(forest.classes_),
+            max_depth=max_depth,
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Каждый файл пишется во временный рядом и подменяется через
+        os.replace: процессы, уже отобразившие прежние массивы в память,
+        продолжают читать старые файлы. meta.json пишется последним
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            array = self.classes_ if name == "classes" else getattr(self, name)
+            with _replace(os.path.join(path, f"{name}.npy")) as f:
+                np.save(f, np.ascontiguousarray(array))
+        with _replace(os.path.join(path, "meta.json")) as f:
+            f.write(json.dumps({"max_depth": int(self.max_depth)}).encode())
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "FlatForest":
+        """
+        Загрузка с отображением файлов в память: воркеры на одной машине
+        разделяют одну копию массивов через page cache
+        """
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAYS
+        }
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(max_depth=meta["max_depth"], **arrays)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Индексы листьев формы (n_trees, n_samples)
+        """
+        # sklearn сравнивает признаки в float32 с порогами в float64
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])
+        nodes = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], self.value.shape[1]), dtype=np.float64)
+        # Суммирование по деревьям в том же порядке, что и в sklearn,
+        # чтобы вероятности совпадали побитово
+        for tree_leaves in leaves:
+            proba += self.value[tree_leaves]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+@contextmanager
+def _replace(path: str) -> Iterator[BinaryIO]:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def sample_features(flat: FlatForest, n_features: int, n_samples: int) -> np.ndarray:
+    """
+    Случайные признаки в диапазоне порогов леса, чтобы проверка
+    проходила по всем ветвям, а не только по крайним
+    """
+    rng = np.random.default_rng(0)
+    is_split = flat.left != np.arange(len(flat.left))
+    X = np.empty((n_samples, n_features), dtype=np.float32)
+    for f in range(n_features):
+        thresholds = flat.threshold[is_split & (flat.feature == f)]
+        low, high = (thresholds.min(), thresholds.max()) if len(thresholds) else (0, 0)
+        X[:, f] = rng.uniform(low - 1, high + 1, size=n_samples)
+    return X
+
+
+def check_agreement(forest, flat: FlatForest, X: np.ndarray) -> dict:
+    frame = pd.DataFrame(X, columns=getattr(forest, "feature_names_in_", None))
+    expected = forest.predict_proba(frame)
+    actual = flat.predict_proba(X)
+    return {
+        "samples": len(X),
+        "labels_equal": bool(
+            np.array_equal(forest.predict(frame), flat.classes_[actual.argmax(axis=1)])
+        ),
+        "probabilities_equal": bool(np.array_equal(expected, actual)),
+        "max_abs_diff": float(np.abs(expected - actual).max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/random_forest_model.pkl")
+    parser.add_argument("--output", default="models/random_forest_flat")
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        forest = pickle.load(f)
+    flat = FlatForest.from_sklearn(forest)
+    flat.save(args.output)
+    logger.info(
+        f"Saved {len(flat.roots)} trees, {len(flat.feature)} nodes to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Определение формата аудио по сигнатуре и длительности по заголовку
+на первых байтах файла, до того как он загружен целиком
+"""
+
+import struct
+from typing import Optional
+
+# Первых байт достаточно для сигнатуры и заголовков WAV и FLAC
+HEAD_BYTES = 64 * 1024
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """
+    Формат по сигнатуре. None - содержимое не похоже на аудио
+    """
+    if head[:4] in (b"RIFF", b"RF64") and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[:5] == b"#!AMR":
+        return "amr"
+    if head[:4] == b"caff":
+        return "caf"
+    if head[:4] == b"\x30\x26\xb2\x75":
+        return "asf"
+    # MP3 с тегом ID3 или без него, ADTS AAC: кадр начинается
+    # с 11 единичных бит синхронизации
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] >= 0xE0):
+        return "mpeg"
+    return None
+
+
+def header_duration(audio_format: str, head: bytes) -> Optional[float]:
+    """
+    Длительность по заголовку WAV или FLAC. None, если заголовок
+    не содержит длины (потоковая запись) или не поместился в head
+    """
+    try:
+        if audio_format == "wav":
+            return _wav_duration(head)
+        if audio_format == "flac":
+            return _flac_duration(head)
+    except struct.error:
+        pass
+    return None
+
+
+def _wav_duration(head: bytes) -> Optional[float]:
+    byte_rate = None
+    position = 12
+    while position + 8 <= len(head):
+        chunk_id, size = struct.unpack_from("<4sI", head, position)
+        if chunk_id == b"fmt ":
+            (byte_rate,) = struct.unpack_from("<I", head, position + 16)
+        elif chunk_id == b"data":
+            # Размер 0 или 0xFFFFFFFF пишут при записи в поток и в RF64
+            if not byte_rate or size in (0, 0xFFFFFFFF):
+                return None
+            return size / byte_rate
+        position += 8 + size + size % 2
+    return None
+
+
+def _flac_duration(head: bytes) -> Optional[float]:
+    # STREAMINFO - первый блок метаданных: частота (20 бит), каналы,
+    # разрядность и число отсчётов (36 бит)
+    (info,) = struct.unpack_from(">Q", head, 18)
+    sample_rate = info >> 44
+    total_samples = info & ((1 << 36) - 1)
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / sample_rate
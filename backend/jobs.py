@@ -0,0 +1,800 @@
+"""
+Асинхронные задачи для тяжёлых запросов (длинные записи, архивы,
+медленное распознавание речи): очередь в SQLite и процессы-обработчики,
+которые используют те же AudioProcessor и модели, что и сервис.
+
+Обработчик берёт задачу в аренду и продлевает её, пока работает. Если
+процесс пропал, аренда истекает и задача возвращается в очередь.
+Ошибка повторяется с экспоненциальной задержкой до max_attempts попыток.
+Частичные результаты сохраняются по мере готовности и видны клиенту
+до завершения задачи.
+
+Обработчики отдельно от сервиса, состояние и очистка очереди:
+    python jobs.py worker --processes 2
+    python jobs.py stats
+    python jobs.py purge --days 7
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+KINDS = ("predict", "batch", "long")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Результаты пишутся порциями: каждая порция сразу видна клиенту
+BATCH_CHUNK_FILES = 16
+LONG_CHUNK_SEGMENTS = 32
+WEBHOOK_ATTEMPTS = 3
+
+# Размер входного файла задачи, как у синхронных запросов
+INPUT_MAX_BYTES = {
+    "predict": config.UPLOAD_MAX_BYTES,
+    "batch": config.BATCH_MAX_BYTES,
+    "long": config.LONG_MAX_BYTES,
+}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def check_webhook(url: str) -> None:
+    """
+    ValueError, если url не http(s) адрес с именем хоста, который
+    примет urllib при отправке
+    """
+    try:
+        parts = urllib.parse.urlsplit(url)
+        valid = parts.scheme in ("http", "https") and bool(parts.hostname)
+        parts.port
+    except ValueError:
+        valid = False
+    if not valid or any(c.isspace() or not c.isprintable() for c in url):
+        raise ValueError("Webhook must be an http(s) URL")
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """
+    Ограничения по типам задач из строки вида "predict=4,long=1"
+    """
+    limits = {}
+    for item in value.split(","):
+        if item.strip():
+            kind, _, limit = item.partition("=")
+            limits[kind.strip()] = int(limit)
+    return limits
+
+
+class JobQueue:
+    """
+    Задачи и их частичные результаты в SQLite, входные файлы в каталоге
+    inputs/<id>. Выдача задачи, проверка ограничений по типам и возврат
+    задач с истёкшей арендой выполняются в одной транзакции, поэтому
+    очередь можно разбирать из любого числа процессов
+    """
+
+    def __init__(self, path: str = config.JOBS_PATH):
+        self.path = path
+        self.inputs_path = os.path.join(path, "inputs")
+        os.makedirs(self.inputs_path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(path, "jobs.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                webhook TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                not_before REAL NOT NULL,
+                lease_until REAL,
+                worker TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                progress REAL NOT NULL DEFAULT 0,
+                results INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue
+                ON jobs (status, priority DESC, created_at);
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                item TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+            """)
+
+    def input_dir(self, job_id: str) -> str:
+        return os.path.join(self.inputs_path, job_id)
+
+    def submit(
+        self,
+        kind: str,
+        params: dict,
+        files: List[Tuple[str, str, BinaryIO]],
+        priority: int = 0,
+        max_attempts: int = config.JOB_MAX_ATTEMPTS,
+        webhook: Optional[str] = None,
+    ) -> str:
+        """
+        Поставить задачу в очередь. files - (имя, тип содержимого, файл),
+        файлы копируются на диск до записи задачи. Размер ограничен
+        INPUT_MAX_BYTES (для batch - суммарный), формат проверяется
+        по содержимому
+        """
+        from utils import check_job_input, copy_limited
+
+        if kind not in KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if webhook is not None:
+            check_webhook(webhook)
+        job_id = str(uuid.uuid4())
+        directory = self.input_dir(job_id)
+        os.makedirs(directory)
+        inputs = []
+        used = 0
+        try:
+            for i, (name, content_type, fileobj) in enumerate(files):
+                stored = f"{i:05d}"
+                path = os.path.join(directory, stored)
+                size = copy_limited(job_id, fileobj, path, INPUT_MAX_BYTES[kind], used)
+                if kind == "batch":
+                    used += size
+                check_job_input(job_id, path, content_type)
+                inputs.append([name or stored, stored, content_type])
+            now = time.time()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, status, priority, params, webhook, "
+                    "max_attempts, not_before, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id,
+                        kind,
+                        QUEUED,
+                        priority,
+                        json.dumps({**params, "files": inputs}),
+                        webhook,
+                        min(max(max_attempts, 1), config.JOB_MAX_ATTEMPTS_LIMIT),
+                        now,
+                        now,
+                    ),
+                )
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return job_id
+
+    def claim(self, worker: str, limits: Dict[str, int]) -> Optional[dict]:
+        """
+        Взять в аренду задачу с наибольшим приоритетом среди типов,
+        у которых не исчерпано ограничение одновременных задач
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire_leases(now)
+                running = dict(
+                    self._conn.execute(
+                        "SELECT kind, COUNT(*) FROM jobs WHERE status = ? "
+                        "GROUP BY kind",
+                        (RUNNING,),
+                    ).fetchall()
+                )
+                kinds = [k for k in KINDS if running.get(k, 0) < limits.get(k, 1)]
+                row = None
+                if kinds:
+                    placeholders = ",".join("?" * len(kinds))
+                    row = self._conn.execute(
+                        f"SELECT id FROM jobs WHERE status = ? AND not_before <= ? "
+                        f"AND kind IN ({placeholders}) "
+                        f"ORDER BY priority DESC, created_at LIMIT 1",
+                        (QUEUED, now, *kinds),
+                    ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, "
+                        "attempts = attempts + 1, "
+                        "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                        (RUNNING, worker, now + config.JOB_LEASE_SECONDS, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0], limit=0) if row is not None else None
+
+    def _expire_leases(self, now: float) -> None:
+        expired = self._conn.execute(
+            "SELECT id FROM jobs WHERE status = ? AND lease_until < ?",
+            (RUNNING, now),
+        ).fetchall()
+        for (job_id,) in expired:
+            logger.warning(f"{job_id}: Job lease expired, worker is lost")
+            self._retry_or_fail(job_id, "Worker lost", now)
+
+    def _retry_or_fail(self, job_id: str, error: str, now: float) -> str:
+        job = self._conn.execute(
+            "SELECT attempts, max_attempts, cancel_requested FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if job["cancel_requested"]:
+            status, not_before = CANCELLED, now
+        elif job["attempts"] < job["max_attempts"]:
+            delay = config.JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+            status, not_before = QUEUED, now + delay
+        else:
+            status, not_before = FAILED, now
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, not_before = ?, error = ?, worker = NULL, "
+            "lease_until = NULL, finished_at = ? WHERE id = ?",
+            (status, not_before, error, now if status in FINISHED else None, job_id),
+        )
+        if status in FINISHED:
+            shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+        return status
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """
+        Продлить аренду. False - задачу отменили или аренда потеряна
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? "
+                "WHERE id = ? AND worker = ? AND status = ? AND cancel_requested = 0",
+                (time.time() + config.JOB_LEASE_SECONDS, job_id, worker, RUNNING),
+            )
+            return cursor.rowcount > 0
+
+    def report(
+        self, job_id: str, worker: str, progress: float, items: List[dict]
+    ) -> bool:
+        """
+        Дописать частичные результаты и прогресс. False - задачу
+        отменили или аренда потеряна, работу нужно прекратить
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._conn.execute(
+                    "SELECT results FROM jobs WHERE id = ? AND worker = ? "
+                    "AND status = ? AND cancel_requested = 0",
+                    (job_id, worker, RUNNING),
+                ).fetchone()
+                if job is not None:
+                    self._conn.executemany(
+                        "INSERT INTO job_results VALUES (?, ?, ?)",
+                        [
+                            (job_id, job["results"] + i + 1, json.dumps(item))
+                            for i, item in enumerate(items)
+                        ],
+                    )
+                    self._conn.execute(
+                        "UPDATE jobs SET results = results + ?, progress = ? "
+                        "WHERE id = ?",
+                        (len(items), progress, job_id),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job is not None
+
+    def clear_results(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            self._conn.execute(
+                "UPDATE jobs SET results = 0, progress = 0 WHERE id = ?", (job_id,)
+            )
+            self._conn.execute("COMMIT")
+
+    def complete(self, job_id: str, worker: str, result: Optional[dict]) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = 1, result = ?, error = NULL, "
+                "worker = NULL, lease_until = NULL, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(result), now, job_id, worker, RUNNING),
+            )
+        # Аренда могла истечь, и задачу уже выполняет другой обработчик:
+        # его входные файлы трогать нельзя
+        if cursor.rowcount == 0:
+            return False
+        shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+        return True
+
+    def fail(self, job_id: str, worker: str, error: str) -> Optional[str]:
+        """
+        Ошибка попытки: повтор с задержкой, отмена или окончательный
+        отказ. None, если задача уже не принадлежит обработчику
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                owned = self._conn.execute(
+                    "SELECT 1 FROM jobs WHERE id = ? AND worker = ? AND status = ?",
+                    (job_id, worker, RUNNING),
+                ).fetchone()
+                status = (
+                    self._retry_or_fail(job_id, error, time.time()) if owned else None
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return status
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Отмена: задача из очереди снимается сразу, выполняемая
+        останавливается обработчиком на следующей порции результатов
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._conn.execute(
+                    "SELECT status FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+                status = job["status"] if job is not None else None
+                if status == QUEUED:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                        (CANCELLED, time.time(), job_id),
+                    )
+                    status = CANCELLED
+                elif status == RUNNING:
+                    self._conn.execute(
+                        "UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if status == CANCELLED:
+            shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+        return status
+
+    def get(
+        self, job_id: str, after: int = 0, limit: Optional[int] = None
+    ) -> Optional[dict]:
+        """
+        Состояние задачи и её результаты с номерами больше after
+        (не больше limit штук)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            items = []
+            if limit != 0:
+                items = self._conn.execute(
+                    "SELECT seq, item FROM job_results WHERE job_id = ? AND seq > ? "
+                    "ORDER BY seq LIMIT ?",
+                    (job_id, after, -1 if limit is None else limit),
+                ).fetchall()
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["items"] = [json.loads(item) for _, item in items]
+        job["next_after"] = items[-1][0] if items else after
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"
+            ).fetchall()
+        counts = {kind: {} for kind in KINDS}
+        for kind, status, count in rows:
+            counts.setdefault(kind, {})[status] = count
+        return counts
+
+    def purge(self, older_than: float) -> int:
+        """
+        Удалить завершённые задачи, закончившиеся раньше older_than
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            ids = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT id FROM jobs WHERE finished_at < ? AND status IN (?, ?, ?)",
+                    (older_than, *FINISHED),
+                ).fetchall()
+            ]
+            for job_id in ids:
+                self._conn.execute(
+                    "DELETE FROM job_results WHERE job_id = ?", (job_id,)
+                )
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.execute("COMMIT")
+        for job_id in ids:
+            shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+        return len(ids)
+
+
+job_queue = JobQueue()
+
+
+def _model_names(params: dict) -> List[str]:
+    return ["rf", "fcnn"] if params["model"] == "both" else [params["model"]]
+
+
+def _clips(job: dict) -> List[Tuple[str, str]]:
+    """
+    Аудиофайлы задачи (имя, путь). Архивы распаковываются рядом
+    с входными файлами с теми же ограничениями числа файлов и размера,
+    что у /api/predict_batch
+    """
+    from utils import check_batch_clips, extract_members, iter_archive
+
+    directory = job_queue.input_dir(job["id"])
+    clips = []
+    used = 0
+    for name, stored, content_type in job["params"]["files"]:
+        path = os.path.join(directory, stored)
+        if content_type and content_type.startswith("audio/"):
+            check_batch_clips(len(clips) + 1)
+            clips.append((name, path))
+            used += os.path.getsize(path)
+            continue
+        with open(path, "rb") as f:
+            members = iter_archive(job["id"], f)
+            used = extract_members(job["id"], members, path, clips, used)
+    return clips
+
+
+def score_clips(job: dict, report: Callable) -> dict:
+    """
+    predict и batch: предсказание для каждого файла (в архивах - для
+    каждого аудио). Результат помечается clip - именем сохранённого
+    файла, по нему при повторной попытке пропускаются уже оценённые
+    файлы (отображаемые имена могут совпадать)
+    """
+    from bulk_score import predict_rows, score_file
+    from utils import MAX_DURATION_SECONDS
+
+    params = job["params"]
+    model_names = _model_names(params)
+    with_text = params.get("check_text", False)
+    clips = _clips(job)
+    done = {item["clip"] for item in job_queue.get(job["id"])["items"]}
+    pending = [
+        (name, path) for name, path in clips if os.path.basename(path) not in done
+    ]
+    processed = len(clips) - len(pending)
+
+    for begin in range(0, len(pending), BATCH_CHUNK_FILES):
+        chunk = pending[begin : begin + BATCH_CHUNK_FILES]
+        batch = [
+            (name, path, score_file(path, with_text, MAX_DURATION_SECONDS))
+            for name, path in chunk
+        ]
+        rows = predict_rows(batch, model_names, with_text)
+        for row in rows:
+            row["clip"] = os.path.basename(row.pop("path"))
+        processed += len(chunk)
+        report(rows, processed / len(clips))
+    return {"files": len(clips)}
+
+
+def score_long(job: dict, report: Callable) -> dict:
+    """
+    long: хронология эмоций по фрагментам речи длинной записи и сводка.
+    Фрагменты оцениваются порциями и сразу видны как частичные результаты
+    """
+    import soundfile as sf
+
+    from audio_processing import audio_processor
+    from models import predict_voice_batch
+    from schemas import SegmentPrediction
+    from segmentation import EnergySegmenter, iter_blocks, summarize_segments
+
+    job_queue.clear_results(job["id"])
+    model_name = _model_names(job["params"])[0]
+    _, stored, _ = job["params"]["files"][0]
+    path = os.path.join(job_queue.input_dir(job["id"]), stored)
+    sample_rate = audio_processor.SAMPLE_RATE
+    max_samples = config.LONG_MAX_DURATION_SECONDS * sample_rate
+    try:
+        total = sf.info(path).duration * sample_rate
+    except Exception:
+        total = None
+
+    segmenter = EnergySegmenter(sample_rate)
+    timeline: List[SegmentPrediction] = []
+    pending = []
+
+    def flush() -> None:
+        ids = [f"{job['id']}:{start}" for start, _, _ in pending]
+        features = np.vstack([features for _, _, features in pending])
+        predictions = predict_voice_batch(model_name, ids, features)
+        scored = [
+            SegmentPrediction(
+                start=start / sample_rate,
+                end=(start + length) / sample_rate,
+                voice_emotion=prediction.get("emotion"),
+                details=prediction.get("detail"),
+                error=prediction.get("error"),
+            )
+            for (start, length, _), prediction in zip(pending, predictions)
+        ]
+        timeline.extend(scored)
+        pending.clear()
+        progress = min(segmenter.total / total, 0.99) if total else 0.0
+        report([segment.model_dump() for segment in scored], progress)
+
+    with open(path, "rb") as f:
+        blocks = iter_blocks(f, sample_rate)
+        try:
+            for block in itertools.chain(blocks, [None]):
+                found = segmenter.flush() if block is None else segmenter.push(block)
+                for start, samples in found:
+                    features = audio_processor.extract_features(job["id"], samples)
+                    pending.append((start, len(samples), features))
+                if segmenter.total > max_samples:
+                    raise ValueError(
+                        f"Audio exceeds {config.LONG_MAX_DURATION_SECONDS:.0f}s"
+                    )
+                if len(pending) >= LONG_CHUNK_SEGMENTS or (block is None and pending):
+                    flush()
+        finally:
+            blocks.close()
+
+    summary = summarize_segments(timeline, segmenter.total / sample_rate)
+    return summary.model_dump(mode="json")
+
+
+HANDLERS: Dict[str, Callable[[dict, Callable], dict]] = {
+    "predict": score_clips,
+    "batch": score_clips,
+    "long": score_long,
+}
+
+
+class Lease(threading.Thread):
+    """
+    Продление аренды задачи в фоне, пока обработчик работает
+    """
+
+    def __init__(self, job_id: str, worker: str):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.worker = worker
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(config.JOB_LEASE_SECONDS / 3):
+            if not job_queue.heartbeat(self.job_id, self.worker):
+                self.lost = True
+                return
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def execute(job: dict, worker: str) -> Optional[str]:
+    """
+    Выполнить задачу, полученную из очереди. Возвращает новое состояние
+    """
+    job_id = job["id"]
+    logger.info(
+        f"{job_id}: Job {job['kind']} started by {worker}, "
+        f"attempt {job['attempts']}/{job['max_attempts']}"
+    )
+    lease = Lease(job_id, worker)
+    lease.start()
+
+    def report(items: List[dict], progress: float) -> None:
+        if lease.lost or not job_queue.report(job_id, worker, progress, items):
+            raise JobCancelled()
+
+    try:
+        result = HANDLERS[job["kind"]](job, report)
+    except JobCancelled:
+        status = job_queue.fail(job_id, worker, "Cancelled")
+    except Exception as e:
+        logger.error(f"{job_id}: Job failed: {e}")
+        status = job_queue.fail(job_id, worker, str(e) or type(e).__name__)
+    else:
+        status = DONE if job_queue.complete(job_id, worker, result) else None
+    finally:
+        lease.stop()
+
+    logger.info(f"{job_id}: Job attempt finished, status {status}")
+    if status in FINISHED and job["webhook"]:
+        notify(job_queue.get(job_id, limit=0))
+    return status
+
+
+def job_summary(job: dict) -> dict:
+    """
+    Состояние задачи без частичных результатов (для webhook и списков)
+    """
+    keys = (
+        "id",
+        "kind",
+        "status",
+        "priority",
+        "attempts",
+        "max_attempts",
+        "progress",
+        "results",
+        "result",
+        "error",
+        "created_at",
+        "started_at",
+        "finished_at",
+    )
+    return {key: job[key] for key in keys}
+
+
+def notify(job: dict) -> None:
+    """
+    POST состояния завершённой задачи на webhook с повторами
+    """
+    payload = json.dumps(job_summary(job), ensure_ascii=False).encode("utf-8")
+    for attempt in range(WEBHOOK_ATTEMPTS):
+        try:
+            request = urllib.request.Request(
+                job["webhook"],
+                data=payload,
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(
+                request, timeout=config.JOB_WEBHOOK_TIMEOUT_SECONDS
+            ) as response:
+                logger.info(f"{job['id']}: Webhook answered {response.status}")
+                return
+        except Exception as e:
+            logger.warning(f"{job['id']}: Webhook attempt {attempt + 1} failed: {e}")
+            if attempt + 1 < WEBHOOK_ATTEMPTS:
+                time.sleep(2**attempt)
+    logger.error(f"{job['id']}: Webhook is not delivered")
+
+
+def run_worker(worker: str, stop=None) -> None:
+    """
+    Цикл обработчика: задачи разбираются по одной, пока не выставлен stop
+    """
+    limits = parse_limits(config.JOB_CONCURRENCY)
+    logger.info(f"Job worker {worker} started, limits {limits}")
+    while stop is None or not stop.is_set():
+        job = job_queue.claim(worker, limits)
+        if job is None:
+            if stop is None:
+                time.sleep(config.JOB_POLL_SECONDS)
+            else:
+                stop.wait(config.JOB_POLL_SECONDS)
+            continue
+        # Ошибка вне обработчика задачи (webhook, база) не должна
+        # останавливать цикл: обработчики не перезапускаются
+        try:
+            execute(job, worker)
+        except Exception as e:
+            logger.exception(f"{job['id']}: Job worker {worker} error: {e}")
+    logger.info(f"Job worker {worker} stopped")
+
+
+class JobWorkers:
+    """
+    Процессы-обработчики, запускаемые вместе с сервисом. Задача,
+    прерванная остановкой, вернётся в очередь по истечении аренды
+    """
+
+    def __init__(self, processes: int = config.JOB_WORKERS):
+        self.processes = processes
+        self._stop = None
+        self._workers: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        if self._workers or self.processes <= 0:
+            return
+        context = multiprocessing.get_context("spawn")
+        self._stop = context.Event()
+        for i in range(self.processes):
+            process = context.Process(
+                target=run_worker,
+                args=(f"{os.getpid()}-{i}", self._stop),
+                name=f"job-worker-{i}",
+                daemon=True,
+            )
+            process.start()
+            self._workers.append(process)
+        logger.info(f"Started {self.processes} job workers")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        if not self._workers:
+            return
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for process in self._workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._workers = []
+        logger.info("Job workers stopped")
+
+    def join(self) -> None:
+        for process in self._workers:
+            process.join()
+
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._workers)
+
+
+job_workers = JobWorkers()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=("worker", "stats", "purge"))
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--days", type=float, default=7.0)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(job_queue.stats(), indent=2))
+    elif args.command == "purge":
+        removed = job_queue.purge(time.time() - args.days * 24 * 60 * 60)
+        logger.info(f"Removed {removed} finished jobs")
+    else:
+        workers = JobWorkers(args.processes)
+        workers.start()
+        try:
+            workers.join()
+        except KeyboardInterrupt:
+            workers.stop()
+
+
+if __name__ == "__main__":
+    main()
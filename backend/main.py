@@ -1,9 +1,19 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 
-from routers import router
+from routers import metric_families, router
+from asr import asr_engine
+from batching import stop_batchers
+from executors import worker_pool
+from jobs import job_workers
 from logger import get_logger
+import metrics
+from registry import model_registry
+import config
 
 logger = get_logger(__name__)
 
@@ -11,7 +21,28 @@ logger = get_logger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Application starts...")
+    if config.CPU_POOL_KIND == "process":
+        # Предсказания выполняются в процессах пула, поэтому модели
+        # загружаются только там, основной процесс их не держит
+        lazy = config.MODEL_LOADING == "lazy"
+        worker_pool.start(preload=[] if lazy else model_registry.routed_specs())
+        # Новые версии и маршруты тоже загружаются в процессах пула
+        model_registry.remote_loader = worker_pool.load_model
+    else:
+        worker_pool.start()
+    asr_engine.start()
+    job_workers.start()
+    if config.CPU_POOL_KIND == "process":
+        while config.MODEL_LOADING == "eager" and not worker_pool.loaded():
+            await asyncio.sleep(0.1)
+    elif config.MODEL_LOADING == "eager":
+        await worker_pool.run_io(model_registry.load_all)
+    else:
+        model_registry.start(config.MODEL_LOADING)
     yield
+    job_workers.stop()
+    await stop_batchers()
+    worker_pool.shutdown()
     logger.info("Application shuts down...")
 
 
@@ -29,6 +60,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/")
@@ -38,3 +71,15 @@ async def root():
         "docs_url": "/docs",
         "status": "online",
     }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Метрики в текстовом формате Prometheus
+    """
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        metrics.render(metric_families()), media_type=metrics.CONTENT_TYPE
+    )
@@ -0,0 +1,251 @@
+"""
+Метрики в текстовом формате Prometheus (/metrics): гистограммы
+длительности этапов обработки запроса и показатели, которые
+снимаются с компонентов сервиса в момент опроса.
+
+Замер этапа - два вызова perf_counter и обновление счётчиков под
+блокировкой, всё остальное (очереди, кэши, память) считается только
+при опросе. METRICS_ENABLED=0 отключает замеры полностью: декораторы
+возвращают исходные функции без обёртки
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "emotion_"
+
+# Этапы занимают от долей миллисекунды (модели) до секунд (распознавание)
+STAGE_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+# Замеры в процессе пула копятся до ответа на задачу, но не бесконечно
+MAX_FORWARDED = 10000
+
+Sample = Tuple[Dict[str, str], float]
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин и одной меткой
+    (этап, маршрут). Счётчики по корзинам хранятся без накопления, суммы
+    по границам считаются при выводе
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[str, list] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # Корзины, +Inf, сумма
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1)
+                series.append(0.0)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            total = 0
+            for bound, count in zip(self.buckets, series):
+                total += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {total}')
+            total += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {total}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label}}} {total}")
+        return lines
+
+
+stage_seconds = Histogram(
+    PREFIX + "stage_duration_seconds",
+    "Duration of request processing stages",
+    "stage",
+)
+
+request_seconds = Histogram(
+    PREFIX + "http_request_duration_seconds",
+    "Duration of HTTP requests including reading of the request body",
+    "route",
+)
+in_flight = 0
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: длительность HTTP запросов по шаблону пути
+    и число запросов в обработке
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global in_flight
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight -= 1
+            # Шаблон пути вместо самого пути ограничивает число рядов
+            path = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(
+                f"{scope['method']} {path}", time.perf_counter() - started
+            )
+
+
+# В процессах пула вычислений замеры не пишутся в гистограмму процесса,
+# а накапливаются и возвращаются в основной процесс вместе с результатом
+_forward = False
+_forwarded: List[Tuple[str, float]] = []
+
+
+def observe(stage: str, seconds: float) -> None:
+    if _forward:
+        if len(_forwarded) < MAX_FORWARDED:
+            _forwarded.append((stage, seconds))
+    else:
+        stage_seconds.observe(stage, seconds)
+
+
+@contextmanager
+def _measure(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def stage(name: str):
+    """
+    Контекстный менеджер для замера участка кода
+    """
+    return _measure(name) if config.METRICS_ENABLED else nullcontext()
+
+
+def timed(name: str) -> Callable:
+    """
+    Декоратор для замера функции или метода
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if not config.METRICS_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def init_worker() -> None:
+    """
+    Инициализатор процесса пула: замеры пересылаются в основной процесс
+    """
+    global _forward
+    _forward = True
+
+
+def call_forwarding(func: Callable, *args):
+    """
+    Выполнение задачи в процессе пула. Возвращает результат и замеры,
+    накопленные с прошлой задачи (включая упавшие)
+    """
+    result = func(*args)
+    observations = list(_forwarded)
+    _forwarded.clear()
+    return result, observations
+
+
+def merge(observations: Iterable[Tuple[str, float]]) -> None:
+    for name, seconds in observations:
+        stage_seconds.observe(name, seconds)
+
+
+def family(
+    name: str, kind: str, help_text: str, samples: Iterable[Sample]
+) -> List[str]:
+    """
+    Строки одной метрики (gauge или counter) из пар метки -> значение
+    """
+    name = PREFIX + name
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        if labels:
+            pairs = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+            lines.append(f"{name}{{{pairs}}} {float(value)}")
+        else:
+            lines.append(f"{name} {float(value)}")
+    return lines
+
+
+def render(families: Iterable[List[str]]) -> str:
+    lines = stage_seconds.render() + request_seconds.render()
+    for lines_of_family in families:
+        lines.extend(lines_of_family)
+    return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """
+    Резидентная память процесса по /proc (Linux), иначе None
+    """
+    path = f"/proc/{pid or 'self'}/statm"
+    try:
+        with open(path) as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
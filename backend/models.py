@@ -1,13 +1,19 @@
+import hashlib
 import os
 import pickle
-from typing import Dict, Union
+from functools import partial
+from typing import Callable, Dict, List, Tuple, Union
 
-import torch
-import torch.nn.functional as F
-from torch import nn
+import numpy as np
+import pandas as pd
 
+import config
 from audio_processing import audio_processor
+from fcnn_numpy import Layer, load_layers, numpy_runner, save_layers, softmax
+from forest import FlatForest
 from logger import get_logger
+from metrics import timed
+from registry import ModelSpec, model_registry
 
 logger = get_logger(__name__)
 
@@ -15,151 +21,340 @@ MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 
+def file_version(*paths: str) -> str:
+    """
+    Версия модели по содержимому файлов весов. Хэш файла считается
+    один раз и пересчитывается, только если изменились его размер
+    или время изменения
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(f"{os.path.basename(path)}:{_file_hash(path)}".encode())
+    return digest.hexdigest()[:12]
+
+
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def _file_hash(path: str) -> str:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
 class RandomForestEmotionModel:
-    def __init__(self):
+    def __init__(self, engine: str = config.RF_ENGINE, model_dir: str = MODEL_DIR):
+        self.engine = engine
+        self.model_dir = model_dir
         self.model = None
         self.label_encoder = None
+        self.version = None
         self._load_model_and_encoder()
 
     def _load_model_and_encoder(self) -> None:
-        model_path = os.path.join(MODEL_DIR, "random_forest_model.pkl")
-        encoder_path = os.path.join(MODEL_DIR, "label_encoder.pkl")
+        model_path = os.path.join(self.model_dir, "random_forest_model.pkl")
+        encoder_path = os.path.join(self.model_dir, "label_encoder.pkl")
 
         try:
             if not os.path.exists(model_path):
                 raise FileNotFoundError("Model file not found after reconstruction")
 
-            with open(model_path, "rb") as f_model:
-                self.model = pickle.load(f_model)
+            if self.engine == "flat":
+                self.model = self._load_flat(model_path, self._flat_path())
+            else:
+                with open(model_path, "rb") as f_model:
+                    self.model = pickle.load(f_model)
             with open(encoder_path, "rb") as f_le:
                 self.label_encoder = pickle.load(f_le)
-            logger.info("RandomForest model and label encoder loaded successfully")
+            self.version = file_version(model_path, encoder_path)
+            logger.info(
+                f"RandomForest model ({self.engine}) and label encoder loaded "
+                "successfully"
+            )
         except Exception as e:
             logger.error(f"Error loading RandomForest model or encoder: {e}")
             raise
 
+    def _flat_path(self) -> str:
+        if self.model_dir == MODEL_DIR:
+            return config.RF_FLAT_PATH
+        return os.path.join(self.model_dir, "random_forest_flat")
+
+    @staticmethod
+    def _load_flat(model_path: str, flat_path: str) -> FlatForest:
+        """
+        Плоский лес из каталога flat_path. Если его нет или он старше
+        pickle, лес конвертируется один раз и сохраняется рядом
+        """
+        meta_path = os.path.join(flat_path, "meta.json")
+        stale = not os.path.exists(meta_path) or (
+            os.path.getmtime(meta_path) < os.path.getmtime(model_path)
+        )
+        if stale:
+            with open(model_path, "rb") as f_model:
+                flat = FlatForest.from_sklearn(pickle.load(f_model))
+            try:
+                flat.save(flat_path)
+            except OSError as e:
+                logger.warning(f"Cannot save flat RandomForest: {e}")
+                return flat
+            logger.info(f"RandomForest converted to {flat_path}")
+        return FlatForest.load(flat_path)
+
     def predict_with_probabilities(
-        self, request_id: str, audio_path: str
+        self, request_id: str, audio_data: np.ndarray
     ) -> Dict[str, Union[str, Dict[str, float]]]:
-        if self.model is None or self.label_encoder is None:
-            logger.error(f"{request_id}: Model or LabelEncoder is not loaded.")
-            return {"error": "Model not loaded"}
-
         try:
-            features = audio_processor.extract_features(request_id, audio_path)
-            if features is None or features.empty:
+            features = audio_processor.extract_features(request_id, audio_data)
+            if features is None or features.size == 0:
                 logger.error(f"{request_id}: Failed to extract features from audio")
                 return {"error": "Failed to extract features"}
-
-            preds = self.model.predict(features)
-            probs = self.model.predict_proba(features)[0]
-
-            if len(preds) == 0:
-                logger.error(f"{request_id}: Empty prediction result")
-                return {"error": "Empty prediction"}
-
-            emotion = self.label_encoder.inverse_transform(preds)[0]
-            prob_dict = {
-                label: float(probs[idx])
-                for idx, label in enumerate(self.label_encoder.classes_)
-            }
-
-            result = {"emotion": emotion, "detail": prob_dict}
-            logger.info(f"{request_id}: RF predicted emotion: {emotion}")
-            return result
-
         except Exception as e:
             logger.error(f"{request_id}: Error during RF prediction: {e}")
             return {"error": str(e)}
 
+        return self.predict_batch([request_id], features)[0]
 
-class EmotionFCNN(nn.Module):
-    def __init__(self):
-        super(EmotionFCNN, self).__init__()
-        self.net = nn.Sequential(
-            nn.Linear(26, 416),
-            nn.ReLU(),
-            nn.BatchNorm1d(416),
-            nn.Dropout(0.2),
-            nn.Linear(416, 208),
-            nn.ReLU(),
-            nn.BatchNorm1d(208),
-            nn.Dropout(0.1),
-            nn.Linear(208, 104),
-            nn.ReLU(),
-            nn.BatchNorm1d(104),
-            nn.Dropout(0.1),
-            nn.Linear(104, 52),
-            nn.ReLU(),
-            nn.BatchNorm1d(52),
-            nn.Dropout(0.1),
-            nn.Linear(52, 4),
-        )
+    @timed("inference_rf")
+    def predict_batch(
+        self, request_ids: List[str], features: np.ndarray
+    ) -> List[Dict[str, Union[str, Dict[str, float]]]]:
+        """
+        Предсказание для матрицы признаков (n, 26) за один проход по лесу
+        """
+        if self.model is None or self.label_encoder is None:
+            logger.error(f"{request_ids}: Model or LabelEncoder is not loaded.")
+            return [{"error": "Model not loaded"} for _ in request_ids]
 
-    def forward(self, x):
-        return self.net(x)
+        try:
+            if not isinstance(self.model, FlatForest) and hasattr(
+                self.model, "feature_names_in_"
+            ):
+                features = pd.DataFrame(features, columns=self.model.feature_names_in_)
+            probs = self.model.predict_proba(features)
+
+            if len(probs) == 0:
+                logger.error(f"{request_ids}: Empty prediction result")
+                return [{"error": "Empty prediction"} for _ in request_ids]
+
+            # predict() повторно обходит весь лес, поэтому метки берём
+            # как argmax от уже посчитанных вероятностей
+            preds = self.model.classes_[probs.argmax(axis=1)]
+            emotions = self.label_encoder.inverse_transform(preds)
+
+            results = []
+            for request_id, emotion, row in zip(request_ids, emotions, probs):
+                prob_dict = {
+                    label: float(row[idx])
+                    for idx, label in enumerate(self.label_encoder.classes_)
+                }
+                results.append({"emotion": emotion, "detail": prob_dict})
+                logger.info(f"{request_id}: RF predicted emotion: {emotion}")
+            return results
+
+        except Exception as e:
+            logger.error(f"{request_ids}: Error during RF prediction: {e}")
+            return [{"error": str(e)} for _ in request_ids]
 
 
 class TorchEmotionModel:
-    def __init__(self, device: str = None):
-        self.device = torch.device(device if device else "cpu")
+    def __init__(
+        self,
+        device: str = None,
+        runtime: str = config.FCNN_RUNTIME,
+        model_dir: str = MODEL_DIR,
+    ):
+        self.device = device if device else "cpu"
+        self.runtime = runtime
+        self.model_dir = model_dir
         self.model = None
+        self._run_logits = None
         self.label_encoder = None
+        self.version = None
         self._load_model_and_encoder()
 
     def _load_model_and_encoder(self) -> None:
-        model_path = os.path.join(MODEL_DIR, "fcnn_model.pth")
-        encoder_path = os.path.join(MODEL_DIR, "label_encoder.pkl")
+        model_path = os.path.join(self.model_dir, "fcnn_model.pth")
+        encoder_path = os.path.join(self.model_dir, "label_encoder.pkl")
 
         try:
             with open(encoder_path, "rb") as f_le:
                 self.label_encoder = pickle.load(f_le)
 
-            self.model = EmotionFCNN().to(self.device)
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
-            self.model.eval()
-            logger.info("Torch FCNN model and label encoder loaded successfully")
+            if self.runtime == "numpy":
+                # Свёрнутые веса читаются без импорта torch
+                self._run_logits = numpy_runner(self._load_fused(model_path))
+                _limit_threads()
+            else:
+                # torch импортируется при загрузке модели, а не приложения
+                import torch
+                from fcnn_runtime import EmotionFCNN, load_runtime
+
+                _limit_threads(torch)
+                self.model = EmotionFCNN().to(self.device)
+                self.model.load_state_dict(
+                    torch.load(model_path, map_location=self.device)
+                )
+                self.model.eval()
+                # BatchNorm сворачиваются в Linear, Dropout отбрасываются,
+                # см. fcnn_runtime.py
+                self._run_logits = load_runtime(self.runtime, self.model)
+            self.version = file_version(model_path, encoder_path)
+            logger.info(
+                f"Torch FCNN model ({self.runtime}) and label encoder loaded "
+                "successfully"
+            )
         except Exception as e:
             logger.error(f"Error loading Torch model or encoder: {e}")
             raise
 
+    @staticmethod
+    def _load_fused(model_path: str) -> List[Layer]:
+        """
+        Свёрнутые веса из fcnn_fused.npz. Если файла нет или он старше
+        чекпоинта, граф сворачивается один раз (через torch) и
+        сохраняется рядом
+        """
+        fused_path = os.path.join(os.path.dirname(model_path), "fcnn_fused.npz")
+        stale = not os.path.exists(fused_path) or (
+            os.path.getmtime(fused_path) < os.path.getmtime(model_path)
+        )
+        if stale:
+            from fcnn_runtime import fold_batchnorm, load_checkpoint
+
+            layers = fold_batchnorm(load_checkpoint(model_path))
+            try:
+                save_layers(fused_path, layers)
+            except OSError as e:
+                logger.warning(f"Cannot save fused FCNN weights: {e}")
+                return layers
+            logger.info(f"FCNN weights folded to {fused_path}")
+        return load_layers(fused_path)
+
     def predict_with_probabilities(
-        self, request_id: str, audio_path: str
+        self, request_id: str, audio_data: np.ndarray
     ) -> Dict[str, Union[str, Dict[str, float]]]:
-        if self.model is None or self.label_encoder is None:
-            logger.error(f"{request_id}: Torch model or LabelEncoder is not loaded.")
-            return {"error": "Model not loaded"}
-
         try:
-            features = audio_processor.extract_features(request_id, audio_path)
-            if features is None or features.empty:
+            features = audio_processor.extract_features(request_id, audio_data)
+            if features is None or features.size == 0:
                 logger.error(f"{request_id}: Failed to extract features from audio")
                 return {"error": "Failed to extract features"}
-            x = torch.tensor(features.values, dtype=torch.float32, device=self.device)
-            if x.dim() == 1:
-                x = x.unsqueeze(0)
-
-            with torch.no_grad():
-                logits = self.model(x)
-                probs = F.softmax(logits, dim=1)
-
-            probs_np = probs.cpu().numpy()[0]
-            pred_idx = int(probs_np.argmax())
-            emotion = self.label_encoder.inverse_transform([pred_idx])[0]
-
-            prob_dict = {
-                label: float(probs_np[idx])
-                for idx, label in enumerate(self.label_encoder.classes_)
-            }
-
-            result = {"emotion": emotion, "detail": prob_dict}
-            logger.info(f"{request_id}: TorchCNN predicted emotion: {emotion}")
-            return result
-
         except Exception as e:
             logger.error(f"{request_id}: Error during TorchCNN prediction: {e}")
             return {"error": str(e)}
 
+        return self.predict_batch([request_id], features)[0]
 
-rf_model = RandomForestEmotionModel()
-torch_model = TorchEmotionModel(device="cpu")
+    @timed("inference_fcnn")
+    def predict_batch(
+        self, request_ids: List[str], features: np.ndarray
+    ) -> List[Dict[str, Union[str, Dict[str, float]]]]:
+        """
+        Предсказание для матрицы признаков (n, 26) одним прямым проходом
+        через выбранную среду исполнения (FCNN_RUNTIME)
+        """
+        if self._run_logits is None or self.label_encoder is None:
+            logger.error(f"{request_ids}: Torch model or LabelEncoder is not loaded.")
+            return [{"error": "Model not loaded"} for _ in request_ids]
+
+        try:
+            x = np.asarray(features, dtype=np.float32).reshape(-1, 26)
+            probs_np = softmax(self._run_logits(x))
+            emotions = self.label_encoder.inverse_transform(probs_np.argmax(axis=1))
+
+            results = []
+            for request_id, emotion, row in zip(request_ids, emotions, probs_np):
+                prob_dict = {
+                    label: float(row[idx])
+                    for idx, label in enumerate(self.label_encoder.classes_)
+                }
+                results.append({"emotion": emotion, "detail": prob_dict})
+                logger.info(f"{request_id}: TorchCNN predicted emotion: {emotion}")
+            return results
+
+        except Exception as e:
+            logger.error(f"{request_ids}: Error during TorchCNN prediction: {e}")
+            return [{"error": str(e)} for _ in request_ids]
+
+
+def _limit_threads(torch=None) -> None:
+    # Малые пачки FCNN быстрее в один поток: синхронизация потоков BLAS
+    # дороже самих умножений. Настройка действует на весь процесс
+    if config.FCNN_NUM_THREADS > 0:
+        from threadpoolctl import threadpool_limits
+
+        if torch is not None:
+            torch.set_num_threads(config.FCNN_NUM_THREADS)
+        threadpool_limits(config.FCNN_NUM_THREADS, user_api="blas")
+
+
+MODEL_FILES = {
+    "rf": (RandomForestEmotionModel, ("random_forest_model.pkl", "label_encoder.pkl")),
+    "fcnn": (TorchEmotionModel, ("fcnn_model.pth", "label_encoder.pkl")),
+}
+
+
+def version_loader(name: str, version: str) -> Callable:
+    """
+    Загрузчик версии из каталога MODEL_VERSIONS_DIR/<name>/<version>
+    с теми же файлами, что и в models/
+    """
+    model_class, files = MODEL_FILES[name]
+    model_dir = os.path.join(config.MODEL_VERSIONS_DIR, name, version)
+    if os.path.basename(version) != version or not all(
+        os.path.exists(os.path.join(model_dir, file)) for file in files
+    ):
+        raise KeyError(f"Version {version} of {name} not found in {model_dir}")
+    return partial(model_class, model_dir=model_dir)
+
+
+def _base_version(name: str) -> str:
+    """
+    Версия весов из models/ по содержимому файлов, чтобы кэш результатов
+    не путал старые и новые веса после замены файлов
+    """
+    try:
+        return file_version(*(os.path.join(MODEL_DIR, f) for f in MODEL_FILES[name][1]))
+    except OSError:
+        return "base"
+
+
+def _register_models() -> None:
+    """
+    Основная версия из models/ и версии из MODEL_VERSIONS_DIR. Веса
+    загружаются реестром при первом обращении или в фоне после старта
+    приложения, см. registry.py
+    """
+    for name, (model_class, _) in MODEL_FILES.items():
+        model_registry.register(name, model_class, version=_base_version(name))
+        model_registry.register_version_loader(name, partial(version_loader, name))
+        versions_dir = os.path.join(config.MODEL_VERSIONS_DIR, name)
+        if not os.path.isdir(versions_dir):
+            continue
+        for version in sorted(os.listdir(versions_dir)):
+            try:
+                model_registry.add_version(name, version)
+            except KeyError as e:
+                logger.warning(f"Skipping model version: {e}")
+
+
+_register_models()
+VOICE_MODELS = model_registry.group(*MODEL_FILES)
+
+
+def predict_voice_batch(
+    model: Union[str, ModelSpec], request_ids: List[str], features: np.ndarray
+) -> List[Dict[str, Union[str, Dict[str, float]]]]:
+    """
+    Точка входа для пула процессов: предсказание эмоций для пачки признаков.
+    model - имя (основная версия) или ссылка на версию из реестра
+    """
+    if isinstance(model, str):
+        model = model_registry.spec(model)
+    return model_registry.load(model).predict_batch(request_ids, features)
@@ -0,0 +1,477 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelSpec:
+    """
+    Ссылка на версию модели: имя, версия и загрузчик весов. Передаётся
+    в пул процессов вместе с пачкой, поэтому загрузчик должен
+    сериализоваться (класс модели или functools.partial от него)
+    """
+
+    def __init__(self, name: str, version: str, loader: Callable[[], Any]):
+        self.name = name
+        self.version = version
+        self.loader = loader
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    def __repr__(self) -> str:
+        return f"ModelSpec({self.key})"
+
+
+class ModelEntry:
+    """
+    Версия модели с отложенной загрузкой: loader вызывается один раз при
+    первом обращении или при фоновой загрузке, одновременные обращения
+    ждут завершения загрузки
+    """
+
+    def __init__(self, spec: ModelSpec):
+        self.spec = spec
+        self.name = spec.key
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.last_used = 0.0
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        self.last_used = time.monotonic()
+        if self.state == READY:
+            return self._model
+        with self._lock:
+            if self.state in (PENDING, LOADING):
+                self._load()
+        if self.state == FAILED:
+            raise RuntimeError(f"Model {self.name} failed to load: {self.error}")
+        return self._model
+
+    def _load(self) -> None:
+        self.state = LOADING
+        started = time.perf_counter()
+        try:
+            self._model = self.spec.loader()
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+            logger.error(f"Error loading model {self.name}: {e}")
+        else:
+            self.state = READY
+            self.error = None
+            logger.info(f"Model {self.name} loaded")
+        self.load_seconds = time.perf_counter() - started
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "load_seconds": self.load_seconds,
+            "version": getattr(self._model, "version", None),
+            "error": self.error,
+        }
+
+
+class Route:
+    """
+    Маршрутизация запросов к версиям одной модели: основная версия,
+    канареечная на canary_percent процентов запросов и теневая, которая
+    получает копию запроса без влияния на ответ
+    """
+
+    def __init__(
+        self,
+        active: str,
+        canary: Optional[str] = None,
+        canary_percent: float = 0.0,
+        shadow: Optional[str] = None,
+    ):
+        if not 0 <= canary_percent <= 100:
+            raise ValueError("canary_percent must be within [0, 100]")
+        self.active = active
+        self.canary = canary
+        self.canary_percent = canary_percent if canary else 0.0
+        self.shadow = shadow
+
+    def versions(self) -> List[str]:
+        return [v for v in (self.active, self.canary, self.shadow) if v]
+
+    def to_dict(self) -> dict:
+        return {
+            "active": self.active,
+            "canary": self.canary,
+            "canary_percent": self.canary_percent,
+            "shadow": self.shadow,
+        }
+
+
+class ModelRegistry:
+    """
+    Реестр версий моделей процесса. Веса не загружаются при импорте:
+    только при первом обращении (lazy), в фоновом потоке после старта
+    приложения (background) или до приёма запросов (eager).
+
+    Смена маршрута применяется после фоновой загрузки всех его версий
+    одной заменой объекта Route: запросы, уже выбравшие версию, дорабатывают
+    на ней. Маршруты хранятся в файле MODEL_ROUTES_PATH и перечитываются
+    при его изменении, поэтому применяются во всех процессах сервиса
+    """
+
+    def __init__(self, routes_path: str = config.MODEL_ROUTES_PATH):
+        self.routes_path = routes_path
+        self._entries: Dict[Tuple[str, str], ModelEntry] = {}
+        self._routes: Dict[str, Route] = {}
+        self._version_loaders: Dict[str, Callable[[str], Callable]] = {}
+        self._shadow_stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._routes_mtime: Optional[float] = None
+        self._routes_checked = 0.0
+        # Загрузка версии там, где выполняются предсказания, если это
+        # не этот процесс (процессы пула вычислений), см. warm
+        self.remote_loader: Optional[Callable[[ModelSpec], None]] = None
+
+    def register(
+        self, name: str, loader: Callable[[], Any], version: str = "base"
+    ) -> ModelSpec:
+        """
+        Добавить версию модели. Первая версия становится основной
+        """
+        spec = ModelSpec(name, version, loader)
+        with self._lock:
+            self._entries[name, version] = ModelEntry(spec)
+            self._routes.setdefault(name, Route(version))
+        return spec
+
+    def register_version_loader(
+        self, name: str, factory: Callable[[str], Callable[[], Any]]
+    ) -> None:
+        """
+        factory(version) возвращает загрузчик версии, которой ещё нет в
+        реестре (например, каталог models/versions/<name>/<version>)
+        """
+        self._version_loaders[name] = factory
+
+    def add_version(self, name: str, version: str) -> ModelSpec:
+        with self._lock:
+            entry = self._entries.get((name, version))
+            if entry is not None:
+                return entry.spec
+            if name not in self._version_loaders:
+                raise KeyError(f"Model {name} has no versions")
+            loader = self._version_loaders[name](version)
+            return self.register(name, loader, version)
+
+    def remove_version(self, name: str, version: str) -> None:
+        with self._lock:
+            if version in self._routes[name].versions():
+                raise ValueError(f"Version {version} of {name} is routed")
+            self._entries.pop((name, version))
+
+    def names(self) -> List[str]:
+        return list(self._routes)
+
+    def versions(self, name: str) -> List[str]:
+        return [version for (model, version) in self._entries if model == name]
+
+    def spec(self, name: str, version: Optional[str] = None) -> ModelSpec:
+        self._sync_routes()
+        version = version or self._routes[name].active
+        try:
+            return self._entries[name, version].spec
+        except KeyError:
+            raise KeyError(f"Unknown version {version} of {name}")
+
+    def resolve(
+        self, name: str, version: Optional[str] = None, key: str = ""
+    ) -> Tuple[ModelSpec, Optional[ModelSpec]]:
+        """
+        Версия для запроса и теневая версия (или None). Явно указанная
+        версия не участвует в канареечном и теневом трафике. Доля
+        канарейки выбирается по хэшу key, поэтому один и тот же клип
+        всегда попадает в одну версию
+        """
+        self._sync_routes()
+        if name not in self._routes:
+            raise KeyError(f"Unknown model: {name}")
+        if version is not None:
+            return self.spec(name, version), None
+        route = self._routes[name]
+        selected = route.active
+        if route.canary and _bucket(key) < route.canary_percent:
+            selected = route.canary
+        shadow = None
+        if route.shadow and route.shadow != selected:
+            shadow = self._entries[name, route.shadow].spec
+        return self._entries[name, selected].spec, shadow
+
+    def get(self, name: str, version: Optional[str] = None) -> Any:
+        return self.load(self.spec(name, version))
+
+    def load(self, spec: ModelSpec) -> Any:
+        """
+        Модель по ссылке. В процессах пула версия регистрируется при первой
+        пачке, давно не использованные версии выгружаются
+        """
+        entry = self._entries.get((spec.name, spec.version))
+        if entry is None:
+            with self._lock:
+                entry = self._entries.setdefault(
+                    (spec.name, spec.version), ModelEntry(spec)
+                )
+                self._evict(spec.name)
+        return entry.get()
+
+    def warm(self, spec: ModelSpec) -> None:
+        """
+        Загрузить версию до первого запроса к ней: в этом процессе или,
+        если задан remote_loader, во всех процессах, которые выполняют
+        предсказания. RuntimeError, если загрузка не удалась
+        """
+        if self.remote_loader is not None:
+            self.remote_loader(spec)
+        else:
+            self.load(spec)
+
+    def preload(self, spec: ModelSpec) -> None:
+        """
+        Загрузить версию в фоне, не дожидаясь первого запроса
+        """
+
+        def load():
+            try:
+                self.warm(spec)
+            except (RuntimeError, TimeoutError) as e:
+                logger.error(f"Model {spec.key} is not preloaded: {e}")
+
+        threading.Thread(target=load, name=f"load-{spec.key}", daemon=True).start()
+
+    def _evict(self, name: str) -> None:
+        routed = self._routes[name].versions() if name in self._routes else []
+        loaded = [
+            entry
+            for (model, version), entry in self._entries.items()
+            if model == name and entry.state == READY and version not in routed
+        ]
+        loaded.sort(key=lambda entry: entry.last_used)
+        for entry in loaded[: max(len(loaded) - config.MODEL_MAX_VERSIONS, 0)]:
+            del self._entries[entry.spec.name, entry.spec.version]
+            logger.info(f"Model {entry.name} unloaded")
+
+    def group(self, *names: str) -> "ModelGroup":
+        return ModelGroup(self, names)
+
+    def set_route(self, name: str, route: Route, wait: bool = False) -> None:
+        """
+        Загрузить версии маршрута в фоне (см. warm) и переключить на него.
+        Если какая-то версия не загрузилась, остаётся прежний маршрут
+        """
+        with self._lock:
+            if name not in self._routes:
+                raise KeyError(f"Unknown model: {name}")
+            specs = [self.add_version(name, version) for version in route.versions()]
+
+        def apply():
+            for spec in specs:
+                try:
+                    self.warm(spec)
+                except (RuntimeError, TimeoutError) as e:
+                    logger.error(f"Route for {name} is not applied: {e}")
+                    return
+            with self._lock:
+                self._routes[name] = route
+            logger.info(f"Route for {name} switched to {route.to_dict()}")
+
+        if wait:
+            apply()
+        else:
+            threading.Thread(target=apply, name=f"route-{name}", daemon=True).start()
+
+    def save_routes(self, routes: Dict[str, Route]) -> None:
+        """
+        Записать маршруты в общий файл, остальные процессы подхватят
+        изменение при следующем запросе
+        """
+        with self._lock:
+            current = self._read_routes_file()
+            current.update({name: route.to_dict() for name, route in routes.items()})
+            os.makedirs(os.path.dirname(self.routes_path) or ".", exist_ok=True)
+            tmp_path = f"{self.routes_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+            os.replace(tmp_path, self.routes_path)
+            # Этот процесс применяет маршруты сам, без повторного чтения
+            self._routes_mtime = os.stat(self.routes_path).st_mtime_ns
+
+    def _read_routes_file(self) -> Dict[str, dict]:
+        try:
+            with open(self.routes_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _sync_routes(self) -> None:
+        """
+        Применить изменения файла маршрутов, не чаще раза в секунду
+        """
+        now = time.monotonic()
+        if now - self._routes_checked < 1.0:
+            return
+        self._routes_checked = now
+        try:
+            mtime = os.stat(self.routes_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._routes_mtime:
+            return
+        self._routes_mtime = mtime
+        try:
+            routes = self._read_routes_file()
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read model routes: {e}")
+            return
+        for name, route in routes.items():
+            if name not in self._routes:
+                continue
+            try:
+                route = Route(**route)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Invalid route for {name}: {e}")
+                continue
+            if route.to_dict() != self._routes[name].to_dict():
+                try:
+                    self.set_route(name, route)
+                except KeyError as e:
+                    logger.error(f"Invalid route for {name}: {e}")
+
+    def record_shadow(self, name: str, agreed: bool) -> None:
+        stats = self._shadow_stats.setdefault(name, {"requests": 0, "agreed": 0})
+        stats["requests"] += 1
+        stats["agreed"] += agreed
+
+    def routed_specs(self) -> List[ModelSpec]:
+        """
+        Версии, на которые идёт трафик по текущим маршрутам
+        """
+        self._sync_routes()
+        return [
+            self._entries[name, version].spec
+            for name, route in self._routes.items()
+            for version in route.versions()
+        ]
+
+    def spec_status(self, spec: ModelSpec) -> dict:
+        entry = self._entries.get((spec.name, spec.version))
+        return entry.status() if entry is not None else ModelEntry(spec).status()
+
+    def load_all(self) -> None:
+        for name, route in list(self._routes.items()):
+            for version in route.versions():
+                try:
+                    self._entries[name, version].get()
+                except RuntimeError:
+                    continue
+
+    def start(self, mode: str = config.MODEL_LOADING) -> None:
+        """
+        Фоновая загрузка всех моделей (background). В режиме lazy
+        загрузка откладывается до первого запроса
+        """
+        self._sync_routes()
+        if mode == "background" and self._thread is None:
+            self._thread = threading.Thread(
+                target=self.load_all, name="model-loader", daemon=True
+            )
+            self._thread.start()
+
+    def ready(self, mode: str = config.MODEL_LOADING) -> bool:
+        states = [
+            self._entries[name, version].state
+            for name, route in self._routes.items()
+            for version in route.versions()
+        ]
+        if mode == "lazy":
+            return FAILED not in states
+        return all(state == READY for state in states)
+
+    def status(self) -> Dict[str, dict]:
+        """
+        Состояние основной версии каждой модели
+        """
+        return {
+            name: self._entries[name, route.active].status()
+            for name, route in self._routes.items()
+        }
+
+    def describe(self, name: str) -> dict:
+        route = self._routes[name]
+        shadow = self._shadow_stats.get(name, {"requests": 0, "agreed": 0})
+        return {
+            "route": route.to_dict(),
+            "versions": {
+                version: self._entries[name, version].status()
+                for version in self.versions(name)
+            },
+            "shadow": {
+                **shadow,
+                "agreement": (
+                    shadow["agreed"] / shadow["requests"]
+                    if shadow["requests"]
+                    else None
+                ),
+            },
+        }
+
+
+def _bucket(key: str) -> float:
+    """
+    Детерминированное число [0, 100) по ключу запроса
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") / 2**32 * 100
+
+
+class ModelGroup(Mapping):
+    """
+    Словарь имя -> основная версия модели поверх реестра: проверка имени
+    и перебор не загружают модели, загрузка происходит при обращении
+    по ключу
+    """
+
+    def __init__(self, registry: ModelRegistry, names: List[str]):
+        self._registry = registry
+        self._names = tuple(names)
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._names:
+            raise KeyError(name)
+        return self._registry.get(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+model_registry = ModelRegistry()
@@ -1,97 +1,1229 @@
-from typing import Optional
-from fastapi import APIRouter, HTTPException, File, UploadFile
-from text_processing import get_sentiment
+import asyncio
+import json
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    File,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.websockets import WebSocketState
 from schemas import (
+    AnalysisResult,
+    ClipError,
+    EnsemblePrediction,
+    JobCreated,
+    JobStatus,
+    LongPredictionResult,
     PredictionResult,
+    RouteUpdate,
+    SegmentPrediction,
+    StreamPrediction,
+    TextSentiment,
+    VoiceAnalysis,
 )
 from logger import get_logger
 from utils import (
+    decode_content,
     process_audio_input,
+    receive_batch,
     generate_request_id,
+    receive_upload,
+    Upload,
+    transcribe,
+)
+from asr import asr_engine
+from audio_processing import audio_processor
+from batching import sentiment_batcher, voice_batcher, voice_batchers
+from cache import (
+    audio_hash,
+    caches,
+    feature_cache,
+    result_cache,
+    sentiment_cache,
+    text_hash,
 )
-from models import rf_model, torch_model
+from coalescing import upload_flights
+from ensemble import TEXT_SOURCE, check_weights, fuse, parse_weights
+from executors import worker_pool
+from feature_store import feature_store
+from jobs import FINISHED, KINDS, QUEUED, check_webhook, job_queue, job_summary
+from models import VOICE_MODELS, predict_voice_batch
+from registry import READY, ModelSpec, Route, model_registry
+from segmentation import EnergySegmenter, iter_blocks, summarize_segments
+from streaming import StreamSession
+import config
+import metrics
 
 router = APIRouter(prefix="/api")
 logger = get_logger(__name__)
 
 
+@router.post("/predict/{model}", response_model=PredictionResult)
+async def predict_emotion(
+    model: str,
+    file: Optional[UploadFile] = File(None),
+    version: Optional[str] = None,
+    check_text: bool = False,
+    include_transcript: bool = False,
+):
+    """
+    Распознавание эмоции в голосе моделью model (rf, fcnn). Без version
+    запрос обслуживает основная или канареечная версия по маршруту модели
+    """
+    if model not in VOICE_MODELS:
+        raise HTTPException(404, detail=f"Unknown model: {model}")
+    return await _predict(model, file, check_text, include_transcript, version)
+
+
 @router.post("/predict_rf", response_model=PredictionResult)
 async def predict_emotion_rf(
     file: Optional[UploadFile] = File(None),
     check_text: bool = False,
+    include_transcript: bool = False,
 ):
     """
     Распознавание эмоции в голосе с помощью деревьев
     с информацией о вероятностях
     """
-    request_id = generate_request_id()
+    return await _predict("rf", file, check_text, include_transcript)
+
+
+@router.post("/predict_fcnn", response_model=PredictionResult)
+async def predict_emotion_ml(
+    file: Optional[UploadFile] = File(None),
+    check_text: bool = False,
+    include_transcript: bool = False,
+):
+    """
+    Распознавание эмоции в голосе с помощью полносвязной сети и
+    информацией о вероятностях
+    """
+    return await _predict("fcnn", file, check_text, include_transcript)
+
+
+async def _predict(
+    model_name: str,
+    file: Optional[UploadFile],
+    check_text: bool,
+    include_transcript: bool,
+    version: Optional[str] = None,
+) -> PredictionResult:
+    analysis = await _analyze(
+        file,
+        [(model_name, version)],
+        with_text=check_text,
+        include_transcript=include_transcript,
+        weights=None,
+        status_code=404,
+    )
+    voice = analysis.voice[model_name]
+    if voice.error is not None:
+        raise HTTPException(500, detail=voice.error)
+    sentiment = analysis.sentiment
+    return PredictionResult(
+        request_id=analysis.request_id,
+        text=analysis.text,
+        voice_emotion=voice.voice_emotion,
+        details=voice.details,
+        text_emotion=sentiment.text_emotion if sentiment else None,
+        text_label_probability=(
+            sentiment.text_label_probability if sentiment else None
+        ),
+        served_by=voice.served_by,
+    )
+
+
+@router.post("/analyze", response_model=AnalysisResult)
+async def analyze(
+    file: Optional[UploadFile] = File(None),
+    models: str = "rf,fcnn,text",
+    ensemble: bool = True,
+    weights: Optional[str] = None,
+    include_transcript: bool = False,
+):
+    """
+    Анализ записи несколькими моделями за один запрос. Файл декодируется
+    и признаки извлекаются один раз, голосовые модели (rf, fcnn, версия
+    через rf@v2) и тональность текста (text) работают параллельно.
+    ensemble добавляет взвешенное среднее вероятностей всех ответов,
+    веса задаются строкой rf=1,fcnn=1,text=0.5
+    """
+    voice, with_text = _parse_models(models)
+    sources = [name for name, _ in voice] + ([TEXT_SOURCE] if with_text else [])
     try:
-        audio_path, text = await process_audio_input(file, request_id)
+        ensemble_weights = parse_weights(weights or config.ENSEMBLE_WEIGHTS)
+        if ensemble:
+            check_weights(sources, ensemble_weights)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return await _analyze(
+        file,
+        voice,
+        with_text=with_text,
+        include_transcript=include_transcript,
+        weights=ensemble_weights if ensemble else None,
+    )
 
-        prediction = rf_model.predict_with_probabilities(request_id, audio_path)
 
-        if "error" in prediction:
-            raise HTTPException(500, detail=prediction["error"])
+def _parse_models(models: str) -> Tuple[List[Tuple[str, Optional[str]]], bool]:
+    """
+    Список голосовых моделей (имя, версия) и флаг тональности текста
+    из строки вида "rf@v2,fcnn,text"
+    """
+    voice = []
+    with_text = False
+    for item in models.split(","):
+        item = item.strip()
+        if item == TEXT_SOURCE:
+            with_text = True
+        elif item:
+            name, _, version = item.partition("@")
+            if name not in VOICE_MODELS:
+                raise HTTPException(400, detail=f"Unknown model: {name}")
+            if any(name == other for other, _ in voice):
+                raise HTTPException(400, detail=f"Model {name} is listed twice")
+            voice.append((name, version or None))
+    if not voice and not with_text:
+        raise HTTPException(400, detail="No models requested")
+    return voice, with_text
+
 
-        text_emotion = None
-        text_label_probability = None
-        if check_text:
-            text_emotion, probs = get_sentiment(text)
-            text_label_probability = max(probs) if probs is not None else None
+async def _analyze(
+    file: Optional[UploadFile],
+    voice: List[Tuple[str, Optional[str]]],
+    with_text: bool,
+    include_transcript: bool,
+    weights: Optional[Dict[str, float]],
+    status_code: int = 400,
+) -> AnalysisResult:
+    request_id = generate_request_id()
+    upload = await receive_upload(file, request_id)
 
-        result = PredictionResult(
-            request_id=request_id,
-            text=text,
-            voice_emotion=prediction["emotion"],
-            details=prediction["detail"],
-            text_emotion=text_emotion,
-            text_label_probability=text_label_probability,
+    # Повтор того же файла с теми же параметрами, пока первый запрос
+    # выполняется, ждёт его результат и не занимает место в очереди.
+    # Код ошибки различает вызовы из разных обработчиков
+    flight_key = ":".join(
+        [
+            upload.key,
+            *(f"{name}@{version}" for name, version in voice),
+            f"text={with_text}",
+            f"transcript={include_transcript}",
+            f"weights={sorted(weights.items()) if weights else None}",
+            f"status={status_code}",
+        ]
+    )
+    # Файл принадлежит запросу, который выполняет обработку
+    if upload_flights.joinable(flight_key):
+        upload.discard()
+    result = await upload_flights.run(
+        flight_key,
+        lambda: _run_analysis(
+            request_id,
+            upload,
+            voice,
+            with_text,
+            include_transcript,
+            weights,
+            status_code,
+        ),
+    )
+    if result.request_id != request_id:
+        logger.info(
+            f"{request_id}: Coalesced with in-flight request {result.request_id}"
         )
+        result = result.model_copy(update={"request_id": request_id})
+    return result
+
+
+async def _run_analysis(
+    request_id: str,
+    upload: Upload,
+    voice: List[Tuple[str, Optional[str]]],
+    with_text: bool,
+    include_transcript: bool,
+    weights: Optional[Dict[str, float]],
+    status_code: int,
+) -> AnalysisResult:
+    try:
+        async with worker_pool.admit(request_id):
+            audio_data, audio_key = await process_audio_input(upload.path, request_id)
+
+            routed = [
+                _resolve_model(name, version, audio_key, status_code)
+                for name, version in voice
+            ]
+            result_key = ":".join(
+                [
+                    audio_key,
+                    *(spec.key for spec, _ in routed),
+                    f"text={with_text}",
+                    f"transcript={include_transcript}",
+                    f"weights={sorted(weights.items()) if weights else None}",
+                ]
+            )
+            cached = result_cache.get(result_key)
+            if cached is not None:
+                logger.info(f"{request_id}: Analysis served from cache")
+                return AnalysisResult(request_id=request_id, **cached)
+
+            # Признаки извлекаются один раз для всех голосовых моделей,
+            # распознавание речи и тональность идут параллельно с ними
+            predictions, (text, sentiment) = await asyncio.gather(
+                _voice_predictions(request_id, routed, audio_key, audio_data),
+                _text_analysis(
+                    request_id, audio_data, audio_key, with_text, include_transcript
+                ),
+            )
 
-        return result
+            result = AnalysisResult(
+                request_id=request_id,
+                text=text,
+                voice={
+                    spec.name: VoiceAnalysis(
+                        voice_emotion=prediction.get("emotion"),
+                        details=prediction.get("detail"),
+                        served_by=spec.key,
+                        error=prediction.get("error"),
+                    )
+                    for (spec, _), prediction in zip(routed, predictions)
+                },
+                sentiment=sentiment,
+            )
+            succeeded = {
+                name: output.details
+                for name, output in result.voice.items()
+                if output.error is None
+            }
+            if weights is not None and (succeeded or sentiment is not None):
+                # Ненулевой вес могли иметь только модели, ответившие ошибкой
+                try:
+                    emotion, details, used = fuse(
+                        succeeded, sentiment.details if sentiment else None, weights
+                    )
+                except ValueError as e:
+                    logger.warning(f"{request_id}: Ensemble skipped: {e}")
+                else:
+                    result.ensemble = EnsemblePrediction(
+                        emotion=emotion, details=details, weights=used
+                    )
+            if len(succeeded) == len(routed):
+                result_cache.set(result_key, result.model_dump(exclude={"request_id"}))
+            return result
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"{request_id}: Error in detailed prediction: {str(e)}")
+        logger.error(f"{request_id}: Error in analysis: {str(e)}")
         raise HTTPException(500, detail=str(e))
+    finally:
+        upload.discard()
 
 
-@router.post("/predict_fcnn", response_model=PredictionResult)
-async def predict_emotion_ml(
-    file: Optional[UploadFile] = File(None),
+async def _voice_predictions(
+    request_id: str,
+    routed: List[Tuple[ModelSpec, Optional[ModelSpec]]],
+    audio_key: str,
+    audio_data: np.ndarray,
+) -> List[dict]:
+    if not routed:
+        return []
+    features = await _extract_features(request_id, audio_key, audio_data)
+    return await asyncio.gather(
+        *(_predict_voice(request_id, spec, features, shadow) for spec, shadow in routed)
+    )
+
+
+async def _text_analysis(
+    request_id: str,
+    audio_data: np.ndarray,
+    audio_key: str,
+    with_text: bool,
+    include_transcript: bool,
+) -> Tuple[Optional[str], Optional[TextSentiment]]:
+    if not (with_text or include_transcript):
+        return None, None
+    text = await transcribe(request_id, audio_data, audio_key)
+    sentiment = await _text_sentiment(request_id, text) if with_text else None
+    return text, sentiment
+
+
+def _resolve_model(
+    model_name: str, version: Optional[str], key: str, status_code: int = 400
+) -> Tuple[ModelSpec, Optional[ModelSpec]]:
+    if model_name not in VOICE_MODELS:
+        raise HTTPException(status_code, detail=f"Unknown model: {model_name}")
+    try:
+        return model_registry.resolve(model_name, version, key)
+    except KeyError as e:
+        raise HTTPException(status_code, detail=e.args[0])
+
+
+async def _predict_voice(
+    request_id: str,
+    spec: ModelSpec,
+    features: np.ndarray,
+    shadow: Optional[ModelSpec] = None,
+) -> dict:
+    prediction = await voice_batcher(spec).submit(request_id, features)
+    if shadow is not None and "error" not in prediction:
+        task = asyncio.create_task(
+            _shadow_predict(request_id, shadow, features, prediction)
+        )
+        shadow_tasks.add(task)
+        task.add_done_callback(shadow_tasks.discard)
+    return prediction
+
+
+shadow_tasks = set()
+
+
+async def _shadow_predict(
+    request_id: str, spec: ModelSpec, features: np.ndarray, primary: dict
+) -> None:
+    """
+    Копия запроса в теневую версию: ответ клиенту уже отправлен или
+    не ждёт её, в статистику реестра идёт совпадение эмоций
+    """
+    try:
+        prediction = await voice_batcher(spec).submit(request_id, features)
+    except HTTPException:
+        logger.warning(f"{request_id}: Shadow {spec.key} skipped, queue is full")
+        return
+    if "error" in prediction:
+        logger.warning(f"{request_id}: Shadow {spec.key} failed: {prediction['error']}")
+        return
+    model_registry.record_shadow(spec.name, prediction["emotion"] == primary["emotion"])
+    logger.info(
+        f"{request_id}: Shadow {spec.key} predicted {prediction['emotion']}, "
+        f"served {primary['emotion']}"
+    )
+
+
+async def _extract_features(
+    request_id: str, audio_key: str, audio_data: np.ndarray
+) -> np.ndarray:
+    features = feature_cache.get(audio_key)
+    if features is not None:
+        return features
+    if feature_store is not None:
+        features = await _read_feature_store(request_id, audio_key)
+    if features is None:
+        features = await worker_pool.run_cpu(
+            audio_processor.extract_features, request_id, audio_data
+        )
+        if feature_store is not None and config.FEATURE_STORE_MODE == "write":
+            await _write_feature_store(request_id, audio_key, features)
+    feature_cache.set(audio_key, features)
+    return features
+
+
+async def _read_feature_store(request_id: str, audio_key: str) -> Optional[np.ndarray]:
+    try:
+        return await worker_pool.run_io(feature_store.get, audio_key)
+    except Exception as e:
+        logger.error(f"{request_id}: Error reading feature store: {str(e)}")
+        return None
+
+
+async def _write_feature_store(
+    request_id: str, audio_key: str, features: np.ndarray
+) -> None:
+    try:
+        await worker_pool.run_io(feature_store.put, audio_key, features)
+    except Exception as e:
+        logger.error(f"{request_id}: Error writing feature store: {str(e)}")
+
+
+async def _text_sentiment(request_id: str, text: str) -> TextSentiment:
+    # В кэше вероятности всех классов, ключ отличается от прежнего
+    # формата записей с одной вероятностью
+    key = f"{text_hash(text)}:classes"
+    cached = sentiment_cache.get(key)
+    if cached is not None:
+        return TextSentiment(**cached)
+    prediction = await sentiment_batcher.submit(request_id, text)
+    if isinstance(prediction, dict):
+        raise HTTPException(500, detail=prediction["error"])
+    text_emotion, probabilities = prediction
+    sentiment = TextSentiment(
+        text_emotion=text_emotion,
+        text_label_probability=max(probabilities.values()),
+        details=probabilities,
+    )
+    sentiment_cache.set(key, sentiment.model_dump())
+    return sentiment
+
+
+@router.post("/predict_batch")
+async def predict_emotion_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    model: str = "rf",
+    version: Optional[str] = None,
     check_text: bool = False,
+    include_transcript: bool = False,
 ):
     """
-    Распознавание эмоции в голосе с помощью полносвязной сети и
-    информацией о вероятностях
+    Пакетное распознавание эмоций для нескольких аудиофайлов или zip/tar
+    архива. Результаты по каждому файлу возвращаются в формате NDJSON
+    по мере готовности
     """
-    request_id = generate_request_id()
+    batch_id = generate_request_id()
+    spec, _ = _resolve_model(model, version, batch_id)
+    if not files:
+        raise HTTPException(status_code=400, detail="File is required")
+
+    # Файлы и содержимое архивов лежат на диске до конца ответа,
+    # в память клипы читаются по одному при декодировании
+    directory = tempfile.mkdtemp(dir=config.UPLOAD_TMP_DIR, prefix="batch-")
+    uploads = [(file.filename, file.content_type, file.file) for file in files]
     try:
-        audio_path, text = await process_audio_input(file, request_id)
+        clips = await worker_pool.run_io(receive_batch, batch_id, uploads, directory)
+        worker_pool.acquire(batch_id)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    finally:
+        for file in files:
+            await file.close()
+    logger.info(f"{batch_id}: Batch of {len(clips)} clips for model {spec.key}")
+
+    # Место в очереди и каталог освобождаются после ответа, даже если
+    # клиент отключился до того, как началась отдача тела
+    return _BatchResponse(
+        _stream_batch(clips, spec, check_text, include_transcript),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(_finish_batch, batch_id, directory),
+    )
+
+
+class _BatchResponse(StreamingResponse):
+    """
+    Потоковый ответ, фоновая задача которого выполняется ровно один раз,
+    в том числе при обрыве соединения: Starlette в этом случае её
+    пропускает
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        background, self.background = self.background, None
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if background is not None:
+                # Отмена запроса не прерывает освобождение ресурсов
+                await asyncio.shield(background())
 
-        prediction = torch_model.predict_with_probabilities(request_id, audio_path)
 
-        if "error" in prediction:
-            raise HTTPException(500, detail=prediction["error"])
+def _finish_batch(batch_id: str, directory: str) -> None:
+    worker_pool.release()
+    shutil.rmtree(directory, ignore_errors=True)
+    logger.info(f"{batch_id}: Batch finished")
 
-        text_emotion = None
-        text_label_probability = None
-        if check_text:
-            text_emotion, probs = get_sentiment(text)
-            text_label_probability = max(probs) if probs is not None else None
 
-        result = PredictionResult(
-            request_id=request_id,
-            text=text,
-            voice_emotion=prediction["emotion"],
-            details=prediction["detail"],
-            text_emotion=text_emotion,
-            text_label_probability=text_label_probability,
+async def _prepare_clip(
+    filename: str,
+    path: str,
+    check_text: bool,
+    include_transcript: bool,
+    semaphore: asyncio.Semaphore,
+) -> dict:
+    request_id = generate_request_id()
+    clip = {"request_id": request_id, "filename": filename, "error": None}
+    async with semaphore:
+        try:
+            audio_data = await decode_content(request_id, path)
+            audio_key = audio_hash(audio_data)
+            clip["features"] = await _extract_features(
+                request_id, audio_key, audio_data
+            )
+            clip["text"] = None
+            if check_text or include_transcript:
+                clip["text"] = await transcribe(request_id, audio_data, audio_key)
+            sentiment = None
+            if check_text:
+                sentiment = await _text_sentiment(request_id, clip["text"])
+            clip["text_emotion"] = sentiment.text_emotion if sentiment else None
+            clip["text_label_probability"] = (
+                sentiment.text_label_probability if sentiment else None
+            )
+        except HTTPException as e:
+            clip["error"] = e.detail
+        except Exception as e:
+            logger.error(f"{request_id}: Error preparing batch clip: {str(e)}")
+            clip["error"] = str(e)
+    return clip
+
+
+async def _stream_batch(
+    clips: List[tuple],
+    spec: ModelSpec,
+    check_text: bool,
+    include_transcript: bool,
+):
+    # Декодирование и признаки считаются параллельно, а готовые к моменту
+    # опроса файлы уходят в модель одним векторизованным вызовом
+    semaphore = asyncio.Semaphore(max(worker_pool.cpu_workers * 2, 1))
+    pending = {
+        asyncio.create_task(
+            _prepare_clip(filename, path, check_text, include_transcript, semaphore)
         )
+        for filename, path in clips
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            ready = []
+            for task in done:
+                clip = task.result()
+                if clip["error"] is None:
+                    ready.append(clip)
+                else:
+                    yield _clip_error(clip, clip["error"])
+            if not ready:
+                continue
+
+            predictions = await worker_pool.run_cpu(
+                predict_voice_batch,
+                spec,
+                [clip["request_id"] for clip in ready],
+                np.vstack([clip["features"] for clip in ready]),
+            )
+            for clip, prediction in zip(ready, predictions):
+                if "error" in prediction:
+                    yield _clip_error(clip, prediction["error"])
+                    continue
+                result = PredictionResult(
+                    request_id=clip["request_id"],
+                    text=clip["text"],
+                    voice_emotion=prediction["emotion"],
+                    details=prediction["detail"],
+                    text_emotion=clip["text_emotion"],
+                    text_label_probability=clip["text_label_probability"],
+                    filename=clip["filename"],
+                    served_by=spec.key,
+                )
+                yield result.model_dump_json() + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _clip_error(clip: dict, error: str) -> str:
+    item = ClipError(
+        request_id=clip["request_id"], filename=clip["filename"], error=error
+    )
+    return item.model_dump_json() + "\n"
+
+
+@router.post("/predict_long", response_model=LongPredictionResult)
+async def predict_emotion_long(
+    file: Optional[UploadFile] = File(None),
+    model: str = "rf",
+    version: Optional[str] = None,
+):
+    """
+    Распознавание эмоций в длинной записи (звонок целиком). Файл
+    декодируется блоками, паузы отбрасываются по энергии, фрагменты
+    речи оцениваются параллельно. Возвращается хронология эмоций
+    по фрагментам и сводка по всей записи
+    """
+    request_id = generate_request_id()
+    spec, _ = _resolve_model(model, version, request_id)
+    if not file:
+        raise HTTPException(status_code=400, detail="File is required")
+    if not (file.content_type and file.content_type.startswith("audio/")):
+        raise HTTPException(status_code=400, detail="Uploaded file is not an audio")
 
-        return result
+    try:
+        async with worker_pool.admit(request_id):
+            segments, duration = await _score_segments(request_id, file, spec)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"{request_id}: Error in detailed prediction: {str(e)}")
+        logger.error(f"{request_id}: Error in long audio prediction: {str(e)}")
         raise HTTPException(500, detail=str(e))
+    finally:
+        await file.close()
+
+    logger.info(
+        f"{request_id}: Long audio of {duration:.1f}s scored in "
+        f"{len(segments)} segments"
+    )
+    return LongPredictionResult(
+        request_id=request_id,
+        segments=segments,
+        summary=summarize_segments(segments, duration),
+    )
+
+
+async def _score_segments(
+    request_id: str, file: UploadFile, spec: ModelSpec
+) -> Tuple[List[SegmentPrediction], float]:
+    sample_rate = audio_processor.SAMPLE_RATE
+    max_samples = config.LONG_MAX_DURATION_SECONDS * sample_rate
+    segmenter = EnergySegmenter(sample_rate)
+    blocks = iter_blocks(file.file, sample_rate)
+
+    # Число фрагментов в обработке ограничено, поэтому память не зависит
+    # от длины записи: в ней блок, открытый фрагмент и очередь признаков
+    limit = max(worker_pool.cpu_workers * 2, 1)
+    pending = set()
+    ready = []
+
+    async def extract(start: int, samples: np.ndarray) -> dict:
+        segment = {"start": start, "end": start + len(samples), "error": None}
+        try:
+            segment["features"] = await worker_pool.run_cpu(
+                audio_processor.extract_features, request_id, samples
+            )
+        except Exception as e:
+            logger.error(f"{request_id}: Error extracting segment features: {e}")
+            segment["error"] = str(e)
+        return segment
+
+    try:
+        while True:
+            try:
+                block = await worker_pool.run_io(next, blocks, None)
+            except Exception as e:
+                logger.error(f"{request_id}: Error decoding long audio: {e}")
+                raise HTTPException(status_code=400, detail="Failed to decode audio")
+            segments = segmenter.flush() if block is None else segmenter.push(block)
+            for start, samples in segments:
+                if len(pending) >= limit:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    ready.extend(task.result() for task in done)
+                pending.add(asyncio.create_task(extract(start, samples)))
+            if block is None:
+                break
+            if segmenter.total > max_samples:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Audio exceeds {config.LONG_MAX_DURATION_SECONDS:.0f}s",
+                )
+        if pending:
+            ready.extend(await asyncio.gather(*pending))
+            pending = set()
+    finally:
+        for task in pending:
+            task.cancel()
+        # Закрытие останавливает ffmpeg и ждёт его, поэтому не в цикле событий
+        await worker_pool.run_io(blocks.close)
+
+    ready.sort(key=lambda segment: segment["start"])
+    scored = [segment for segment in ready if segment["error"] is None]
+    if scored:
+        predictions = await worker_pool.run_cpu(
+            predict_voice_batch,
+            spec,
+            [f"{request_id}:{segment['start']}" for segment in scored],
+            np.vstack([segment["features"] for segment in scored]),
+        )
+        for segment, prediction in zip(scored, predictions):
+            segment["prediction"] = prediction
+
+    timeline = []
+    for segment in ready:
+        prediction = segment.get("prediction", {"error": segment["error"]})
+        timeline.append(
+            SegmentPrediction(
+                start=segment["start"] / sample_rate,
+                end=segment["end"] / sample_rate,
+                voice_emotion=prediction.get("emotion"),
+                details=prediction.get("detail"),
+                error=prediction.get("error"),
+            )
+        )
+    return timeline, segmenter.total / sample_rate
+
+
+active_streams = 0
+
+
+@router.websocket("/stream")
+async def stream_emotion(
+    websocket: WebSocket,
+    model: str = "rf",
+    version: Optional[str] = None,
+    sample_rate: int = config.STREAM_SAMPLE_RATE,
+    window: float = config.STREAM_WINDOW_SECONDS,
+    hop: float = config.STREAM_HOP_SECONDS,
+):
+    """
+    Потоковое распознавание эмоций. Клиент присылает бинарные сообщения
+    с PCM 16 бит mono, сервер на каждый шаг hop отвечает предсказанием
+    по последним window секундам. Если модель не успевает, сервер
+    перестаёт читать сокет, пока очередь кусков не разгрузится
+    """
+    global active_streams
+    request_id = generate_request_id()
+    await websocket.accept()
+    try:
+        spec, _ = _resolve_model(model, version, request_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    if active_streams >= config.STREAM_MAX_SESSIONS:
+        logger.warning(f"{request_id}: Rejected, too many active streams")
+        await websocket.close(code=1013, reason="Too many active streams")
+        return
+    try:
+        session = StreamSession(
+            audio_processor.feature_extractor, sample_rate, window, hop
+        )
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    active_streams += 1
+    logger.info(
+        f"{request_id}: Stream started, model {spec.key}, "
+        f"window {session.window_seconds:.2f}s, hop {session.hop_seconds:.2f}s"
+    )
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=config.STREAM_MAX_PENDING_CHUNKS)
+    receiver = asyncio.create_task(_receive_chunks(websocket, chunks))
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            # Состояние потока живёт в этом процессе, поэтому признаки
+            # считаются в пуле потоков, а не в пуле процессов
+            windows = await worker_pool.run_io(session.push, chunk)
+            for start, features in windows:
+                prediction = await voice_batcher(spec).submit(request_id, features)
+                if "error" in prediction:
+                    raise RuntimeError(prediction["error"])
+                result = StreamPrediction(
+                    request_id=request_id,
+                    start=start,
+                    end=start + session.window_seconds,
+                    voice_emotion=prediction["emotion"],
+                    details=prediction["detail"],
+                )
+                await websocket.send_text(result.model_dump_json())
+        await _close_stream(websocket)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"{request_id}: Error in stream: {str(e)}")
+        await _close_stream(websocket, code=1011, reason=str(e)[:120])
+    finally:
+        receiver.cancel()
+        active_streams -= 1
+        logger.info(f"{request_id}: Stream finished")
+
+
+async def _receive_chunks(websocket: WebSocket, chunks: asyncio.Queue) -> None:
+    """
+    Чтение кусков PCM в ограниченную очередь. Текстовое сообщение
+    "end" или разрыв соединения завершают поток
+    """
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                await chunks.put(message["bytes"])
+            elif message.get("text") == "end":
+                break
+    except BaseException:
+        # Чтение отменено или упало, очередь могут уже не читать: маркер
+        # конца кладётся без ожидания, при полной очереди вместо куска
+        if chunks.full():
+            chunks.get_nowait()
+        chunks.put_nowait(None)
+        raise
+    await chunks.put(None)
+
+
+async def _close_stream(websocket: WebSocket, code: int = 1000, reason: str = ""):
+    if websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.close(code=code, reason=reason)
+
+
+@router.post("/jobs", response_model=JobCreated, status_code=202)
+async def create_job(
+    files: Optional[List[UploadFile]] = File(None),
+    kind: str = "predict",
+    model: str = "rf",
+    check_text: bool = False,
+    priority: int = 0,
+    max_attempts: int = config.JOB_MAX_ATTEMPTS,
+    webhook: Optional[str] = None,
+):
+    """
+    Поставить тяжёлый запрос в очередь: predict (файл или несколько),
+    batch (аудио и zip/tar архивы) или long (длинная запись). Ответ
+    возвращается сразу, результат - через GET /api/jobs/{job_id},
+    поток событий /api/jobs/{job_id}/events или POST на webhook
+    """
+    if kind not in KINDS:
+        raise HTTPException(400, detail=f"Unknown job kind: {kind}")
+    if model not in VOICE_MODELS and not (model == "both" and kind != "long"):
+        raise HTTPException(404, detail=f"Unknown model: {model}")
+    if not files:
+        raise HTTPException(status_code=400, detail="File is required")
+    if kind == "long" and len(files) > 1:
+        raise HTTPException(400, detail="Long job accepts a single file")
+    if kind == "long" and not (
+        files[0].content_type and files[0].content_type.startswith("audio/")
+    ):
+        raise HTTPException(status_code=400, detail="Uploaded file is not an audio")
+    if not 1 <= max_attempts <= config.JOB_MAX_ATTEMPTS_LIMIT:
+        raise HTTPException(
+            400,
+            detail=f"max_attempts must be within [1, {config.JOB_MAX_ATTEMPTS_LIMIT}]",
+        )
+    if webhook is not None:
+        try:
+            check_webhook(webhook)
+        except ValueError as e:
+            raise HTTPException(400, detail=str(e))
+
+    uploads = [(file.filename, file.content_type, file.file) for file in files]
+    try:
+        job_id = await worker_pool.run_io(
+            job_queue.submit,
+            kind,
+            {"model": model, "check_text": check_text},
+            uploads,
+            priority,
+            max_attempts,
+            webhook,
+        )
+    finally:
+        for file in files:
+            await file.close()
+    logger.info(f"{job_id}: Job {kind} queued with {len(files)} files")
+    return JobCreated(job_id=job_id, kind=kind, status=QUEUED)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, after: int = 0):
+    """
+    Состояние задачи и частичные результаты с номерами больше after
+    (для дозапроса новых результатов передаётся next_after)
+    """
+    job = await worker_pool.run_io(job_queue.get, job_id, after)
+    if job is None:
+        raise HTTPException(404, detail=f"Unknown job: {job_id}")
+    return JobStatus(job_id=job_id, **job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, after: int = 0):
+    """
+    Server-Sent Events: progress с новыми частичными результатами
+    и done с итоговым состоянием задачи
+    """
+    if await worker_pool.run_io(job_queue.get, job_id, after, 0) is None:
+        raise HTTPException(404, detail=f"Unknown job: {job_id}")
+    return StreamingResponse(_job_events(job_id, after), media_type="text/event-stream")
+
+
+async def _job_events(job_id: str, after: int):
+    state = None
+    while True:
+        job = await worker_pool.run_io(job_queue.get, job_id, after)
+        # Задачу могли удалить (purge), пока клиент читал поток
+        if job is None:
+            error = json.dumps({"job_id": job_id, "error": "Job not found"})
+            yield f"event: error\ndata: {error}\n\n"
+            return
+        if job["items"] or (job["status"], job["progress"]) != state:
+            state = job["status"], job["progress"]
+            after = job["next_after"]
+            event = {
+                "status": job["status"],
+                "progress": job["progress"],
+                "items": job["items"],
+                "next_after": after,
+            }
+            yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+        if job["status"] in FINISHED:
+            done = json.dumps(job_summary(job))
+            yield f"event: done\ndata: {done}\n\n"
+            return
+        await asyncio.sleep(config.JOB_POLL_SECONDS)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Отменить задачу. Выполняемая задача останавливается после
+    текущей порции результатов
+    """
+    status = await worker_pool.run_io(job_queue.cancel, job_id)
+    if status is None:
+        raise HTTPException(404, detail=f"Unknown job: {job_id}")
+    return {"job_id": job_id, "status": status}
+
+
+@router.get("/ready")
+async def get_ready():
+    """
+    Готовность к приёму запросов: состояние загрузки каждой модели
+    (в каждом процессе пула вычислений). Пока модели не загружены
+    или при ошибке загрузки - 503
+    """
+    if worker_pool.cpu_pool_kind == "process":
+        ready = worker_pool.ready()
+    else:
+        ready = model_registry.ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "loading": config.MODEL_LOADING, **_model_states()},
+    )
+
+
+def _model_states() -> dict:
+    """
+    Состояние моделей там, где выполняются предсказания: в основном
+    процессе или по процессам пула вычислений
+    """
+    if worker_pool.cpu_pool_kind == "process":
+        workers = worker_pool.worker_models()
+        return {"workers": {str(pid): models for pid, models in workers.items()}}
+    return {"models": model_registry.status()}
+
+
+@router.get("/models")
+async def get_models():
+    """
+    Версии голосовых моделей, маршруты и согласие теневых предсказаний
+    """
+    return {name: model_registry.describe(name) for name in VOICE_MODELS}
+
+
+@router.post("/models/{model}/versions/{version}")
+async def add_model_version(model: str, version: str, wait: bool = False):
+    """
+    Зарегистрировать версию из MODEL_VERSIONS_DIR и загрузить её веса
+    (в фоне или с ожиданием при wait=true). Трафик на версию не идёт,
+    пока она не указана в маршруте модели
+    """
+    if model not in VOICE_MODELS:
+        raise HTTPException(404, detail=f"Unknown model: {model}")
+    try:
+        spec = model_registry.add_version(model, version)
+    except KeyError as e:
+        raise HTTPException(404, detail=e.args[0])
+    if wait:
+        try:
+            await worker_pool.run_io(model_registry.warm, spec)
+        except (RuntimeError, TimeoutError) as e:
+            raise HTTPException(500, detail=str(e))
+    else:
+        model_registry.preload(spec)
+    return model_registry.describe(model)
+
+
+@router.delete("/models/{model}/versions/{version}")
+async def remove_model_version(model: str, version: str):
+    """
+    Выгрузить версию, на которую не идёт трафик
+    """
+    if model not in VOICE_MODELS:
+        raise HTTPException(404, detail=f"Unknown model: {model}")
+    try:
+        model_registry.remove_version(model, version)
+    except KeyError:
+        raise HTTPException(404, detail=f"Unknown version {version} of {model}")
+    except ValueError as e:
+        raise HTTPException(409, detail=str(e))
+    return model_registry.describe(model)
+
+
+@router.put("/models/{model}/route", status_code=202)
+async def set_model_route(model: str, update: RouteUpdate):
+    """
+    Новый маршрут модели: основная, канареечная (доля canary_percent)
+    и теневая версии. Версии загружаются в фоне, переключение происходит
+    после загрузки всех версий; прежний маршрут обслуживает запросы
+    до этого момента. Маршрут сохраняется для всех процессов сервиса
+    """
+    if model not in VOICE_MODELS:
+        raise HTTPException(404, detail=f"Unknown model: {model}")
+    try:
+        route = Route(**update.model_dump())
+        model_registry.set_route(model, route)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(404, detail=e.args[0])
+    model_registry.save_routes({model: route})
+    return {"requested": route.to_dict(), **model_registry.describe(model)}
+
+
+@router.get("/stats")
+async def get_stats():
+    """
+    Состояние очередей, статистика микробатчинга, кэшей и распознавания речи
+    """
+    return {
+        "workers": worker_pool.stats(),
+        "batchers": {
+            name: b.stats()
+            for name, b in (*voice_batchers.items(), ("sentiment", sentiment_batcher))
+        },
+        "caches": {name: cache.stats() for name, cache in caches.items()},
+        "coalescing": upload_flights.stats(),
+        "feature_store": feature_store.stats() if feature_store is not None else None,
+        "asr": asr_engine.stats(),
+        **_model_states(),
+        "streams": {
+            "active": active_streams,
+            "max_sessions": config.STREAM_MAX_SESSIONS,
+        },
+        "jobs": job_queue.stats(),
+    }
+
+
+def metric_families() -> List[List[str]]:
+    """
+    Показатели для /metrics, снимаются в момент опроса из тех же
+    источников, что и /api/stats
+    """
+    batchers = {**voice_batchers, "sentiment": sentiment_batcher}
+    batcher_stats = {name: b.stats() for name, b in batchers.items()}
+    cache_stats = {name: cache.stats() for name, cache in caches.items()}
+    workers = worker_pool.stats()
+    asr = asr_engine.stats()
+    coalescing = upload_flights.stats()
+    versions = [
+        ({"model": name, "version": version}, status)
+        for name in model_registry.names()
+        for version, status in model_registry.describe(name)["versions"].items()
+    ]
+    rss = [({"process": "main"}, metrics.process_rss_bytes())]
+    rss += [
+        ({"process": f"cpu-{pid}"}, metrics.process_rss_bytes(pid))
+        for pid in worker_pool.worker_pids()
+    ]
+    return [
+        metrics.family(
+            "http_requests_in_flight",
+            "gauge",
+            "HTTP requests being processed",
+            [({}, metrics.in_flight)],
+        ),
+        metrics.family(
+            "pending_requests",
+            "gauge",
+            "Requests admitted to processing",
+            [({}, workers["pending_requests"])],
+        ),
+        metrics.family(
+            "rejected_requests_total",
+            "counter",
+            "Requests rejected because of a full queue",
+            [({}, workers["rejected_requests"])],
+        ),
+        metrics.family(
+            "batch_queue_depth",
+            "gauge",
+            "Items waiting in a micro-batcher queue",
+            [({"batcher": n}, s["queue_depth"]) for n, s in batcher_stats.items()],
+        ),
+        metrics.family(
+            "batch_items_total",
+            "counter",
+            "Items processed by a micro-batcher",
+            [({"batcher": n}, s["items"]) for n, s in batcher_stats.items()],
+        ),
+        metrics.family(
+            "batches_total",
+            "counter",
+            "Batches run by a micro-batcher",
+            [({"batcher": n}, s["batches"]) for n, s in batcher_stats.items()],
+        ),
+        metrics.family(
+            "cache_hits_total",
+            "counter",
+            "Cache hits",
+            [({"cache": n}, s["hits"]) for n, s in cache_stats.items()],
+        ),
+        metrics.family(
+            "cache_misses_total",
+            "counter",
+            "Cache misses",
+            [({"cache": n}, s["misses"]) for n, s in cache_stats.items()],
+        ),
+        metrics.family(
+            "cache_hit_ratio",
+            "gauge",
+            "Cache hit ratio since start",
+            [({"cache": n}, s["hit_rate"]) for n, s in cache_stats.items()],
+        ),
+        metrics.family(
+            "coalesced_requests_total",
+            "counter",
+            "Requests served by an identical in-flight request",
+            [({}, coalescing["coalesced"])],
+        ),
+        metrics.family(
+            "coalescing_in_flight",
+            "gauge",
+            "Distinct requests that duplicates can attach to",
+            [({}, coalescing["in_flight"])],
+        ),
+        metrics.family(
+            "model_load_seconds",
+            "gauge",
+            "Time spent loading a model version in the main process",
+            [(labels, status["load_seconds"]) for labels, status in versions],
+        ),
+        metrics.family(
+            "model_loaded",
+            "gauge",
+            "Whether a model version is loaded in the main process",
+            [(labels, status["state"] == READY) for labels, status in versions],
+        ),
+        metrics.family(
+            "asr_calls_total",
+            "counter",
+            "Speech recognition calls",
+            [({"backend": asr["backend"]}, asr["calls"])],
+        ),
+        metrics.family(
+            "asr_errors_total",
+            "counter",
+            "Failed speech recognition calls",
+            [({"backend": asr["backend"]}, asr["errors"])],
+        ),
+        metrics.family(
+            "active_streams",
+            "gauge",
+            "Open WebSocket streams",
+            [({}, active_streams)],
+        ),
+        metrics.family(
+            "jobs",
+            "gauge",
+            "Asynchronous jobs by kind and status",
+            [
+                ({"kind": kind, "status": status}, count)
+                for kind, statuses in job_queue.stats().items()
+                for status, count in statuses.items()
+            ],
+        ),
+        metrics.family(
+            "process_resident_memory_bytes",
+            "gauge",
+            "Resident memory of the service and its compute workers",
+            rss,
+        ),
+    ]
@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class EmotionLabel(str, Enum):
@@ -12,8 +12,105 @@ class EmotionLabel(str, Enum):
 
 class PredictionResult(BaseModel):
     request_id: str
-    text: str
+    text: Optional[str] = None
     voice_emotion: Optional[EmotionLabel] = None
     details: dict
     text_emotion: Optional[str] = None
     text_label_probability: Optional[float] = None
+    filename: Optional[str] = None
+    served_by: Optional[str] = None
+
+
+class VoiceAnalysis(BaseModel):
+    voice_emotion: Optional[EmotionLabel] = None
+    details: Optional[dict] = None
+    served_by: Optional[str] = None
+    error: Optional[str] = None
+
+
+class TextSentiment(BaseModel):
+    text_emotion: str
+    text_label_probability: float
+    details: Dict[str, float]
+
+
+class EnsemblePrediction(BaseModel):
+    emotion: EmotionLabel
+    details: Dict[str, float]
+    weights: Dict[str, float]
+
+
+class AnalysisResult(BaseModel):
+    request_id: str
+    text: Optional[str] = None
+    voice: Dict[str, VoiceAnalysis]
+    sentiment: Optional[TextSentiment] = None
+    ensemble: Optional[EnsemblePrediction] = None
+
+
+class ClipError(BaseModel):
+    request_id: str
+    filename: Optional[str] = None
+    error: str
+
+
+class StreamPrediction(BaseModel):
+    request_id: str
+    start: float
+    end: float
+    voice_emotion: Optional[EmotionLabel] = None
+    details: dict
+
+
+class SegmentPrediction(BaseModel):
+    start: float
+    end: float
+    voice_emotion: Optional[EmotionLabel] = None
+    details: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class LongPredictionSummary(BaseModel):
+    duration: float
+    speech_duration: float
+    segments: int
+    dominant_emotion: Optional[EmotionLabel] = None
+    emotion_shares: Dict[str, float]
+    mean_probabilities: Dict[str, float]
+
+
+class LongPredictionResult(BaseModel):
+    request_id: str
+    segments: List[SegmentPrediction]
+    summary: LongPredictionSummary
+
+
+class RouteUpdate(BaseModel):
+    active: str
+    canary: Optional[str] = None
+    canary_percent: float = 0.0
+    shadow: Optional[str] = None
+
+
+class JobCreated(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    progress: float
+    results: int
+    items: List[dict]
+    next_after: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
@@ -0,0 +1,224 @@
+import shutil
+import subprocess
+import threading
+from typing import BinaryIO, Iterator, List, Tuple
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+import config
+from schemas import LongPredictionSummary, SegmentPrediction
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+Segment = Tuple[int, np.ndarray]
+
+# Ожидание завершения ffmpeg после конца его вывода
+FFMPEG_EXIT_SECONDS = 10.0
+
+
+def iter_blocks(
+    fileobj: BinaryIO,
+    sample_rate: int,
+    block_seconds: float = config.LONG_BLOCK_SECONDS,
+) -> Iterator[np.ndarray]:
+    """
+    Потоковое декодирование файла блоками моно float32 с частотой
+    sample_rate. В памяти одновременно находится только один блок
+    """
+    try:
+        sound = sf.SoundFile(fileobj)
+    except Exception:
+        fileobj.seek(0)
+        yield from _iter_ffmpeg_blocks(fileobj, sample_rate, block_seconds)
+        return
+
+    with sound:
+        resampler = None
+        if sound.samplerate != sample_rate:
+            resampler = soxr.ResampleStream(
+                sound.samplerate, sample_rate, 1, dtype="float32"
+            )
+        blocksize = int(block_seconds * sound.samplerate)
+        for block in sound.blocks(blocksize, dtype="float32", always_2d=True):
+            block = block.mean(axis=1)
+            yield block if resampler is None else resampler.resample_chunk(block)
+        if resampler is not None:
+            yield resampler.resample_chunk(np.zeros(0, np.float32), last=True)
+
+
+def _iter_ffmpeg_blocks(
+    fileobj: BinaryIO, sample_rate: int, block_seconds: float
+) -> Iterator[np.ndarray]:
+    """
+    Форматы, которые не читает libsndfile, декодируются ffmpeg в поток
+    PCM через pipe без временных файлов
+    """
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-i",
+            "pipe:0",
+            "-f",
+            "f32le",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    def feed():
+        try:
+            shutil.copyfileobj(fileobj, process.stdin)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    blocksize = int(block_seconds * sample_rate) * 4
+    finished = False
+    timed_out = False
+    try:
+        while True:
+            data = process.stdout.read(blocksize)
+            if not data:
+                break
+            yield np.frombuffer(data[: len(data) // 4 * 4], dtype="<f4")
+        finished = True
+    finally:
+        process.stdout.close()
+        # После конца вывода ffmpeg должен завершиться сам, принудительно
+        # он останавливается, только если чтение прервано раньше
+        if finished:
+            try:
+                process.wait(timeout=FFMPEG_EXIT_SECONDS)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+        if not finished or timed_out:
+            process.kill()
+            process.wait()
+        writer.join()
+    if timed_out:
+        raise ValueError("ffmpeg did not exit after end of output")
+    if process.returncode != 0:
+        raise ValueError(
+            f"ffmpeg failed to decode audio (exit code {process.returncode})"
+        )
+
+
+class EnergySegmenter:
+    """
+    Разбиение потока на фрагменты речи по энергии кадров (VAD).
+    Фрагмент закрывается после паузы min_silence или по достижении
+    max_segment, короткие всплески отбрасываются. Память ограничена
+    одним незакрытым фрагментом
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: float = config.LONG_VAD_FRAME_MS,
+        threshold_db: float = config.LONG_VAD_THRESHOLD_DB,
+        min_silence: float = config.LONG_MIN_SILENCE_SECONDS,
+        min_segment: float = config.LONG_MIN_SEGMENT_SECONDS,
+        max_segment: float = config.LONG_MAX_SEGMENT_SECONDS,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.min_silence_frames = max(int(min_silence * 1000 / frame_ms), 1)
+        self.min_segment_frames = int(min_segment * 1000 / frame_ms)
+        self.max_segment_frames = int(max_segment * 1000 / frame_ms)
+        self.total = 0
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._frames: List[np.ndarray] = []
+        self._start = 0
+        self._silence = 0
+
+    def push(self, block: np.ndarray) -> List[Segment]:
+        """
+        Добавить блок и получить закрытые фрагменты (начало в отсчётах,
+        сигнал)
+        """
+        samples = np.concatenate([self._tail, block])
+        n_frames = len(samples) // self.frame_length
+        self._tail = samples[n_frames * self.frame_length :]
+        frames = samples[: n_frames * self.frame_length].reshape(
+            n_frames, self.frame_length
+        )
+        energy = np.mean(np.square(frames, dtype=np.float64), axis=1)
+        is_speech = 10 * np.log10(energy + 1e-12) > self.threshold_db
+
+        segments = []
+        for frame, speech in zip(frames, is_speech):
+            position = self.total
+            self.total += self.frame_length
+            if not self._frames:
+                if speech:
+                    self._start = position
+                    self._frames.append(frame)
+                    self._silence = 0
+                continue
+            self._frames.append(frame)
+            self._silence = 0 if speech else self._silence + 1
+            if self._silence >= self.min_silence_frames:
+                segments.extend(self._close(trim=self._silence))
+            elif len(self._frames) >= self.max_segment_frames:
+                segments.extend(self._close(trim=0))
+        return segments
+
+    def flush(self) -> List[Segment]:
+        self.total += len(self._tail)
+        self._tail = np.zeros(0, dtype=np.float32)
+        return self._close(trim=self._silence) if self._frames else []
+
+    def _close(self, trim: int) -> List[Segment]:
+        frames = self._frames[: len(self._frames) - trim]
+        self._frames = []
+        self._silence = 0
+        if len(frames) < max(self.min_segment_frames, 1):
+            return []
+        return [(self._start, np.concatenate(frames))]
+
+
+def summarize_segments(
+    segments: List[SegmentPrediction], duration: float
+) -> LongPredictionSummary:
+    """
+    Доли эмоций и средние вероятности, взвешенные по длительности речи
+    """
+    shares = {}
+    probabilities = {}
+    speech = 0.0
+    for segment in segments:
+        if segment.error is not None:
+            continue
+        length = segment.end - segment.start
+        speech += length
+        label = segment.voice_emotion.value
+        shares[label] = shares.get(label, 0.0) + length
+        for name, value in segment.details.items():
+            probabilities[name] = probabilities.get(name, 0.0) + value * length
+    if speech:
+        shares = {label: value / speech for label, value in shares.items()}
+        probabilities = {name: value / speech for name, value in probabilities.items()}
+    return LongPredictionSummary(
+        duration=duration,
+        speech_duration=speech,
+        segments=len(segments),
+        dominant_emotion=max(shares, key=shares.get) if shares else None,
+        emotion_shares=shares,
+        mean_probabilities=probabilities,
+    )
@@ -0,0 +1,279 @@
+"""
+Среды исполнения модели тональности rubert-tiny: исходная fp32,
+динамически квантованная int8, TorchScript и ONNX Runtime.
+
+Конвертация, проверка расхождения с fp32 и замер скорости:
+    python sentiment_runtime.py --runtime onnx --validate --benchmark
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+from torch import nn
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+RUNTIMES = ("fp32", "int8", "torchscript", "onnx")
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+SAMPLE_TEXTS = [
+    "неизвестная речь",
+    "привет",
+    "спасибо большое, всё отлично",
+    "это ужасно, я очень недоволен обслуживанием",
+    "перезвоните мне завтра после обеда",
+    "почему так долго никто не отвечает",
+    "мне грустно, что так получилось",
+    "да",
+    "нет, мне это не подходит, отмените заказ",
+    "здравствуйте, я хотел бы уточнить статус заявки",
+]
+
+
+def runtime_path(model_dir: str, runtime: str) -> str:
+    return os.path.join(
+        model_dir,
+        {"torchscript": "model.torchscript.pt", "onnx": "model.onnx"}[runtime],
+    )
+
+
+class _LogitsOnly(nn.Module):
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+        ).logits
+
+
+def _example_inputs(tokenizer) -> tuple:
+    batch = tokenizer(SAMPLE_TEXTS[:2], return_tensors="pt", padding=True)
+    return tuple(batch[name] for name in INPUT_NAMES)
+
+
+def export_torchscript(model: nn.Module, tokenizer, path: str) -> None:
+    with torch.inference_mode():
+        traced = torch.jit.trace(
+            _LogitsOnly(model).eval(), _example_inputs(tokenizer), strict=False
+        )
+    traced = torch.jit.freeze(traced)
+    traced.save(path)
+
+
+def export_onnx(model: nn.Module, tokenizer, path: str) -> None:
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES}
+    dynamic_axes["logits"] = {0: "batch"}
+    torch.onnx.export(
+        _LogitsOnly(model).eval(),
+        _example_inputs(tokenizer),
+        path,
+        input_names=list(INPUT_NAMES),
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False,
+    )
+
+
+def load_runtime(runtime: str, model: nn.Module, model_dir: str) -> Callable:
+    """
+    Функция, возвращающая логиты (numpy) по выходу токенизатора
+    в выбранной среде исполнения
+    """
+    if runtime == "fp32":
+
+        def run(batch):
+            with torch.inference_mode():
+                return model(**batch).logits.cpu().numpy()
+
+        return run
+
+    if runtime == "int8":
+        # inplace: fp32 веса линейных слоёв не держим в памяти вместе с int8
+        quantized = torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+        def run(batch):
+            with torch.inference_mode():
+                return quantized(**batch).logits.numpy()
+
+        return run
+
+    if runtime == "torchscript":
+        scripted = torch.jit.load(runtime_path(model_dir, runtime))
+
+        def run(batch):
+            with torch.inference_mode():
+                return scripted(*(batch[name] for name in INPUT_NAMES)).numpy()
+
+        return run
+
+    if runtime == "onnx":
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        session = ort.InferenceSession(
+            runtime_path(model_dir, runtime),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+
+        def run(batch):
+            inputs = {name: batch[name].cpu().numpy() for name in INPUT_NAMES}
+            return session.run(["logits"], inputs)[0]
+
+        return run
+
+    raise ValueError(f"Unknown sentiment runtime: {runtime}")
+
+
+def _load_reference(model_dir: str):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    return tokenizer, model.eval()
+
+
+def _probabilities(run: Callable, tokenizer, texts: List[str]) -> np.ndarray:
+    batch = tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
+    logits = run(batch)
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+def validate(runtime: str, model_dir: str, texts: List[str]) -> Dict:
+    """
+    Совпадение меток и расхождение вероятностей с fp32 моделью
+    """
+    tokenizer, model = _load_reference(model_dir)
+    reference = _probabilities(load_runtime("fp32", model, model_dir), tokenizer, texts)
+    candidate = _probabilities(
+        load_runtime(runtime, model, model_dir), tokenizer, texts
+    )
+    drift = np.abs(candidate - reference)
+    return {
+        "runtime": runtime,
+        "texts": len(texts),
+        "label_agreement": float(
+            np.mean(candidate.argmax(axis=1) == reference.argmax(axis=1))
+        ),
+        "max_probability_drift": float(drift.max()),
+        "mean_probability_drift": float(drift.mean()),
+    }
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark(runtime: str, model_dir: str, batch_size: int, repeat: int) -> Dict:
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    baseline_rss = _rss_mb()
+    model = None
+    if runtime in ("fp32", "int8"):
+        _, model = _load_reference(model_dir)
+    run = load_runtime(runtime, model, model_dir)
+    single = tokenizer(SAMPLE_TEXTS[:1], return_tensors="pt", padding=True)
+    texts = (SAMPLE_TEXTS * (batch_size // len(SAMPLE_TEXTS) + 1))[:batch_size]
+    batch = tokenizer(texts, return_tensors="pt", padding=True)
+
+    run(single)
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(single)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        run(batch)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "runtime": runtime,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "throughput_texts_per_s": batch_size * repeat / elapsed,
+        "model_rss_mb": _rss_mb() - baseline_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model-dir", default="models/rubert-tiny-sentiment-balanced")
+    parser.add_argument("--runtime", choices=RUNTIMES, default="onnx")
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--texts", help="Файл с текстами для проверки, по строке")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--bench-one", choices=RUNTIMES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bench_one:
+        result = benchmark(args.bench_one, args.model_dir, args.batch_size, args.repeat)
+        print(json.dumps(result))
+        return
+
+    if args.runtime in ("torchscript", "onnx"):
+        tokenizer, model = _load_reference(args.model_dir)
+        path = runtime_path(args.model_dir, args.runtime)
+        export = export_torchscript if args.runtime == "torchscript" else export_onnx
+        export(model, tokenizer, path)
+        logger.info(f"Exported {args.runtime} sentiment model to {path}")
+
+    if args.validate:
+        texts = SAMPLE_TEXTS
+        if args.texts:
+            with open(args.texts, encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        print(json.dumps(validate(args.runtime, args.model_dir, texts), indent=2))
+
+    if args.benchmark:
+        # Каждая среда меряется в отдельном процессе, чтобы RSS не смешивался
+        for runtime in dict.fromkeys(("fp32", "int8", args.runtime)):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--model-dir",
+                    args.model_dir,
+                    "--bench-one",
+                    runtime,
+                    "--batch-size",
+                    str(args.batch_size),
+                    "--repeat",
+                    str(args.repeat),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            print(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
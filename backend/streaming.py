@@ -0,0 +1,192 @@
+from typing import List, Tuple
+
+import numpy as np
+import soxr
+from numpy.lib.stride_tricks import sliding_window_view
+
+import config
+from features import MFCCExtractor, delta_mean_weights
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер отсчётов с адресацией по абсолютному номеру отсчёта
+    в потоке. Хранит последние capacity отсчётов
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self.total = 0
+
+    def write(self, samples: np.ndarray) -> None:
+        if len(samples) > self.capacity:
+            raise ValueError(f"Chunk of {len(samples)} exceeds ring buffer size")
+        start = self.total % self.capacity
+        head = min(len(samples), self.capacity - start)
+        self._data[start : start + head] = samples[:head]
+        self._data[: len(samples) - head] = samples[head:]
+        self.total += len(samples)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """
+        Копия отсчётов [start, stop) потока
+        """
+        if start < self.total - self.capacity or stop > self.total:
+            raise IndexError(f"Samples [{start}, {stop}) are not in the buffer")
+        begin = start % self.capacity
+        end = begin + stop - start
+        if end <= self.capacity:
+            return self._data[begin:end].copy()
+        return np.concatenate([self._data[begin:], self._data[: end - self.capacity]])
+
+
+class SlidingWindowMFCC:
+    """
+    26 признаков по скользящему окну потока с шагом hop.
+
+    Кадры внутри окна не зависят от его границ и совпадают с кадрами
+    потока, поэтому их лог-мел спектр считается один раз и хранится
+    в кольцевом кэше. На каждом шаге заново считаются только краевые
+    кадры с нулевым дополнением, обрезка top_db и средние по окну;
+    DCT применяется к двум усреднённым векторам, а не к каждому кадру.
+    Результат совпадает с MFCCExtractor.extract для того же окна
+    """
+
+    def __init__(self, extractor: MFCCExtractor, window: int, hop: int):
+        self.extractor = extractor
+        self.frame_hop = extractor.hop_length
+        self.n_fft = extractor.n_fft
+        self.pad = self.n_fft // 2
+        if window < self.n_fft:
+            raise ValueError(f"Window must be at least {self.n_fft} samples")
+        if hop <= 0 or hop % self.frame_hop:
+            raise ValueError(f"Hop must be a multiple of {self.frame_hop} samples")
+        self.window = window
+        self.hop = hop
+
+        self.n_frames = 1 + window // self.frame_hop
+        # Локальные кадры [first_inner, last_inner] не задевают дополнение
+        self.first_inner = -(-self.pad // self.frame_hop)
+        self.last_inner = (window - self.pad) // self.frame_hop
+        width = extractor.delta_width_for(self.n_frames)
+        self._delta_weights = delta_mean_weights(self.n_frames, width)
+
+        self.buffer = RingBuffer(window + hop)
+        frames_per_hop = hop // self.frame_hop
+        self._mel_capacity = self.n_frames + frames_per_hop
+        self._mel = np.zeros((self._mel_capacity, extractor.n_mels), np.float32)
+        self._mel_ready = 0
+        self._next_start = 0
+
+    def push(self, samples: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+        """
+        Добавить отсчёты и получить (начало окна в отсчётах, признаки)
+        для всех окон, которые стали полными
+        """
+        results = []
+        samples = np.asarray(samples, dtype=np.float32)
+        for offset in range(0, len(samples), self.hop):
+            self.buffer.write(samples[offset : offset + self.hop])
+            while self._next_start + self.window <= self.buffer.total:
+                results.append((self._next_start, self._window_features()))
+                self._next_start += self.hop
+        return results
+
+    def _update_inner_frames(self, last_frame: int) -> None:
+        """
+        Лог-мел для кадров потока до last_frame включительно
+        """
+        first_frame = max(
+            self._mel_ready, self._next_start // self.frame_hop + self.first_inner
+        )
+        if first_frame > last_frame:
+            return
+        start = first_frame * self.frame_hop - self.pad
+        stop = last_frame * self.frame_hop + self.pad
+        frames = sliding_window_view(self.buffer.read(start, stop), self.n_fft)
+        log_mel = self.extractor.log_mel_frames(frames[:: self.frame_hop], self.n_fft)
+        indices = np.arange(first_frame, last_frame + 1) % self._mel_capacity
+        self._mel[indices] = log_mel
+        self._mel_ready = last_frame + 1
+
+    def _window_features(self) -> np.ndarray:
+        start = self._next_start
+        first_frame = start // self.frame_hop
+        self._update_inner_frames(first_frame + self.last_inner)
+
+        log_mel = np.empty((self.n_frames, self.extractor.n_mels), np.float32)
+        inner = np.arange(self.first_inner, self.last_inner + 1)
+        log_mel[inner] = self._mel[(first_frame + inner) % self._mel_capacity]
+
+        # Краевые кадры окна считаются по сигналу с нулевым дополнением
+        padded = np.zeros(self.window + 2 * self.pad, dtype=np.float32)
+        padded[self.pad : self.pad + self.window] = self.buffer.read(
+            start, start + self.window
+        )
+        frames = sliding_window_view(padded, self.n_fft)[:: self.frame_hop]
+        edges = np.r_[0 : self.first_inner, self.last_inner + 1 : self.n_frames]
+        log_mel[edges] = self.extractor.log_mel_frames(frames[edges], self.n_fft)
+
+        clipped = self.extractor.clip_top_db(log_mel)
+        means = np.stack([clipped.mean(axis=0), self._delta_weights @ clipped])
+        return self.extractor.dct(means).reshape(-1)
+
+
+class StreamSession:
+    """
+    Состояние одного потока: PCM 16 бит mono с частотой sample_rate
+    передискретизируется потоково (soxr) и подаётся в скользящее окно
+    """
+
+    def __init__(
+        self,
+        extractor: MFCCExtractor,
+        sample_rate: int,
+        window_seconds: float,
+        hop_seconds: float,
+    ):
+        if not 0 < window_seconds <= config.STREAM_MAX_WINDOW_SECONDS:
+            raise ValueError(
+                f"Window must be within (0, {config.STREAM_MAX_WINDOW_SECONDS}] s"
+            )
+        if sample_rate <= 0:
+            raise ValueError("Sample rate must be positive")
+
+        self.sample_rate = extractor.sample_rate
+        # Шаг округляется до шага кадров, чтобы кадры окон совпадали
+        frame_hop = extractor.hop_length
+        hop = max(round(hop_seconds * self.sample_rate / frame_hop), 1) * frame_hop
+        window = max(round(window_seconds * self.sample_rate), extractor.n_fft)
+        self.features = SlidingWindowMFCC(extractor, window, hop)
+        self._leftover = b""
+        self._resampler = None
+        if sample_rate != self.sample_rate:
+            self._resampler = soxr.ResampleStream(
+                sample_rate, self.sample_rate, 1, dtype="float32"
+            )
+
+    @property
+    def window_seconds(self) -> float:
+        return self.features.window / self.sample_rate
+
+    @property
+    def hop_seconds(self) -> float:
+        return self.features.hop / self.sample_rate
+
+    def push(self, chunk: bytes) -> List[Tuple[float, np.ndarray]]:
+        """
+        Принять кусок PCM и вернуть (начало окна в секундах, признаки)
+        для окон, завершённых этим куском. Куски могут резать отсчёт
+        пополам: лишний байт дописывается в начало следующего куска
+        """
+        chunk = self._leftover + chunk
+        whole = len(chunk) - len(chunk) % 2
+        self._leftover = chunk[whole:]
+        samples = np.frombuffer(chunk[:whole], dtype="<i2").astype(np.float32) / 32768.0
+        if self._resampler is not None:
+            samples = self._resampler.resample_chunk(samples)
+        return [
+            (start / self.sample_rate, features)
+            for start, features in self.features.push(samples)
+        ]
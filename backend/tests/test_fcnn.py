@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_fcnn import make_features
+from fcnn_numpy import softmax
+from fcnn_runtime import RUNTIMES, load_checkpoint, load_runtime
+
+# Допуск по вероятностям и минимальная доля совпавших меток относительно
+# eager: свёрнутые графы совпадают до округления, int8 и bf16 - приближённо
+TOLERANCES = {
+    "torchscript": (1e-5, 1.0),
+    "numpy": (1e-5, 1.0),
+    "int8": (2e-2, 0.99),
+    "bf16": (2e-2, 0.99),
+}
+
+
+@pytest.fixture(scope="module")
+def model():
+    return load_checkpoint("models/fcnn_model.pth")
+
+
+@pytest.fixture(scope="module")
+def features():
+    return make_features(np.random.default_rng(0), 1024)
+
+
+def test_tolerances_cover_runtimes():
+    assert set(TOLERANCES) == set(RUNTIMES) - {"eager"}
+
+
+@pytest.mark.parametrize("runtime", list(TOLERANCES))
+def test_runtime_matches_checkpoint(model, features, runtime):
+    atol, min_agreement = TOLERANCES[runtime]
+    expected = softmax(load_runtime("eager", model)(features))
+
+    actual = softmax(load_runtime(runtime, model)(features))
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=atol)
+    agreement = np.mean(actual.argmax(axis=1) == expected.argmax(axis=1))
+    assert agreement >= min_agreement
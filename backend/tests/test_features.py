@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_features import (
+    SAMPLE_RATE,
+    accumulate,
+    make_signal,
+    reference_features,
+)
+from features import MFCCExtractor
+
+ATOL = 1e-3
+LENGTHS = [1000, 2048, 5000, SAMPLE_RATE, 5 * SAMPLE_RATE, 10 * SAMPLE_RATE]
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return MFCCExtractor(sample_rate=SAMPLE_RATE)
+
+
+@pytest.fixture(scope="module")
+def signals():
+    rng = np.random.default_rng(0)
+    return [make_signal(rng, n) for n in LENGTHS]
+
+
+def test_extract_matches_librosa(extractor, signals):
+    expected = np.stack([reference_features(y) for y in signals])
+
+    actual = np.stack([extractor.extract(y) for y in signals])
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=ATOL)
+
+
+def test_extract_batch_matches_librosa(extractor, signals):
+    expected = np.stack([reference_features(y) for y in signals])
+
+    actual = extractor.extract_batch(signals)
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=ATOL)
+
+
+@pytest.mark.parametrize(
+    "n_samples", [1000, 5000, SAMPLE_RATE, 5 * SAMPLE_RATE + 17, 10 * SAMPLE_RATE]
+)
+@pytest.mark.parametrize("chunk", [160, 4096, 12345])
+def test_accumulator_matches_extract(extractor, n_samples, chunk):
+    signal = make_signal(np.random.default_rng(n_samples), n_samples)
+    expected = extractor.extract(signal)
+
+    actual = accumulate(extractor, signal, chunk)
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=ATOL)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from forest import FlatForest, check_agreement, sample_features
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((600, 26)).astype(np.float32)
+    y = np.array(["angry", "neutral", "positive", "sad"])[
+        (X[:, 0] > 0).astype(int) * 2 + (X[:, 1] + 0.5 * X[:, 2] > 0)
+    ]
+    model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0)
+    return model.fit(X, y)
+
+
+def test_flat_forest_matches_sklearn(forest, tmp_path):
+    FlatForest.from_sklearn(forest).save(str(tmp_path))
+    flat = FlatForest.load(str(tmp_path))
+    X = sample_features(flat, forest.n_features_in_, 5000)
+
+    report = check_agreement(forest, flat, X)
+
+    assert report["labels_equal"]
+    assert report["probabilities_equal"], report["max_abs_diff"]
+
+
+def test_flat_forest_without_mmap(forest, tmp_path):
+    FlatForest.from_sklearn(forest).save(str(tmp_path))
+    flat = FlatForest.load(str(tmp_path), mmap=False)
+    X = sample_features(flat, forest.n_features_in_, 100)
+
+    np.testing.assert_array_equal(flat.predict(X), forest.predict(X))
@@ -1,24 +1,114 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import config
+from cache import MemoryCache
+from metrics import timed
+from registry import model_registry
 
 # Вместо "cointegrated/rubert-tiny-sentiment-balanced" указываем локальный путь
 local_path = "models/rubert-tiny-sentiment-balanced"
 
-tokenizer = AutoTokenizer.from_pretrained(local_path)
-model = AutoModelForSequenceClassification.from_pretrained(local_path)
 
-if torch.cuda.is_available():
-    model.cuda()
+class SentimentModel:
+    """
+    Токенизатор и классификатор тональности. torch и transformers
+    импортируются при загрузке модели, а не при импорте модуля
+    """
+
+    def __init__(self, model_dir: str = local_path):
+        import torch
+        from transformers import (
+            AutoConfig,
+            AutoModelForSequenceClassification,
+            AutoTokenizer,
+        )
+
+        from sentiment_runtime import load_runtime
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.config = AutoConfig.from_pretrained(model_dir)
+
+        if config.SENTIMENT_NUM_THREADS > 0:
+            torch.set_num_threads(config.SENTIMENT_NUM_THREADS)
+
+        # fp32, int8 (динамическая квантизация), torchscript или onnx,
+        # см. sentiment_runtime.py для конвертации и проверки расхождения.
+        # Для экспортированных графов исходные веса не загружаются
+        model = None
+        self.device = torch.device("cpu")
+        if config.SENTIMENT_RUNTIME in ("fp32", "int8"):
+            model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+            model.eval()
+            if torch.cuda.is_available() and config.SENTIMENT_RUNTIME == "fp32":
+                model.cuda()
+                self.device = model.device
+        self.run_logits = load_runtime(config.SENTIMENT_RUNTIME, model, model_dir)
+
+
+model_registry.register("sentiment", SentimentModel)
+
+# Транскрипции часто повторяются ("неизвестная речь"), поэтому
+# результаты запоминаются в пределах процесса
+_memo = MemoryCache(config.SENTIMENT_MEMO_SIZE, ttl=float("inf"))
 
 
 def get_sentiment(text):
-    with torch.no_grad():
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True).to(
-            model.device
-        )
+    return get_sentiment_batch([text])[0]
+
+
+@timed("sentiment")
+def get_sentiment_batch(texts: List[str]) -> List[Tuple[str, np.ndarray]]:
+    """
+    Тональность для списка текстов: метка и вероятности классов.
+    Тексты сортируются по длине и обрабатываются пачками с паддингом
+    """
+    results = {}
+    pending = []
+    for text in texts:
+        if text in results:
+            continue
+        cached = _memo.get(text)
+        if cached is not None:
+            results[text] = cached
+        else:
+            results[text] = None
+            pending.append(text)
+
+    if pending:
+        sentiment_model = model_registry.get("sentiment")
+        # Сортировка по длине уменьшает паддинг внутри пачки
+        order = sorted(range(len(pending)), key=lambda i: len(pending[i]))
+        for start in range(0, len(order), config.SENTIMENT_BATCH_SIZE):
+            indices = order[start : start + config.SENTIMENT_BATCH_SIZE]
+            batch = sentiment_model.tokenizer(
+                [pending[i] for i in indices],
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+            ).to(sentiment_model.device)
+
+            probas = 1.0 / (1.0 + np.exp(-sentiment_model.run_logits(batch)))
+
+            for i, proba in zip(indices, probas):
+                label = sentiment_model.config.id2label[proba.argmax()]
+                sentiment = (label, proba)
+                results[pending[i]] = sentiment
+                _memo.set(pending[i], sentiment)
+
+    return [results[text] for text in texts]
 
-        logits = model(**inputs).logits
-        proba = torch.sigmoid(logits).cpu().numpy()[0]
-        label = model.config.id2label[proba.argmax()]
 
-    return label, proba
+def predict_sentiment_batch(
+    request_ids: List[str], texts: List[str]
+) -> List[Tuple[str, Dict[str, float]]]:
+    """
+    Точка входа для пула процессов и микробатчера: метка и вероятности
+    по именам классов
+    """
+    id2label = model_registry.get("sentiment").config.id2label
+    return [
+        (label, {id2label[i]: float(p) for i, p in enumerate(probs)})
+        for label, probs in get_sentiment_batch(texts)
+    ]
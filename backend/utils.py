@@ -1,83 +1,290 @@
+import asyncio
+import hashlib
 import os
-from typing import Optional, Tuple
+import tarfile
+import tempfile
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 import uuid
+import numpy as np
 from fastapi import HTTPException, UploadFile
-import aiofiles
+import config
 from audio_processing import audio_processor
+from cache import audio_hash, transcript_cache
+from executors import worker_pool
+from formats import HEAD_BYTES, header_duration, sniff_format
 from logger import get_logger
-from pydub import AudioSegment
-
+from metrics import stage
 
 logger = get_logger(__name__)
 
 MAX_DURATION_SECONDS = 10
+UPLOAD_CHUNK_BYTES = 64 * 1024
 
 
-async def process_audio_input(
-    file: Optional[UploadFile],
-    request_id: str,
-) -> Tuple[str, str]:
+def check_duration(request_id: str, duration_sec: float) -> None:
+    if duration_sec > MAX_DURATION_SECONDS:
+        logger.warning(
+            f"{request_id}: Audio duration {duration_sec:.2f}s exceeds limit"
+        )
+        raise HTTPException(status_code=400, detail="Audio file exceeds 10 seconds")
+
+
+class Upload:
+    """
+    Загруженный файл во временном каталоге: путь, хэш содержимого
+    (ключ одинаковых загрузок), формат по сигнатуре и размер
+    """
+
+    def __init__(self, path: str, key: str, audio_format: str, size: int):
+        self.path = path
+        self.key = key
+        self.audio_format = audio_format
+        self.size = size
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def receive_upload(file: Optional[UploadFile], request_id: str) -> Upload:
+    """
+    Приём загруженного файла частями во временный файл. Формат и
+    длительность из заголовка проверяются по первым байтам, поэтому
+    неподходящий файл отклоняется до чтения остального содержимого.
+    В памяти одновременно находится одна часть файла
+    """
     if not file:
         raise HTTPException(status_code=400, detail="File is required")
 
     if not (file.content_type and file.content_type.startswith("audio/")):
         raise HTTPException(status_code=400, detail="Uploaded file is not an audio")
 
-    raw_dir = os.path.join(os.path.dirname(__file__), "files", "raw")
-    wav_dir = os.path.join(os.path.dirname(__file__), "files", "wav")
-    os.makedirs(raw_dir, exist_ok=True)
-    os.makedirs(wav_dir, exist_ok=True)
-
-    ext = os.path.splitext(file.filename)[-1].lower() or ".tmp"
-    raw_path = os.path.join(raw_dir, f"{request_id}{ext}")
+    if file.size is not None and file.size > config.UPLOAD_MAX_BYTES:
+        _reject_size(request_id, file.size, config.UPLOAD_MAX_BYTES)
 
     try:
-        content = await file.read()
-        async with aiofiles.open(raw_path, "wb") as f:
-            await f.write(content)
-        await file.close()
+        with stage("upload"):
+            return await worker_pool.run_io(_spool_upload, request_id, file.file)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"{request_id}: Error saving uploaded file: {e}")
-        raise HTTPException(status_code=500, detail="Failed to save uploaded file")
+        logger.error(f"{request_id}: Error reading uploaded file: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read uploaded file")
+    finally:
+        await file.close()
 
-    wav_path = os.path.join(wav_dir, f"{request_id}.wav")
-    try:
-        if ext != ".wav":
-            audio_seg = AudioSegment.from_file(raw_path)
-            audio_seg.export(wav_path, format="wav")
-            logger.info(f"{request_id}: Converted {raw_path} to {wav_path}")
-        else:
-            os.replace(raw_path, wav_path)
-            logger.info(f"{request_id}: Saved WAV to {wav_path}")
-    except Exception as e:
-        logger.error(f"{request_id}: Error converting to WAV: {e}")
-        raise HTTPException(status_code=400, detail="Failed to convert audio to WAV")
 
+def _spool_upload(request_id: str, fileobj: BinaryIO) -> Upload:
+    head = fileobj.read(HEAD_BYTES)
+    audio_format = sniff_format(head)
+    if audio_format is None:
+        logger.warning(f"{request_id}: Uploaded content is not a known audio format")
+        raise HTTPException(status_code=415, detail="Unsupported audio format")
+    duration_sec = header_duration(audio_format, head)
+    if duration_sec is not None:
+        check_duration(request_id, duration_sec)
+
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.NamedTemporaryFile(
+        dir=config.UPLOAD_TMP_DIR,
+        prefix="upload-",
+        suffix=f".{audio_format}",
+        delete=False,
+    )
     try:
-        audio_seg = AudioSegment.from_wav(wav_path)
-        duration_sec = audio_seg.duration_seconds
-        if duration_sec > MAX_DURATION_SECONDS:
-            logger.warning(
-                f"{request_id}: Audio duration {duration_sec:.2f}s exceeds limit"
-            )
-            raise HTTPException(status_code=400, detail="Audio file exceeds 10 seconds")
-    except HTTPException:
+        with spool:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > config.UPLOAD_MAX_BYTES:
+                    _reject_size(request_id, size, config.UPLOAD_MAX_BYTES)
+                digest.update(chunk)
+                spool.write(chunk)
+                chunk = fileobj.read(UPLOAD_CHUNK_BYTES)
+    except BaseException:
+        os.remove(spool.name)
         raise
+    return Upload(spool.name, digest.hexdigest(), audio_format, size)
+
+
+def _reject_size(request_id: str, size: int, limit: int) -> None:
+    logger.warning(f"{request_id}: Upload of {size} bytes exceeds limit")
+    raise HTTPException(status_code=413, detail=f"Uploaded file exceeds {limit} bytes")
+
+
+async def process_audio_input(
+    source: Union[bytes, str], request_id: str
+) -> Tuple[np.ndarray, str]:
+    """
+    Декодирование загруженного файла (содержимое или путь). Возвращает
+    сигнал и хэш аудио для ключей кэша. Транскрипция выполняется
+    отдельно и только когда нужен текст
+    """
+    audio_data = await decode_content(request_id, source)
+    return audio_data, audio_hash(audio_data)
+
+
+async def decode_content(request_id: str, source: Union[bytes, str]) -> np.ndarray:
+    # Для форматов с заголовком отклоняем длинные файлы до декодирования.
+    # Путь к файлу передаётся в пул процессов вместо содержимого
+    duration_sec = audio_processor.probe_duration(request_id, source)
+    if duration_sec is not None:
+        check_duration(request_id, duration_sec)
+
+    try:
+        audio_data, duration_sec = await worker_pool.run_cpu(
+            audio_processor.decode_audio, request_id, source
+        )
     except Exception as e:
-        logger.error(f"{request_id}: Error checking duration: {e}")
-        raise HTTPException(status_code=500, detail="Failed to check audio duration")
+        logger.error(f"{request_id}: Error decoding audio: {e}")
+        raise HTTPException(status_code=400, detail="Failed to decode audio")
+    check_duration(request_id, duration_sec)
 
     logger.info(
-        f"{request_id}: Audio uploaded, converted, and duration OK ({duration_sec:.2f}s)"
+        f"{request_id}: Audio uploaded, decoded, and duration OK ({duration_sec:.2f}s)"
     )
+    return audio_data
+
 
+async def transcribe(request_id: str, audio_data: np.ndarray, audio_key: str) -> str:
+    text = transcript_cache.get(audio_key)
+    if text is not None:
+        logger.debug(f"{request_id}: Transcript served from cache")
+        return text
     try:
-        text = audio_processor.transcribe_audio(request_id, wav_path)
+        # Движок сам прекращает распознавание к ASR_TIMEOUT_SECONDS,
+        # wait_for - запас на ожидание свободного потока
+        text = await asyncio.wait_for(
+            worker_pool.run_asr(
+                audio_processor.transcribe_audio, request_id, audio_data
+            ),
+            timeout=config.ASR_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"{request_id}: Transcription timed out")
+        raise HTTPException(status_code=504, detail="Transcription timed out")
     except Exception as e:
         logger.error(f"{request_id}: Error during transcription: {e}")
         raise HTTPException(status_code=500, detail="Failed to transcribe audio")
+    transcript_cache.set(audio_key, text)
+    return text
+
+
+def receive_batch(
+    request_id: str, uploads: List[Tuple[str, str, BinaryIO]], directory: str
+) -> List[Tuple[str, str]]:
+    """
+    Файлы пакета на диске: (имя, путь). uploads - (имя, тип содержимого,
+    файл), архивы распаковываются по одному файлу. Число файлов
+    и суммарный размер проверяются по ходу копирования, поэтому
+    лишнее не распаковывается
+    """
+    clips = []
+    used = 0
+    for i, (name, content_type, fileobj) in enumerate(uploads):
+        prefix = os.path.join(directory, f"{i:05d}")
+        if content_type and content_type.startswith("audio/"):
+            members = [(name, fileobj)]
+        else:
+            members = iter_archive(request_id, fileobj)
+        used = extract_members(request_id, members, prefix, clips, used)
+    return clips
+
+
+def extract_members(
+    request_id: str,
+    members: Iterable[Tuple[str, BinaryIO]],
+    prefix: str,
+    clips: List[Tuple[str, str]],
+    used: int = 0,
+) -> int:
+    """
+    Копирование файлов пакета в prefix-00000, prefix-00001... с добавлением
+    (имя, путь) в clips. Превышение BATCH_MAX_CLIPS файлов или
+    BATCH_MAX_BYTES вместе с used - ошибка до копирования лишнего.
+    Возвращает used с учётом скопированного
+    """
+    for j, (member, source) in enumerate(members):
+        check_batch_clips(len(clips) + 1)
+        path = f"{prefix}-{j:05d}"
+        used += copy_limited(request_id, source, path, config.BATCH_MAX_BYTES, used)
+        clips.append((member, path))
+    return used
+
+
+def check_batch_clips(count: int) -> None:
+    if count > config.BATCH_MAX_CLIPS:
+        raise HTTPException(400, detail=f"Batch exceeds {config.BATCH_MAX_CLIPS} files")
+
+
+def copy_limited(
+    request_id: str, source: BinaryIO, path: str, max_bytes: int, used: int = 0
+) -> int:
+    """
+    Копирование в файл частями. Возвращает число байт; если вместе
+    с уже принятыми used их больше max_bytes - ответ 413
+    """
+    size = 0
+    with open(path, "wb") as f:
+        while chunk := source.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if used + size > max_bytes:
+                _reject_size(request_id, used + size, max_bytes)
+            f.write(chunk)
+    return size
+
+
+def iter_archive(request_id: str, fileobj: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Перебор файлов zip или tar архива: имя и поток для чтения
+    содержимого, который действителен до следующего файла
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _is_hidden(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member
+        return
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        logger.warning(f"{request_id}: Uploaded archive is neither zip nor tar")
+        raise HTTPException(status_code=400, detail="Unsupported archive format")
+    with archive:
+        for member in archive:
+            if not member.isfile() or _is_hidden(member.name):
+                continue
+            yield member.name, archive.extractfile(member)
+
+
+def check_job_input(request_id: str, path: str, content_type: Optional[str]) -> None:
+    """
+    Формат файла задачи, уже сохранённого на диск: аудио проверяется
+    по сигнатуре, остальные файлы должны быть zip или tar архивами
+    """
+    if content_type and content_type.startswith("audio/"):
+        with open(path, "rb") as f:
+            if sniff_format(f.read(HEAD_BYTES)) is None:
+                logger.warning(
+                    f"{request_id}: Uploaded content is not a known audio format"
+                )
+                raise HTTPException(status_code=415, detail="Unsupported audio format")
+    elif not (zipfile.is_zipfile(path) or tarfile.is_tarfile(path)):
+        logger.warning(f"{request_id}: Uploaded archive is neither zip nor tar")
+        raise HTTPException(status_code=400, detail="Unsupported archive format")
+
 
-    return wav_path, text
+def _is_hidden(name: str) -> bool:
+    return any(part.startswith((".", "__MACOSX")) for part in name.split("/"))
 
 
 def generate_request_id() -> str: